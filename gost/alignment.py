@@ -0,0 +1,169 @@
+"""
+Alignment of test and reference measurements whose pixel grids differ,
+using the transform and shape of each measurement (as defined by the
+grids of the ODC documents).
+Grids that are co-registered (same pixel size, offset by a whole number
+of pixels) are compared over their intersection only. Otherwise, the
+test measurement is resampled onto the reference grid as it's read.
+"""
+
+from enum import Enum
+from typing import Optional
+from affine import Affine  # type: ignore
+from rasterio.crs import CRS  # type: ignore
+from rasterio.warp import transform_bounds  # type: ignore
+from rasterio.windows import Window, bounds, intersect, intersection  # type: ignore
+import structlog  # type: ignore
+
+from gost.data_model import Grid, Measurement
+from gost.utils import bounds_window
+
+# tolerance (in pixels) for considering grids co-registered
+PIXEL_TOLERANCE: float = 1e-6
+
+_LOG = structlog.get_logger()
+
+
+class Alignment(Enum):
+    """
+    Defines how a test measurement is aligned to its reference.
+    """
+
+    IDENTICAL = "identical"
+    OFFSET = "offset"
+    RESAMPLED = "resampled"
+    DISJOINT = "disjoint"
+    UNSUPPORTED = "unsupported"
+
+
+def _same_crs(crs: str, crs2: str) -> bool:
+    """Are the CRS's equal; an undefined CRS is assumed to be the same."""
+
+    if not crs or not crs2:
+        return True
+
+    return CRS.from_user_input(crs) == CRS.from_user_input(crs2)
+
+
+def _region(measurement: Measurement) -> Window:
+    """The region of a measurement being read, in its own pixel grid."""
+
+    if measurement.subset is not None:
+        return measurement.subset
+
+    height, width = measurement.shape
+
+    return Window(0, 0, width, height)
+
+
+def _pixel_offset(transform: Affine, transform2: Affine) -> Optional[Window]:
+    """
+    The (col, row) offset of the second grid's origin within the first,
+    if the grids are co-registered, i.e. the same pixel size and
+    rotation, and offset by a whole number of pixels.
+    """
+
+    if transform[:2] + transform[3:5] != transform2[:2] + transform2[3:5]:
+        return None
+
+    col, row = ~transform * (transform2.c, transform2.f)
+    if abs(col - round(col)) > PIXEL_TOLERANCE or abs(row - round(row)) > PIXEL_TOLERANCE:
+        return None
+
+    return Window(round(col), round(row), 0, 0)
+
+
+def _shift(window: Window, col_off: int, row_off: int) -> Window:
+    """Translate a window."""
+
+    return Window(
+        window.col_off + col_off, window.row_off + row_off, window.width, window.height
+    )
+
+
+def _disjoint(reference: Measurement, test: Measurement) -> Alignment:
+    """Flag a pair without any overlap, such that it's skipped."""
+
+    reference.subset = Window(0, 0, 0, 0)
+    test.subset = Window(0, 0, 0, 0)
+
+    return Alignment.DISJOINT
+
+
+def align(
+    reference: Measurement,
+    test: Measurement,
+    reference_crs: str = "",
+    test_crs: str = "",
+) -> Alignment:
+    """
+    Align a test measurement to its reference measurement, prior to the
+    measurements being opened.
+    Co-registered grids have the subset of each measurement set to their
+    intersection. Other grids have the test measurement resampled onto
+    the reference grid (the reference subset is restricted to the
+    footprint of the test measurement), which GDAL undertakes block-wise
+    as the pixels are read. Pairs without any overlap have an empty
+    subset, and aren't evaluated.
+    """
+
+    same_crs = _same_crs(reference_crs, test_crs)
+
+    if same_crs and (reference.transform, reference.shape) == (
+        test.transform,
+        test.shape,
+    ):
+        return Alignment.IDENTICAL
+
+    offset = _pixel_offset(reference.transform, test.transform) if same_crs else None
+
+    if offset is not None:
+        # the test region translated into the reference grid
+        region = _shift(_region(test), offset.col_off, offset.row_off)
+        reference_region = _region(reference)
+
+        if not intersect(region, reference_region):
+            return _disjoint(reference, test)
+
+        overlap = intersection(region, reference_region)
+        reference.subset = overlap
+        test.subset = _shift(overlap, -offset.col_off, -offset.row_off)
+
+        _LOG.info(
+            "comparing the intersection of co-registered grids",
+            measurement_reference=str(reference.pathname()),
+            reference_window=str(overlap),
+        )
+
+        return Alignment.OFFSET
+
+    if "HDF5" in (reference.file_format, test.file_format):
+        _LOG.info(
+            "resampling HDF5 measurements is unsupported",
+            measurement_reference=str(reference.pathname()),
+        )
+        return Alignment.UNSUPPORTED
+
+    # footprint of the test measurement in the reference grid
+    footprint = bounds(_region(test), test.transform)
+    if not same_crs:
+        footprint = transform_bounds(test_crs, reference_crs, *footprint, densify_pts=21)
+
+    window = bounds_window(footprint, reference.transform)
+
+    reference_region = _region(reference)
+    if not intersect(window, reference_region):
+        return _disjoint(reference, test)
+
+    overlap = intersection(window, reference_region)
+    reference.subset = overlap
+    test.subset = overlap
+    test.warp = Grid(reference_crs, reference.transform, reference.shape)
+
+    _LOG.info(
+        "resampling the test measurement onto the reference grid",
+        measurement_test=str(test.pathname()),
+        reference_window=str(overlap),
+    )
+
+    return Alignment.RESAMPLED
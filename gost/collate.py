@@ -18,16 +18,23 @@ For example, the minimum difference of the blue channel, will be
 summarised to determine the minimum, mean, and maximum value.
 The basic idea is to get a measure of the spread for each statistical
 result for each measurement.
+
+The residual statistics of each general measurement, merged across all
+granules by the comparison, are also summarised as the statistics of the
+residuals of the entire spatial area; e.g. the global percentiles.
 """
 
 from pathlib import Path
 from typing import Any, Dict, Tuple
+import h5py  # type: ignore
 import pandas  # type: ignore
 import geopandas  # type: ignore
 import structlog  # type: ignore
 import zstandard  # type: ignore
 
+from gost.compare_measurements import REFLECTANCE_SCALED_FIELDS, is_reflectance
 from gost.constants import SUMMARISE_FUNCS, FRAMING
+from gost.stats import read_accumulator
 
 _LOG = structlog.get_logger()
 
@@ -113,6 +120,29 @@ def summarise(
     return result
 
 
+def summarise_accumulators(group: h5py.Group) -> pandas.DataFrame:
+    """
+    The statistics of the residuals of each general measurement over the
+    entire spatial area, from the residual accumulators merged across all
+    granules (see gost.stats.write_accumulator). The percentiles of integer
+    residuals are exact, and those of floating point residuals are within
+    the relative accuracy of the sketches.
+    """
+
+    records = []
+    for name in group:
+        accumulator = read_accumulator(group, name)
+        results = accumulator.summary()
+
+        if is_reflectance(name):
+            for key in REFLECTANCE_SCALED_FIELDS:
+                results[key] = results[key] / 100
+
+        records.append({"measurement": name, "count": accumulator.count, **results})
+
+    return pandas.DataFrame(records).set_index("measurement")
+
+
 def global_min_max(dataframe: pandas.DataFrame) -> pandas.DataFrame:
     """Return min/max global summary."""
     columns = [i for i in dataframe.index.get_level_values(0) if "nbar" in i]
@@ -1,17 +1,29 @@
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 import numpy  # type: ignore
 import pandas  # type: ignore
 import structlog  # type: ignore
-from scipy import stats  # type: ignore
-from typing import Any, Dict, List, Tuple
+from rasterio.windows import Window  # type: ignore
+from typing import Any, Dict, List, Optional, Tuple
 
-from wagl.scripts.wagl_residuals import distribution  # type: ignore
 
 from gost.utils import ContiguityThemes, FmaskThemes
 from gost.utils import TerrainShadowThemes, GeneralRecords
 from gost.utils import FmaskRecords, TerrainShadowRecords, ContiguityRecords
-from gost.utils import evaluate, evaluate_nulls, evaluate_themes
-from gost.odc_documents import load_odc_metadata
+from gost.utils import evaluate, evaluate_blocks, evaluate_nulls, evaluate_themes
+from gost.utils import evaluate_stack
+from gost.utils import lonlat_window, theme_results
+from gost.alignment import align
+from gost.confusion import ConfusionMatrix
+from gost.data_model import Measurement
+from gost.digests import DigestCache
+from gost.masks import SharedMasks
+from gost.prefetch import PrefetchedGranule, iterate_granules
+from gost.residual_export import ResidualExport, ResidualWriter
+from gost.spatial import SpatialStatistics
+from gost.stats import SKETCH_RELATIVE_ACCURACY, ResidualAccumulator
+from gost.stats import residual_dtype, residual_kernel
+from gost.tiles import TileCache, evaluate_tiles
 
 
 BAND_IDS: List[str] = ["1", "2", "3", "4", "5", "6", "7"]
@@ -26,192 +38,660 @@ SHADOW_MEASUREMENT_NAMES: List[str] = [
     "terrain_shadow",
 ]
 FMASK_MEASUREMENT_NAMES: List[str] = ["oa_fmask", "fmask"]
+REFLECTANCE_SCALED_FIELDS: List[str] = [
+    "min_residual",
+    "max_residual",
+    "max_absolute",
+    "percentile_90",
+    "percentile_99",
+    "mean_residual",
+    "standard_deviation",
+    "median_residual",
+    "median_absolute_deviation",
+    "trimmed_mean_residual",
+]
+ROBUST_FIELDS: List[str] = [
+    "median_residual",
+    "median_absolute_deviation",
+    "trimmed_mean_residual",
+]
 _LOG = structlog.get_logger()
 
+# group, size, results, spatial grid summary and residual statistics
+Evaluation = Tuple[
+    str, int, Dict[str, Any], Optional[Dict[str, Any]], Optional[ResidualAccumulator]
+]
 
-def process_yamls(dataframe: pandas.DataFrame) -> Tuple[Dict[str, List[Any]], ...]:
-    """Process dataframe containing records to process."""
 
-    # initialise placeholders for the results
-    general_records = GeneralRecords()
-    fmask_records = FmaskRecords()
-    contiguity_records = ContiguityRecords()
-    shadow_records = TerrainShadowRecords()
+def residual_statistics(diff: numpy.ndarray) -> Dict[str, float]:
+    """
+    Statistics of the residuals as named by the general measurement
+    records; evaluated by a single (fused) pass over chunks of the
+    residuals (see gost.stats.residual_kernel).
+    """
+
+    return residual_kernel(diff).summary()
+
+
+def is_reflectance(measurement_name: str) -> bool:
+    """Is the measurement a (scaled integer) surface reflectance band."""
+
+    return "nbar" in measurement_name or measurement_name in BAND_IDS
+
+
+def general_results(
+    measurement_name: str, results: Dict[str, Any], null_info: Tuple[float, float]
+) -> Dict[str, Any]:
+    """
+    The records of a general measurement from its residual statistics
+    and null transitions; the reflectance residuals are scaled to percent
+    reflectance.
+    """
+
+    if is_reflectance(measurement_name):
+        # get difference as a percent reflectance (0->100)
+        for key in REFLECTANCE_SCALED_FIELDS:
+            results[key] = results[key] / 100
+
+    results["percent_data_2_null"] = null_info[0]
+    results["percent_null_2_data"] = null_info[1]
+
+    return results
+
+
+def identical_results(
+    reference_measurement: Measurement,
+    themes: Any = None,
+    digests: Optional[DigestCache] = None,
+) -> Dict[str, Any]:
+    """
+    The results of a test measurement that is byte-identical to the
+    reference measurement; i.e. zero residuals and no null transitions
+    for the general measurements, and the identity mapping for the
+    thematic measurements.
+    The thematic identity requires the classes present in the reference,
+    which are taken from the digest record if available, otherwise only
+    the reference pixels are decoded.
+    """
+
+    if themes is None:
+        results = {key: 0.0 for key in REFLECTANCE_SCALED_FIELDS}
+        results["percent_different"] = 0.0
+        results["skewness"] = numpy.nan
+        results["kurtosis"] = numpy.nan
+        results["percent_data_2_null"] = 0.0
+        results["percent_null_2_data"] = 0.0
+
+        # the robust statistics are only defined for integer residuals
+        reference_measurement.open()
+        if reference_measurement.dtype().kind not in "iu":
+            for key in ROBUST_FIELDS:
+                results[key] = numpy.nan
+
+        return results
+
+    values = [theme.value for theme in themes]
+    minv, maxv = min(values), max(values)
+
+    # class counts are only cached for single dataset files at full resolution
+    full_read = (
+        reference_measurement.subset is None and reference_measurement.decimation == 1
+    )
+    if digests is not None and reference_measurement.dataset_pathname is None:
+        record = digests.record(reference_measurement.pathname()) if full_read else None
+    else:
+        record = None
+
+    if record is not None and record.class_counts is not None:
+        counts = numpy.array(record.class_counts)
+    else:
+        reference_measurement.open()
+        data = reference_measurement.read().ravel()
+        data = data[(data >= minv) & (data <= maxv)].astype("int64")
+        counts = numpy.bincount(data - minv, minlength=maxv - minv + 1)
+        reference_measurement.close()
+
+        if record is not None:
+            record.class_counts = counts.tolist()
+
+    matrix = ConfusionMatrix.identity(values, counts[numpy.subtract(values, minv)])
+
+    return theme_results(matrix, themes, agreement=True)
+
+
+def _residual_writer(
+    measurement_name: str,
+    test_measurement: Measurement,
+    reference_measurement: Measurement,
+    export: Optional[ResidualExport],
+    granule_id: str,
+) -> Optional[ResidualWriter]:
+    """
+    The writer of the residual image of an (opened) general measurement,
+    if the export selects it; quick-look evaluations aren't exported.
+    """
+
+    if export is None:
+        return None
+
+    pathname = export.pathname(granule_id, measurement_name)
+    if pathname is None:
+        return None
+
+    if reference_measurement.decimation > 1:
+        _LOG.info("residuals not exported for quick-look", measurement=measurement_name)
+        return None
+
+    dtype = residual_dtype(reference_measurement.dtype(), test_measurement.dtype())
+
+    return ResidualWriter.create(pathname, reference_measurement, dtype)
 
-    for i, row in dataframe.iterrows():
+
+def _spatial_statistics(
+    measurement_name: str,
+    reference_measurement: Measurement,
+    spatial_grid: Optional[Tuple[int, int]],
+) -> Optional[SpatialStatistics]:
+    """
+    The spatial statistics accumulated for a general measurement, if a
+    grid is given; quick-look evaluations aren't mapped.
+    """
+
+    if spatial_grid is None:
+        return None
+
+    if reference_measurement.decimation > 1:
+        _LOG.info("spatial grid skipped for quick-look", measurement=measurement_name)
+        return None
+
+    return SpatialStatistics(reference_measurement.subset_shape(), spatial_grid)
+
+
+def evaluate_measurement(
+    measurement_name: str,
+    test_measurement: Measurement,
+    reference_measurement: Measurement,
+    streaming: bool = False,
+    digests: Optional[DigestCache] = None,
+    tiles: Optional[TileCache] = None,
+    export: Optional[ResidualExport] = None,
+    granule_id: str = "",
+    spatial_grid: Optional[Tuple[int, int]] = None,
+    relative_accuracy: float = SKETCH_RELATIVE_ACCURACY,
+) -> Optional[Evaluation]:
+    """
+    Evaluate a single test and reference measurement pair.
+    If the digests are given, then byte-identical files aren't decoded.
+    If the tile cache is given, then the general measurements are
+    compared tile by tile, decoding only the tiles that differ (where
+    the tile layouts allow it).
+    If the residual export is given, and selects the measurement (of
+    the granule_id), then its residual image is written by the block
+    evaluation (see gost.residual_export).
+    If the spatial grid of (rows, columns) is given, then the residuals
+    of a general measurement are also summarised for each cell of the
+    grid (see gost.spatial); these aren't compared by tile.
+    The percentiles of floating point residuals are estimated within
+    relative_accuracy of their value (see gost.stats.QuantileSketch).
+
+    :return:
+        None if the pair cannot be compared, otherwise a tuple of the
+        records group name (general, fmask, contiguity, shadow), the
+        size of the image in pixels, the results keyed by the record
+        fields, the summary of the spatial grid cells, and the residual
+        statistics of a general measurement (both None if not evaluated,
+        including byte-identical files).
+    """
+
+    _LOG.info(
+        "processing measurement",
+        measurement=measurement_name,
+    )
+
+    # shapes of the (aligned) regions being compared
+    if not (test_measurement.subset_shape() == reference_measurement.subset_shape()):
         _LOG.info(
-            "processing document",
-            yaml_doc_test=row.yaml_pathname_test,
-            yaml_doc_reference=row.yaml_pathname_reference,
+            "shape mismatch",
+            test_shape=str(test_measurement.subset_shape()),
+            reference_shape=str(reference_measurement.subset_shape()),
         )
+        return None
 
-        doc_test = load_odc_metadata(Path(row.yaml_pathname_test))
-        doc_reference = load_odc_metadata(Path(row.yaml_pathname_reference))
+    if not reference_measurement.exists():
+        _LOG.info(
+            "missing reference measurement",
+            measurement_reference=str(reference_measurement.pathname()),
+            measurement_test=str(test_measurement.pathname()),
+        )
+        return None
 
-        for measurement_name in doc_test.measurements:
-            _LOG.info(
-                "processing measurement",
-                measurement=measurement_name,
-            )
+    if not test_measurement.exists():
+        _LOG.info(
+            "missing test measurement",
+            measurement_reference=str(reference_measurement.pathname()),
+            measurement_test=str(test_measurement.pathname()),
+        )
+        return None
 
-            test_measurement = doc_test.measurements[measurement_name]
-            reference_measurement = doc_reference.measurements[measurement_name]
+    if 0 in reference_measurement.subset_shape():
+        _LOG.info(
+            "no overlapping pixels to evaluate",
+            measurement_reference=str(reference_measurement.pathname()),
+        )
+        return None
 
-            if not (test_measurement.shape == reference_measurement.shape):
-                _LOG.info(
-                    "shape mismatch",
-                    test_shape=str(test_measurement.shape),
-                    reference_shape=str(reference_measurement.shape),
-                )
-                continue
+    # size of full image (or subset) in pixels (null and valid)
+    size = numpy.prod(test_measurement.subset_shape())
 
-            if not reference_measurement.pathname().exists():
-                _LOG.info(
-                    "missing reference measurement",
-                    measurement_reference=str(reference_measurement.pathname()),
-                    measurement_test=str(test_measurement.pathname()),
-                )
-                continue
+    if measurement_name in FMASK_MEASUREMENT_NAMES:
+        # the idea here is to analyse the thematic data differently
+        group, themes = "fmask", FmaskThemes
+    elif measurement_name in CONTIGUITY_MEASUREMENT_NAMES:
+        group, themes = "contiguity", ContiguityThemes
+    elif measurement_name in SHADOW_MEASUREMENT_NAMES:
+        group, themes = "shadow", TerrainShadowThemes
+    else:
+        group, themes = "general", None
 
-            if not test_measurement.pathname().exists():
-                _LOG.info(
-                    "missing test measurement",
-                    measurement_reference=str(reference_measurement.pathname()),
-                    measurement_test=str(test_measurement.pathname()),
-                )
-                continue
+    if digests is not None and digests.identical(
+        reference_measurement.pathname(), test_measurement.pathname()
+    ):
+        _LOG.info("identical measurement files", measurement=measurement_name)
+        results = identical_results(reference_measurement, themes, digests)
 
-            # open the handler for the datasets
-            test_measurement.open()
-            reference_measurement.open()
+        # release anything decoded ahead of time
+        for measurement in (test_measurement, reference_measurement):
+            if not measurement.closed:
+                measurement.close()
 
-            # size of full image in pixels (null and valid)
-            size = numpy.prod(test_measurement.shape)
+        return group, size, results, None, None
 
-            # compute results
-            if measurement_name in FMASK_MEASUREMENT_NAMES:
-                # the idea here is to analyse the thematic data differently
-                fmask_records.add_base_info(
-                    doc_reference,
-                    reference_measurement.pathname(),
-                    test_measurement.pathname(),
-                    size,
-                    measurement_name,
-                )
+    # open the handler for the datasets
+    test_measurement.open()
+    reference_measurement.open()
 
-                # thematic evaluation
-                fmask_results = evaluate_themes(
-                    reference_measurement, test_measurement, FmaskThemes
-                )
-                for key in fmask_results:
-                    value = fmask_results[key]
-                    getattr(fmask_records, key).append(value)
-            elif measurement_name in CONTIGUITY_MEASUREMENT_NAMES:
-                # base records
-                contiguity_records.add_base_info(
-                    doc_reference,
-                    reference_measurement.pathname(),
-                    test_measurement.pathname(),
-                    size,
-                    measurement_name,
-                )
+    # compute results
+    cells = None
+    residuals = None
+    if themes is not None:
+        results = evaluate_themes(
+            reference_measurement,
+            test_measurement,
+            themes,
+            agreement=True,
+            streaming=streaming,
+        )
+    else:
 
-                # thematic evaluation
-                contiguity_results = evaluate_themes(
-                    reference_measurement, test_measurement, ContiguityThemes
-                )
-                for key in contiguity_results:
-                    value = contiguity_results[key]
-                    getattr(contiguity_records, key).append(value)
-            elif measurement_name in SHADOW_MEASUREMENT_NAMES:
-                # base records
-                shadow_records.add_base_info(
-                    doc_reference,
-                    reference_measurement.pathname(),
-                    test_measurement.pathname(),
-                    size,
-                    measurement_name,
+        writer = _residual_writer(
+            measurement_name, test_measurement, reference_measurement, export, granule_id
+        )
+
+        spatial = _spatial_statistics(
+            measurement_name, reference_measurement, spatial_grid
+        )
+
+        evaluated = None
+        if tiles is not None and writer is None and spatial is None:
+            evaluated = evaluate_tiles(
+                reference_measurement, test_measurement, tiles, relative_accuracy
+            )
+
+        if evaluated is not None:
+            null_info, residuals = evaluated
+            results = residuals.summary()
+        elif reference_measurement.decimation == 1 and (
+            streaming or test_measurement.warp is not None or writer is not None
+        ):
+            # resampling is undertaken block-wise to bound the memory, other
+            # than for quick-looks, which are read whole at 1/decimation
+            try:
+                null_info, residuals = evaluate_blocks(
+                    reference_measurement,
+                    test_measurement,
+                    writer,
+                    spatial,
+                    relative_accuracy,
                 )
+            except Exception:
+                if writer is not None:
+                    writer.close(retain=False)
+                raise
+
+            results = residuals.summary()
+        else:
+            # null data evaluation
+            null_info = evaluate_nulls(reference_measurement, test_measurement)
+            diff = evaluate(reference_measurement, test_measurement, spatial)
+            residuals = residual_kernel(diff, relative_accuracy=relative_accuracy)
+            results = residuals.summary()
+
+        results = general_results(measurement_name, results, null_info)
+
+        if writer is not None:
+            writer.close(retain=export.retains(results))
+
+        if spatial is not None:
+            # get difference as a percent reflectance (0->100)
+            scale = 0.01 if is_reflectance(measurement_name) else 1.0
+            cells = spatial.summary(scale)
+
+    # close the handler for the datasets; releases the pixel buffers
+    test_measurement.close()
+    reference_measurement.close()
+
+    return group, size, results, cells, residuals
+
+
+def _stack_key(
+    test_measurement: Measurement,
+    reference_measurement: Measurement,
+    digests: Optional[DigestCache],
+) -> Optional[Tuple[Any, ...]]:
+    """
+    The key grouping reflectance measurements that can be evaluated as a
+    stack (see gost.utils.evaluate_stack); None for those that are to be
+    evaluated individually, including those that can't be compared.
+    The measurements that have a key are left opened.
+    """
+
+    pair = (test_measurement, reference_measurement)
+    shape = reference_measurement.subset_shape()
+
+    if any(measurement.warp is not None for measurement in pair):
+        return None
+
+    if test_measurement.subset_shape() != shape or 0 in shape:
+        return None
+
+    if not all(measurement.exists() for measurement in pair):
+        return None
+
+    if digests is not None and digests.identical(
+        reference_measurement.pathname(), test_measurement.pathname()
+    ):
+        return None
+
+    for measurement in pair:
+        measurement.open()
+
+    if any(measurement.has_mask_band() for measurement in pair):
+        return None
+
+    # nodata as text, as NaN doesn't compare equal
+    return (
+        shape,
+        reference_measurement.dtype(),
+        str(reference_measurement.nodata),
+        test_measurement.dtype(),
+        str(test_measurement.nodata),
+    )
+
+
+def evaluate_stacks(
+    names: List[str],
+    test_measurements: List[Measurement],
+    reference_measurements: List[Measurement],
+    digests: Optional[DigestCache] = None,
+    exclude: Optional[List[str]] = None,
+    relative_accuracy: float = SKETCH_RELATIVE_ACCURACY,
+) -> Dict[int, Evaluation]:
+    """
+    Evaluate the reflectance measurements of a granule that share a
+    shape, dtype and nodata value as (bands, y, x) stacks, rather than
+    individually (see gost.utils.evaluate_stack).
+
+    :return:
+        The evaluations (as per evaluate_measurement) keyed by the index of
+        the measurement. Measurements without a stack of their own are
+        omitted, and are to be evaluated by evaluate_measurement, as are
+        those named by exclude.
+    """
+
+    stacks: Dict[Tuple[Any, ...], List[int]] = {}
+    for idx, name in enumerate(names):
+        if not is_reflectance(name) or name in (exclude or []):
+            continue
+
+        key = _stack_key(test_measurements[idx], reference_measurements[idx], digests)
+        if key is not None:
+            stacks.setdefault(key, []).append(idx)
+
+    evaluations = {}
+    for (shape, *_), indices in stacks.items():
+        if len(indices) < 2:
+            continue
+
+        _LOG.info("evaluating stack", measurements=[names[idx] for idx in indices])
+
+        evaluated = evaluate_stack(
+            [reference_measurements[idx] for idx in indices],
+            [test_measurements[idx] for idx in indices],
+            relative_accuracy,
+        )
 
-                # thematic evaluation
-                shadow_results = evaluate_themes(
-                    reference_measurement, test_measurement, TerrainShadowThemes
+        for idx, (null_info, residuals) in zip(indices, evaluated):
+            results = general_results(names[idx], residuals.summary(), null_info)
+            evaluations[idx] = ("general", numpy.prod(shape), results, None, residuals)
+
+    return evaluations
+
+
+def process_yamls(
+    dataframe: pandas.DataFrame,
+    streaming: bool = False,
+    prefetch_depth: int = 0,
+    prefetch_memory: int = 1024 ** 3,
+    threads: int = 1,
+    decimation: int = 1,
+    bbox: Optional[Tuple[float, float, float, float]] = None,
+    digests: Optional[DigestCache] = None,
+    tiles: Optional[TileCache] = None,
+    align_grids: bool = True,
+    stack_bands: bool = False,
+    shared_masks: bool = False,
+    export: Optional[ResidualExport] = None,
+    spatial_grid: Optional[Tuple[int, int]] = None,
+    relative_accuracy: float = SKETCH_RELATIVE_ACCURACY,
+) -> Tuple[Any, ...]:
+    """
+    Process dataframe containing records to process.
+    If streaming is set, then the measurements (general and thematic) are
+    evaluated a block at a time, rather than reading the full measurements
+    into memory.
+    A prefetch_depth > 0 loads that many records ahead of time in a
+    background thread, decoding measurements ahead of time while they
+    fit within prefetch_memory bytes.
+    Using threads > 1 evaluates that many measurements of a granule
+    concurrently; the records retain the same order as a serial
+    evaluation.
+    A decimation > 1 evaluates a quick-look comparison, reading every
+    nth pixel of each measurement (from an overview where available);
+    the results are approximate, and streaming isn't applicable.
+    A bbox of (min_lon, min_lat, max_lon, max_lat) restricts the reads
+    (and the evaluation) to the pixel window of each measurement that
+    covers the bounding box.
+    If digests are given, then measurement files that are byte-identical
+    to the reference aren't decoded, and are recorded as identical. The
+    digests are added to the cache for reuse by later runs.
+    If a tile cache is given, then the general GeoTIFF measurements are
+    compared tile by tile, decoding only the tiles whose compressed bytes
+    differ.
+    If align_grids is set, then test and reference measurements with
+    differing pixel grids are aligned (see gost.alignment.align), rather
+    than being skipped.
+    If stack_bands is set, then the reflectance measurements of a granule
+    sharing a shape, dtype and nodata value are evaluated together as a
+    (bands, y, x) stack (see evaluate_stacks). Stacking isn't applicable
+    when streaming or comparing tiles.
+    If shared_masks is set, then the valid pixel masks are evaluated once
+    for the measurements of a granule sharing a grid and nodata value,
+    and reused (see gost.masks.SharedMasks); i.e. the measurements of a
+    grid are assumed to share the same footprint.
+    If a residual export is given, then the residual images of the general
+    measurements it selects are written while they're evaluated (block
+    by block); these measurements aren't stacked or compared by tile.
+    If a spatial_grid of (rows, columns) is given, then the residuals of
+    the general measurements are also summarised for each cell of the
+    grid (see gost.spatial.SpatialStatistics); the measurements aren't
+    then stacked or compared by tile.
+    The percentiles of floating point residuals are estimated within
+    relative_accuracy of their value (see gost.stats.QuantileSketch).
+
+    :return:
+        The general, fmask, contiguity and shadow records, the spatial
+        grid summaries keyed by (granule_id, measurement name), and the
+        residual statistics of each general measurement merged across
+        the granules (see gost.stats.ResidualAccumulator), keyed by the
+        measurement name.
+    """
+
+    if decimation > 1 and streaming:
+        _LOG.info("streaming disabled for quick-look", decimation=decimation)
+        streaming = False
+
+    if stack_bands and (streaming or tiles is not None or spatial_grid is not None):
+        _LOG.info(
+            "band stacking disabled",
+            streaming=streaming,
+            tile_diff=tiles is not None,
+            spatial_grid=spatial_grid,
+        )
+        stack_bands = False
+
+    def _prepare(granule: PrefetchedGranule) -> None:
+        for doc in (granule.doc_test, granule.doc_reference):
+            masks = SharedMasks() if shared_masks else None
+
+            for measurement in doc.measurements.values():
+                measurement.decimation = decimation
+                measurement.shared_masks = masks
+
+                if bbox is not None:
+                    window = lonlat_window(bbox, doc.crs, measurement)
+                    measurement.subset = Window(0, 0, 0, 0) if window is None else window
+
+        if align_grids:
+            doc_test = granule.doc_test
+            doc_reference = granule.doc_reference
+
+            for name, test_measurement in doc_test.measurements.items():
+                reference_measurement = doc_reference.measurements.get(name)
+                if reference_measurement is not None:
+                    align(
+                        reference_measurement,
+                        test_measurement,
+                        doc_reference.crs,
+                        doc_test.crs,
+                    )
+
+    # initialise placeholders for the results
+    records = {
+        "general": GeneralRecords(),
+        "fmask": FmaskRecords(),
+        "contiguity": ContiguityRecords(),
+        "shadow": TerrainShadowRecords(),
+    }
+    spatial: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    accumulators: Dict[str, ResidualAccumulator] = {}
+
+    executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+
+    try:
+        for granule in iterate_granules(
+            dataframe, prefetch_depth, prefetch_memory, _prepare
+        ):
+            _LOG.info(
+                "processing document",
+                yaml_doc_test=granule.row.yaml_pathname_test,
+                yaml_doc_reference=granule.row.yaml_pathname_reference,
+            )
+
+            doc_test = granule.doc_test
+            doc_reference = granule.doc_reference
+
+            names = list(doc_test.measurements)
+            test_measurements = [doc_test.measurements[name] for name in names]
+            reference_measurements = [doc_reference.measurements[name] for name in names]
+
+            granule_id = doc_reference.granule_id
+            if export is None:
+                exported = []
+            else:
+                exported = [n for n in names if export.pathname(granule_id, n)]
+
+            if stack_bands:
+                evaluations = evaluate_stacks(
+                    names,
+                    test_measurements,
+                    reference_measurements,
+                    digests,
+                    exported,
+                    relative_accuracy,
                 )
-                for key in shadow_results:
-                    value = shadow_results[key]
-                    getattr(shadow_records, key).append(value)
             else:
-                # null data evaluation
-                null_info = evaluate_nulls(reference_measurement, test_measurement)
-                general_records.percent_data_2_null.append(null_info[0])
-                general_records.percent_null_2_data.append(null_info[1])
-
-                diff = evaluate(reference_measurement, test_measurement)
-                abs_diff = numpy.abs(diff)
-                h = distribution(diff)
-                h_abs = distribution(abs_diff)
-
-                # store results
-                general_records.add_base_info(
+                evaluations = {}
+
+            # the measurements not evaluated as a stack
+            indices = [idx for idx in range(len(names)) if idx not in evaluations]
+
+            mapper = map if executor is None else executor.map
+            evaluated = mapper(
+                evaluate_measurement,
+                [names[idx] for idx in indices],
+                [test_measurements[idx] for idx in indices],
+                [reference_measurements[idx] for idx in indices],
+                repeat(streaming),
+                repeat(digests),
+                repeat(tiles),
+                repeat(export),
+                repeat(granule_id),
+                repeat(spatial_grid),
+                repeat(relative_accuracy),
+            )
+            evaluations.update(zip(indices, evaluated))
+
+            # merge the results in measurement order
+            for idx in range(len(names)):
+                evaluation = evaluations[idx]
+                if evaluation is None:
+                    continue
+
+                group, size, results, cells, residuals = evaluation
+                records[group].add_base_info(
                     doc_reference,
-                    reference_measurement.pathname(),
-                    test_measurement.pathname(),
+                    reference_measurements[idx].pathname(),
+                    test_measurements[idx].pathname(),
                     size,
-                    measurement_name,
+                    names[idx],
                 )
 
-                if "nbar" in measurement_name or measurement_name in BAND_IDS:
-                    # get difference as a percent reflectance (0->100)
-                    general_records.min_residual.append(h["omin"] / 100)
-                    general_records.max_residual.append(h["omax"] / 100)
-                    general_records.max_absolute.append(h_abs["omax"] / 100)
-                else:
-                    general_records.min_residual.append(h["omin"])
-                    general_records.max_residual.append(h["omax"])
-                    general_records.max_absolute.append(h_abs["omax"])
-
-                general_records.percent_different.append(
-                    (diff != 0).sum() / diff.size * 100
-                )
+                for key, value in results.items():
+                    getattr(records[group], key).append(value)
+
+                if cells is not None:
+                    spatial[(granule_id, names[idx])] = cells
+
+                if residuals is not None:
+                    if names[idx] not in accumulators:
+                        accumulators[names[idx]] = ResidualAccumulator(
+                            relative_accuracy=relative_accuracy
+                        )
+                    accumulators[names[idx]].merge(residuals)
 
-                # percentiles of the cumulative distribution
-                hist = h_abs["histogram"]
-                cdf = numpy.cumsum(hist / hist.sum())
-                p1_idx = numpy.searchsorted(cdf, 0.9)
-                p2_idx = numpy.searchsorted(cdf, 0.99)
-                pct_90 = h_abs["loc"][p1_idx]
-                pct_99 = h_abs["loc"][p2_idx]
-
-                # moments
-                mean = numpy.mean(diff)
-                stddev = numpy.std(diff, ddof=1)
-                skewness = stats.skew(diff)
-                kurtosis = stats.kurtosis(diff)
-
-                # percentiles from cumulative distribution
-                if "nbar" in measurement_name or measurement_name in BAND_IDS:
-                    # get difference as a percent reflectance (0->100)
-                    general_records.percentile_90.append(pct_90 / 100)
-                    general_records.percentile_99.append(pct_99 / 100)
-                    general_records.mean_residual.append(mean / 100)
-                    general_records.standard_deviation.append(stddev / 100)
-                else:
-                    general_records.percentile_90.append(pct_90)
-                    general_records.percentile_99.append(pct_99)
-                    general_records.mean_residual.append(mean)
-                    general_records.standard_deviation.append(stddev)
-
-                general_records.skewness.append(skewness)
-                general_records.kurtosis.append(kurtosis)
-
-            # close the handler for the datasets
-            test_measurement.close()
-            reference_measurement.close()
+            # release any file handles shared by the measurements, e.g. HDF5
+            doc_test.close_containers()
+            doc_reference.close_containers()
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
     results = (
-        general_records.records(),
-        fmask_records.records(),
-        contiguity_records.records(),
-        shadow_records.records(),
+        records["general"].records(),
+        records["fmask"].records(),
+        records["contiguity"].records(),
+        records["shadow"].records(),
+        spatial,
+        accumulators,
     )
     return results
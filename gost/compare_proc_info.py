@@ -1,13 +1,13 @@
 """
 GQA and ancillary comparison evaluation.
 """
-from pathlib import Path
 from typing import Any, Dict, List, Tuple
 import pandas  # type: ignore
 import structlog  # type: ignore
 
 from gost.data_model import AncillaryInfo, GeometricQuality
 from gost.odc_documents import load_odc_metadata, load_proc_info
+from gost.storage import as_location
 
 _LOG = structlog.get_logger()
 
@@ -21,8 +21,8 @@ def compare_software(dataframe: pandas.DataFrame) -> pandas.DataFrame:
 
     record = dataframe.iloc[0]
 
-    ref_doc = load_proc_info(Path(record.proc_info_pathname_reference))
-    test_doc = load_proc_info(Path(record.proc_info_pathname_test))
+    ref_doc = load_proc_info(as_location(record.proc_info_pathname_reference))
+    test_doc = load_proc_info(as_location(record.proc_info_pathname_test))
 
     data: Dict[str, List] = {"Name": list(), "Reference": list(), "Test": list()}
 
@@ -68,7 +68,7 @@ def process_yamls(
 ) -> Tuple[Dict[str, List[Any]], Dict[str, List[Any]]]:
     """Compare gqa and ancillary fields."""
 
-    doc = load_proc_info(Path(dataframe.iloc[0].proc_info_pathname_test))
+    doc = load_proc_info(as_location(dataframe.iloc[0].proc_info_pathname_test))
 
     gqa_results: Dict[str, Any] = {key: [] for key in doc.geometric_quality.fields}
     ancillary_results: Dict[str, Any] = {key: [] for key in doc.ancillary.flatten()}
@@ -90,9 +90,11 @@ def process_yamls(
             yaml_doc_reference=row.proc_info_pathname_reference,
         )
 
-        doc_reference = load_odc_metadata(Path(row.yaml_pathname_reference))
-        proc_info_test = load_proc_info(Path(row.proc_info_pathname_test))
-        proc_info_reference = load_proc_info(Path(row.proc_info_pathname_reference))
+        doc_reference = load_odc_metadata(as_location(row.yaml_pathname_reference))
+        proc_info_test = load_proc_info(as_location(row.proc_info_pathname_test))
+        proc_info_reference = load_proc_info(
+            as_location(row.proc_info_pathname_reference)
+        )
 
         gqa_results["region_code"].append(doc_reference.region_code)
         gqa_results["granule_id"].append(doc_reference.granule_id)
@@ -0,0 +1,182 @@
+"""
+Confusion matrices for comparing thematic measurements.
+The matrix of reference class by test class is evaluated in a single
+bincount pass over the combined class indices of each pixel, and the
+class transition percentages and agreement metrics are all derived
+from the matrix rather than from further passes over the pixels.
+Values not belonging to any of the classes are counted in an additional
+row and column, rather than being out of range of the matrix.
+"""
+
+from typing import List, Optional
+import attr
+import numpy  # type: ignore
+
+from gost.stats import KERNEL_CHUNK_SIZE
+
+
+def class_index(data: numpy.ndarray, values: List[int]) -> numpy.ndarray:
+    """
+    The index of each pixel's class within values; len(values) for
+    values that don't belong to any class.
+    Integer data of up to 16 bits is mapped by a lookup table on the bit
+    pattern of each value, otherwise by comparing against each class.
+    """
+
+    n_classes = len(values)
+    dtype = "uint8" if (n_classes + 1) ** 2 <= 256 else "uint16"
+
+    if data.dtype.kind in "iu" and data.dtype.itemsize <= 2:
+        unsigned = numpy.dtype(f"u{data.dtype.itemsize}").newbyteorder(
+            data.dtype.byteorder
+        )
+        info = numpy.iinfo(data.dtype)
+        lut = numpy.full(2 ** (data.dtype.itemsize * 8), n_classes, dtype=dtype)
+
+        for idx, value in enumerate(values):
+            if info.min <= value <= info.max:
+                lut[numpy.array(value, dtype=data.dtype).view(unsigned)] = idx
+
+        return lut[data.view(unsigned)]
+
+    index = numpy.full(data.shape, n_classes, dtype=dtype)
+    for idx, value in enumerate(values):
+        index[data == value] = idx
+
+    return index
+
+
+@attr.s(auto_attribs=True)
+class ConfusionMatrix:
+    """
+    Counts of the pixels of each reference class (rows) that are of each
+    test class (columns).
+
+    :values:
+        The value of each class.
+    :counts:
+        The (n_classes + 1, n_classes + 1) matrix of counts, where the last
+        row and column count the values not belonging to any class.
+    """
+
+    values: List[int]
+    counts: Optional[numpy.ndarray] = None
+
+    def __attrs_post_init__(self):
+        if self.counts is None:
+            size = len(self.values) + 1
+            self.counts = numpy.zeros((size, size), dtype="int64")
+
+    @classmethod
+    def identity(
+        cls, values: List[int], class_counts: numpy.ndarray
+    ) -> "ConfusionMatrix":
+        """The matrix of identical measurements, given the count of each class."""
+
+        matrix = cls(values)
+        diagonal = numpy.arange(len(values))
+        matrix.counts[diagonal, diagonal] = class_counts
+
+        return matrix
+
+    def update(self, ref_data: numpy.ndarray, test_data: numpy.ndarray) -> None:
+        """Update the counts with a chunk of reference and test pixels."""
+
+        size = self.counts.shape[0]
+        combined = class_index(ref_data, self.values) * numpy.uint8(size)
+        combined += class_index(test_data, self.values)
+
+        self.counts += numpy.bincount(combined.ravel(), minlength=size * size).reshape(
+            size, size
+        )
+
+    def merge(self, other: "ConfusionMatrix") -> None:
+        """Merge the counts of another matrix of the same classes."""
+
+        if list(self.values) != list(other.values):
+            raise ValueError("confusion matrices have different classes")
+
+        self.counts += other.counts
+
+    @property
+    def classes(self) -> numpy.ndarray:
+        """The counts of the pixels whose values belong to a class in both."""
+
+        return self.counts[:-1, :-1]
+
+    def unexpected(self) -> int:
+        """Number of pixels whose value doesn't belong to a class in either."""
+
+        return int(self.counts[-1].sum() + self.counts[:-1, -1].sum())
+
+    def percentages(self) -> numpy.ndarray:
+        """
+        The percentage of each reference class's pixels that are of each
+        test class; NaN for the classes absent from the reference.
+        """
+
+        classes = self.classes.astype("float64")
+        totals = classes.sum(axis=1, keepdims=True)
+
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            return numpy.where(totals == 0, numpy.nan, classes / totals * 100)
+
+    def overall_accuracy(self) -> float:
+        """Proportion of pixels whose class is the same in both."""
+
+        total = self.classes.sum()
+        if total == 0:
+            return numpy.nan
+
+        return float(numpy.trace(self.classes) / total)
+
+    def kappa(self) -> float:
+        """Cohen's kappa; agreement beyond that expected by chance."""
+
+        classes = self.classes.astype("float64")
+        total = classes.sum()
+        if total == 0:
+            return numpy.nan
+
+        observed = numpy.trace(classes) / total
+        expected = (classes.sum(axis=0) * classes.sum(axis=1)).sum() / total ** 2
+
+        if expected == 1:
+            return 1.0 if observed == 1 else numpy.nan
+
+        return float((observed - expected) / (1 - expected))
+
+    def f1(self) -> numpy.ndarray:
+        """
+        F1 score of each class, treating the reference as the truth;
+        NaN for the classes absent from both.
+        """
+
+        classes = self.classes.astype("float64")
+        agreed = numpy.diag(classes)
+        totals = classes.sum(axis=0) + classes.sum(axis=1)
+
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            return numpy.where(totals == 0, numpy.nan, 2 * agreed / totals)
+
+
+def confusion_matrix(
+    ref_data: numpy.ndarray,
+    test_data: numpy.ndarray,
+    values: List[int],
+    chunk_size: int = KERNEL_CHUNK_SIZE,
+) -> ConfusionMatrix:
+    """
+    The confusion matrix of a reference and test array, evaluated a
+    chunk at a time to bound the size of the temporary class indices.
+    """
+
+    matrix = ConfusionMatrix(values)
+    ref_data = ref_data.ravel()
+    test_data = test_data.ravel()
+
+    for start in range(0, ref_data.size, chunk_size):
+        stop = start + chunk_size
+        matrix.update(ref_data[start:stop], test_data[start:stop])
+
+    return matrix
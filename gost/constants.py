@@ -78,6 +78,7 @@ class LogNames(Enum):
     COLLATE = "ard-intercomparison-collate.log.jsonl"
     PLOTTING = "ard-intercomparison-plotting.log.jsonl"
     REPORTING = "ard-intercomparison-reporting.log.jsonl"
+    IO_TUNE = "ard-intercomparison-io-tune.log.jsonl"
 
 
 class DirectoryNames(Enum):
@@ -93,6 +94,7 @@ class DirectoryNames(Enum):
     REPORT_FIGURES = "figures"
     REPORT_TABLES = "tables"
     REPORT_SECTIONS = "sections"
+    RESIDUALS = "residuals"
 
 
 class FileNames(Enum):
@@ -101,6 +103,7 @@ class FileNames(Enum):
     """
 
     RESULTS = "intercomparison-results.h5"
+    IO_PROFILE = "io-profile.json"
     GENERAL_FRAMING = "results-per-framing-geometry-general.geojsonl"
     FMASK_FRAMING = "results-per-framing-geometry-fmask.geojsonl"
     CONTIGUITY_FRAMING = "results-per-framing-geometry-contiguity.geojsonl"
@@ -173,6 +176,8 @@ class DatasetGroups(Enum):
 
     INTERCOMPARISON = "INTERCOMPARISON"
     SUMMARY = "SUMMARY"
+    SPATIAL = "SPATIAL-STATISTICS"
+    ACCUMULATORS = "RESIDUAL-ACCUMULATORS"
 
 
 class DatasetNames(Enum):
@@ -181,6 +186,7 @@ class DatasetNames(Enum):
     """
 
     QUERY = "QUERY"
+    DIGESTS = "DIGESTS"
     SOFTWARE_VERSIONS = "SOFTWARE-VERSIONS"
     GENERAL_RESULTS = "GENERAL-RESULTS"
     FMASK_RESULTS = "FMASK-RESULTS"
@@ -194,6 +200,7 @@ class DatasetNames(Enum):
     SHADOW_SUMMARISED = "SUMMARISED-SHADOW"
     GQA_SUMMARISED = "SUMMARISED-GQA"
     ANCILLARY_SUMMARISED = "SUMMARISED-ANCILLARY"
+    DISTRIBUTION_SUMMARISED = "SUMMARISED-DISTRIBUTION"
 
 
 class MergeLookup(Enum):
@@ -2,15 +2,25 @@
 Contains the constructs for defining the data model when deserialising
 the yaml documents, and forms the basis of the intercomparison workflow.
 """
+
 import math
+import threading
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 import attr
 from affine import Affine  # type: ignore
+import h5py  # type: ignore
 import numpy  # type: ignore
-import rasterio  # type: ignore
+from rasterio.enums import MaskFlags, Resampling  # type: ignore
+from rasterio.vrt import WarpedVRT  # type: ignore
+from rasterio.windows import Window, intersect, intersection  # type: ignore
 import structlog  # type: ignore
 
+from gost.handles import DATASET_POOL
+from gost.masks import SharedMasks, pack, unpack, valid_mask
+from gost.memmap import memory_map
+from gost.storage import location, storage_for
+
 _LOG = structlog.get_logger()
 
 
@@ -290,6 +300,18 @@ def _convert_transform(transform: List[Any]) -> Affine:
     return affine_transform
 
 
+@attr.s(auto_attribs=True)
+class Grid:
+    """
+    A pixel grid defined by a CRS, affine transform and (height, width)
+    shape, e.g. that of a reference measurement.
+    """
+
+    crs: str
+    transform: Affine
+    shape: Tuple[int, int]
+
+
 @attr.s(auto_attribs=True)
 class Measurement:
     """
@@ -319,10 +341,31 @@ class Measurement:
         Is the file and/or dataset openeded.
     :dataset:
         Data access layer.
+    :decimation:
+        Read the dataset at 1/n of its resolution (nearest neighbour), using an
+        overview where available. Used for quick-look comparisons.
+    :subset:
+        Restrict the reads to a window of the dataset, e.g. an area of
+        interest. Windows given to read() and those of block_windows()
+        remain relative to the full dataset.
+    :warp:
+        Resample the dataset onto another pixel grid (nearest neighbour)
+        when opened; the windows and shape are then those of the grid.
+    :shared_masks:
+        The valid pixel masks shared by the measurements of a granule
+        (see gost.masks.SharedMasks); the mask of the measurement is
+        reused by the measurements with the same grid and nodata value.
+    :_buffer:
+        The decoded pixels of the measurement, retained between reads
+        until the dataset is closed.
+    :_mapped:
+        A memory mapped view of the band, for uncompressed files with a
+        contiguous layout (see gost.memmap).
+    :_mask:
+        The valid pixel mask of the band (or subset), and its bit-packed
+        form, retained until the dataset is closed.
     """
 
-    # TODO: HDF5 measurement class to simplify IO on measurements
-    # within the same file. Required for upcoming sensitivity analysis.
     path: str
     parent_dir: str
     file_format: str
@@ -333,6 +376,15 @@ class Measurement:
     nodata: Any = None
     closed: bool = True
     dataset: Any = None
+    decimation: int = 1
+    subset: Optional[Window] = None
+    warp: Optional[Grid] = None
+    shared_masks: Optional[SharedMasks] = attr.ib(default=None, repr=False)
+    _buffer: Optional[numpy.ndarray] = attr.ib(default=None, init=False, repr=False)
+    _source: Any = attr.ib(default=None, init=False, repr=False)
+    _mapped: Any = attr.ib(default=None, init=False, repr=False)
+    _mask: Optional[numpy.ndarray] = attr.ib(default=None, init=False, repr=False)
+    _bits: Optional[numpy.ndarray] = attr.ib(default=None, init=False, repr=False)
 
     @band.default
     def band_default(self):
@@ -346,42 +398,443 @@ class Measurement:
 
         return value
 
-    def pathname(self) -> Path:
-        """Return full pathname to the file."""
+    def pathname(self) -> Union[Path, str]:
+        """Return full pathname (or URL) to the file."""
 
-        pathname = Path(self.parent_dir, self.path)
+        pathname = location(self.parent_dir, self.path)
 
         return pathname
 
+    def exists(self) -> bool:
+        """Does the file exist, locally or remotely."""
+
+        return storage_for(self.pathname()).exists(self.pathname())
+
     def open(self):
-        """Open the dataset."""
+        """Open the dataset; a no-op if already opened."""
+
+        if not self.closed:
+            return
 
         pathname = self.pathname()
-        if not pathname.exists():
+        if not self.exists():
             msg = "pathname not found"
             _LOG.info(msg, pathname=str(pathname))
 
             raise OSError(msg)
 
-        self.dataset = rasterio.open(pathname)
+        dataset = DATASET_POOL.acquire(pathname)
+
+        if self.warp is not None:
+            # reads are resampled block-wise by GDAL as they're requested
+            self._source = dataset
+            height, width = self.warp.shape
+            dataset = WarpedVRT(
+                dataset,
+                crs=self.warp.crs or dataset.crs,
+                transform=self.warp.transform,
+                width=width,
+                height=height,
+                resampling=Resampling.nearest,
+            )
+
+        elif self.decimation == 1:
+            # uncompressed bands are read as views of the file
+            self._mapped = memory_map(dataset, self.band, pathname)
+
+        self.dataset = dataset
         self.nodata = self.dataset.nodata
         self.closed = False
 
     def close(self):
-        """Close the dataset."""
+        """
+        Release the dataset to the handle pool (for reuse by later opens
+        of the same file), and release the pixel buffer.
+        """
 
-        self.dataset.close()
+        if self._source is not None:
+            self.dataset.close()
+            self.dataset = self._source
+            self._source = None
+
+        DATASET_POOL.release(self.pathname(), self.dataset)
+        self.dataset = None
         self.closed = True
+        self._buffer = None
+        self._mapped = None
+        self._mask = None
+        self._bits = None
+
+    def dtype(self) -> numpy.dtype:
+        """The datatype of the measurement."""
+
+        return numpy.dtype(self.dataset.dtypes[self.band - 1])
+
+    def subset_shape(self) -> Tuple[int, int]:
+        """Shape in (height, width) of the subset being read."""
 
-    def read(self) -> numpy.ndarray:
+        if self.subset is not None:
+            return (self.subset.height, self.subset.width)
+
+        if self.warp is not None:
+            return self.warp.shape
+
+        return self.shape
+
+    def _decimated_shape(self) -> Tuple[int, int]:
+        """Shape in (height, width) of the subset read at 1/decimation."""
+
+        height, width = self.subset_shape()
+
+        return (-(-height // self.decimation), -(-width // self.decimation))
+
+    def _subset_windows(self, windows: Iterator[Window]) -> Iterator[Window]:
+        """Restrict block windows to those intersecting the subset."""
+
+        for window in windows:
+            if self.subset is None:
+                yield window
+            elif intersect(window, self.subset):
+                yield intersection(window, self.subset)
+
+    def subset_window(self, window: Window) -> Window:
+        """A dataset window relative to the subset (if set) being read."""
+
+        if self.subset is None:
+            return window
+
+        return Window(
+            window.col_off - self.subset.col_off,
+            window.row_off - self.subset.row_off,
+            window.width,
+            window.height,
+        )
+
+    def _buffer_slices(self, window: Window) -> Tuple[slice, slice]:
+        """Slices of the pixel buffer corresponding to a dataset window."""
+
+        return self.subset_window(window).toslices()
+
+    def block_windows(self) -> Iterator[Window]:
+        """Iterate over the internal block windows of the dataset."""
+
+        windows = (window for _, window in self.dataset.block_windows(self.band))
+        yield from self._subset_windows(windows)
+
+    def read(self, window: Optional[Window] = None) -> numpy.ndarray:
         """
         Basic method to read the data into memory.
-        Can very easily be expanded to read subsets, resample etc.
+        Only the subset window (if set) is read.
+
+        The band is only decoded on the first call, and subsequent
+        calls return the same (read-only) array until the dataset is
+        closed. This allows each of the evaluators to call read()
+        without paying the decode cost again.
+
+        If a window is given, only that subset is read, and it is not
+        retained (a subset of the buffer is returned if the full band
+        has already been decoded).
+
+        Memory mapped bands are returned as views of the file, rather
+        than being decoded, wherever the pixels are contiguous.
+        """
+
+        if window is not None:
+            # a quick-look buffer is decimated, so it doesn't map to windows
+            if self._buffer is not None and self.decimation == 1:
+                return self._buffer[self._buffer_slices(window)]
+
+            if self._mapped is not None:
+                data = self._mapped.read(window)
+                if data is not None:
+                    return data
+
+            return self.dataset.read(self.band, window=window)
+
+        if self._buffer is None:
+            if self.decimation > 1:
+                # GDAL uses the overview that best matches the output shape
+                # (if any), otherwise it subsamples the full resolution
+                data = self.dataset.read(
+                    self.band,
+                    window=self.subset,
+                    out_shape=self._decimated_shape(),
+                    resampling=Resampling.nearest,
+                )
+            else:
+                data = None
+                if self._mapped is not None:
+                    data = self._mapped.read(self.subset)
+
+                if data is None:
+                    data = self.dataset.read(self.band, window=self.subset)
+
+            data.flags.writeable = False
+            self._buffer = data
+
+        return self._buffer
+
+    def has_mask_band(self) -> bool:
+        """
+        Does the band have a per-dataset mask or an alpha band, i.e. valid
+        pixels that aren't defined by the nodata value.
+        """
+
+        flags = self.dataset.mask_flag_enums[self.band - 1]
+
+        return MaskFlags.per_dataset in flags or MaskFlags.alpha in flags
+
+    def _internal_mask(self, window: Optional[Window] = None) -> Optional[numpy.ndarray]:
+        """
+        Read the GDAL mask band of a window (or the subset), if the band
+        has a per-dataset mask or an alpha band. Nodata masks aren't read,
+        as they're equivalent to comparing the decoded pixels against the
+        nodata value (without decoding the band a second time).
+        """
+
+        if not self.has_mask_band():
+            return None
+
+        if window is not None:
+            mask = self.dataset.read_masks(self.band, window=window)
+        elif self.decimation > 1:
+            mask = self.dataset.read_masks(
+                self.band,
+                window=self.subset,
+                out_shape=self._decimated_shape(),
+                resampling=Resampling.nearest,
+            )
+        else:
+            mask = self.dataset.read_masks(self.band, window=self.subset)
+
+        return mask != 0
+
+    def valid_mask(
+        self, window: Optional[Window] = None, data: Optional[numpy.ndarray] = None
+    ) -> numpy.ndarray:
+        """
+        Mask of the valid pixels of the band (or subset), from the GDAL
+        mask band if there is one, otherwise from the nodata value (0 if
+        the nodata value is undefined).
+        The mask of the band is computed once (or unpacked from the shared
+        masks), and the same (read-only) array is returned until the
+        dataset is closed. The masks of windows aren't retained; the
+        pixels of a window already read can be given as data, so that
+        only the mask band (if any) is read.
+        """
+
+        nodata = 0 if self.nodata is None else self.nodata
+
+        if window is not None:
+            mask = self._internal_mask(window)
+            if mask is None:
+                if data is None:
+                    data = self.read(window)
+
+                mask = valid_mask(data, nodata)
+
+            return mask
+
+        if self._mask is None:
+            bits = self._shared_bits()
+            if bits is not None:
+                mask = unpack(bits, self._decimated_shape())
+            else:
+                mask = self._band_mask()
+
+            mask.flags.writeable = False
+            self._mask = mask
+
+        return self._mask
+
+    def _band_mask(self) -> numpy.ndarray:
+        """Evaluate the valid pixel mask of the band (or subset)."""
+
+        mask = self._internal_mask()
+        if mask is None:
+            mask = valid_mask(self.read(), 0 if self.nodata is None else self.nodata)
+
+        return mask
+
+    def _shared_bits(self) -> Optional[numpy.ndarray]:
+        """
+        The packed mask shared with the measurements on the same grid
+        and read region, and with the same nodata value; None if the
+        masks aren't shared, or the band has a mask band of its own.
         """
 
-        data = self.dataset.read(self.band)
+        if self.shared_masks is None or self.has_mask_band():
+            return None
 
-        return data
+        key = (
+            self.shape,
+            tuple(self.transform)[:6],
+            repr(self.subset),
+            repr(self.warp),
+            self.decimation,
+            str(self.nodata),
+        )
+
+        return self.shared_masks.bits(key, self._band_mask)
+
+    def valid_bits(self) -> numpy.ndarray:
+        """The valid pixel mask packed into bits (see gost.masks)."""
+
+        if self._bits is None:
+            bits = self._shared_bits()
+            self._bits = pack(self.valid_mask()) if bits is None else bits
+
+        return self._bits
+
+
+@attr.s(auto_attribs=True)
+class H5Container:
+    """
+    A file handle shared by all the measurements residing within the
+    same HDF5 file. The file is opened on first use, and remains open
+    until explicitly closed. Opening and closing are serialised by a lock,
+    so measurements opened by concurrent threads share the one handle.
+    """
+
+    pathname: Union[Path, str]
+    fid: Any = None
+    _lock: threading.Lock = attr.ib(factory=threading.Lock, init=False, repr=False)
+
+    def open(self) -> h5py.File:
+        """Open the file if not already opened."""
+
+        with self._lock:
+            if self.fid is None:
+                storage = storage_for(self.pathname)
+                if storage.opener() is None:
+                    self.fid = h5py.File(str(self.pathname), "r")
+                else:
+                    self.fid = h5py.File(storage.open(self.pathname), "r")
+
+            return self.fid
+
+    def close(self):
+        """Close the file."""
+
+        with self._lock:
+            if self.fid is not None:
+                self.fid.close()
+                self.fid = None
+
+
+@attr.s(auto_attribs=True)
+class H5Measurement(Measurement):
+    """
+    A measurement stored as a dataset within an HDF5 file.
+    Measurements of a granule within the same file share a single
+    H5Container, so opening the measurement only accesses the dataset
+    rather than the file.
+
+    Attributes:
+    ----------
+
+    :container:
+        The shared file handle.
+    """
+
+    container: Optional[H5Container] = attr.ib(default=None, repr=False)
+
+    def open(self):
+        """Open the dataset from the shared container."""
+
+        if not self.closed:
+            return
+
+        pathname = self.pathname()
+        if not self.exists():
+            msg = "pathname not found"
+            _LOG.info(msg, pathname=str(pathname))
+
+            raise OSError(msg)
+
+        if self.container is None:
+            self.container = H5Container(pathname)
+
+        self.dataset = self.container.open()[self.dataset_pathname]
+        self.nodata = self.dataset.attrs.get("no_data_value", self.nodata)
+        self.closed = False
+
+    def close(self):
+        """
+        Release the dataset and pixel buffer. The container remains open
+        for the other measurements; see Granule.close_containers.
+        """
+
+        self.dataset = None
+        self.closed = True
+        self._buffer = None
+        self._mask = None
+        self._bits = None
+
+    def dtype(self) -> numpy.dtype:
+        """The datatype of the measurement."""
+
+        return self.dataset.dtype
+
+    def has_mask_band(self) -> bool:
+        """HDF5 datasets don't have mask bands; the nodata value is used."""
+
+        return False
+
+    def _internal_mask(self, window: Optional[Window] = None) -> Optional[numpy.ndarray]:
+        """HDF5 datasets don't have mask bands; the nodata value is used."""
+
+        return None
+
+    def block_windows(self) -> Iterator[Window]:
+        """
+        Iterate over the chunks of the dataset. Contiguous datasets are
+        iterated over in strips of 256 rows.
+        """
+
+        height, width = self.dataset.shape
+        if self.dataset.chunks is None:
+            chunk_height, chunk_width = min(256, height), width
+        else:
+            chunk_height, chunk_width = self.dataset.chunks
+
+        def _windows():
+            for row in range(0, height, chunk_height):
+                for col in range(0, width, chunk_width):
+                    width_ = min(chunk_width, width - col)
+                    height_ = min(chunk_height, height - row)
+                    yield Window(col, row, width_, height_)
+
+        yield from self._subset_windows(_windows())
+
+    def read(self, window: Optional[Window] = None) -> numpy.ndarray:
+        """
+        Read the dataset into memory, or a subset of it given a window.
+        Behaves the same as Measurement.read with respect to retaining
+        the pixel buffer.
+        """
+
+        if window is not None:
+            # a quick-look buffer is decimated, so it doesn't map to windows
+            if self._buffer is not None and self.decimation == 1:
+                return self._buffer[self._buffer_slices(window)]
+
+            return self.dataset[window.toslices()]
+
+        if self._buffer is None:
+            if self.subset is None:
+                rows, cols = slice(None), slice(None)
+            else:
+                rows, cols = self.subset.toslices()
+
+            step = self.decimation
+            data = self.dataset[
+                rows.start : rows.stop : step, cols.start : cols.stop : step
+            ]
+            data.flags.writeable = False
+            self._buffer = data
+
+        return self._buffer
 
 
 @attr.s(auto_attribs=True)
@@ -395,5 +848,26 @@ class Granule:
     product_name: str = attr.ib(default="")
     parent_uuid: str = attr.ib(default="")
     framing: str = attr.ib(default="")
+    crs: str = attr.ib(default="")
     measurements: Union[Dict[str, Measurement], None] = None
     proc_info: str = attr.ib(default="")
+
+    def __attrs_post_init__(self):
+        # measurements within the same HDF5 file share the file handle
+        containers: Dict[Union[Path, str], H5Container] = {}
+        for measurement in (self.measurements or {}).values():
+            if not isinstance(measurement, H5Measurement):
+                continue
+
+            if measurement.container is None:
+                pathname = measurement.pathname()
+                if pathname not in containers:
+                    containers[pathname] = H5Container(pathname)
+                measurement.container = containers[pathname]
+
+    def close_containers(self):
+        """Close any of the file handles shared by the measurements."""
+
+        for measurement in (self.measurements or {}).values():
+            if isinstance(measurement, H5Measurement) and measurement.container:
+                measurement.container.close()
@@ -0,0 +1,151 @@
+"""
+Whole-file digests of the measurement files, used to short-circuit the
+evaluation of test and reference measurements that are byte-identical.
+The digests are recorded alongside the file size and modification time,
+so that later runs can reuse them without re-reading unchanged files.
+"""
+
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+import attr
+import pandas  # type: ignore
+import structlog  # type: ignore
+
+from gost.storage import is_remote
+
+CHUNK_SIZE: int = 1024 ** 2
+
+_LOG = structlog.get_logger()
+
+
+def file_digest(pathname: Path, chunk_size: int = CHUNK_SIZE) -> str:
+    """Stream a file through a BLAKE2b hash."""
+
+    digest = hashlib.blake2b()
+    with open(pathname, "rb") as src:
+        for chunk in iter(lambda: src.read(chunk_size), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _text(value: Union[str, bytes]) -> str:
+    """Text columns can be returned as bytes from the HDF5 tables."""
+
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+
+    return str(value)
+
+
+@attr.s(auto_attribs=True)
+class DigestRecord:
+    """
+    The digest of a file, and the size and modification time the
+    digest is valid for.
+    The class_counts are the histogram counts of a thematic measurement
+    (single dataset files only), used to emit the identity result
+    without decoding the pixels again.
+    """
+
+    pathname: str
+    size: int
+    mtime_ns: int
+    digest: str
+    class_counts: Optional[List[int]] = None
+
+
+@attr.s(auto_attribs=True)
+class DigestCache:
+    """
+    Digests of the measurement files, keyed by pathname.
+    Safe to use across the threads evaluating a granule.
+    """
+
+    records: Dict[str, DigestRecord] = attr.ib(factory=dict)
+    _lock: threading.Lock = attr.ib(factory=threading.Lock, init=False, repr=False)
+
+    def record(self, pathname: Path) -> DigestRecord:
+        """
+        The digest record of a file; the file is only hashed if it has
+        changed since the record was made.
+        """
+
+        stat = pathname.stat()
+        key = str(pathname)
+
+        with self._lock:
+            record = self.records.get(key)
+
+        if record is not None:
+            if (record.size, record.mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                return record
+
+        _LOG.info("computing digest", pathname=key)
+        record = DigestRecord(key, stat.st_size, stat.st_mtime_ns, file_digest(pathname))
+
+        with self._lock:
+            self.records[key] = record
+
+        return record
+
+    def identical(
+        self, pathname: Union[Path, str], pathname2: Union[Path, str]
+    ) -> bool:
+        """
+        Are the contents of two files identical. Files of different sizes
+        are never hashed, nor are remote files (as that would require
+        fetching the whole file).
+        """
+
+        if is_remote(pathname) or is_remote(pathname2):
+            return False
+
+        pathname, pathname2 = Path(pathname), Path(pathname2)
+        if pathname.stat().st_size != pathname2.stat().st_size:
+            return False
+
+        return self.record(pathname).digest == self.record(pathname2).digest
+
+    def to_dataframe(self) -> pandas.DataFrame:
+        """Tabular form of the records, for storing in the results file."""
+
+        with self._lock:
+            records = [attr.asdict(record) for record in self.records.values()]
+
+        dataframe = pandas.DataFrame(
+            records, columns=[field.name for field in attr.fields(DigestRecord)]
+        )
+
+        # stored as text to suit the HDF5 tables
+        dataframe["class_counts"] = [
+            "" if counts is None else json.dumps(counts)
+            for counts in dataframe["class_counts"]
+        ]
+
+        return dataframe
+
+    @classmethod
+    def from_dataframe(cls, dataframe: Union[pandas.DataFrame, None]) -> "DigestCache":
+        """Restore the records from their tabular form."""
+
+        cache = cls()
+        if dataframe is None:
+            return cache
+
+        for row in dataframe.itertuples(index=False):
+            counts = _text(row.class_counts)
+            pathname = _text(row.pathname)
+
+            cache.records[pathname] = DigestRecord(
+                pathname=pathname,
+                size=int(row.size),
+                mtime_ns=int(row.mtime_ns),
+                digest=_text(row.digest),
+                class_counts=json.loads(counts) if counts else None,
+            )
+
+        return cache
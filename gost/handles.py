@@ -0,0 +1,157 @@
+"""
+A process-wide pool of open rasterio dataset handles.
+Opening a dataset re-probes the GDAL drivers and re-reads the file
+headers, so rather than closing a handle once a measurement is done
+with it, the handle is returned to the pool for reuse by the next
+reader of the same file. The idle handles are bounded in number, and
+the least recently used are closed first.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+import attr
+import rasterio  # type: ignore
+
+from gost.storage import is_remote, storage_for
+
+PoolKey = Tuple[str, int]
+
+
+def _key(pathname: Union[Path, str]) -> PoolKey:
+    """
+    Handles are keyed by the pathname and modification time, so that a
+    file that has been rewritten isn't read through a stale handle.
+    Remote files are assumed to be immutable for the life of the process.
+    """
+
+    if is_remote(pathname):
+        return (str(pathname), 0)
+
+    return (str(pathname), os.stat(pathname).st_mtime_ns)
+
+
+@attr.s(auto_attribs=True)
+class DatasetPool:
+    """
+    An LRU pool of idle dataset handles, keyed by pathname.
+    A handle is only ever given to a single reader at a time, as rasterio
+    datasets aren't safe to read from concurrently; a reader acquiring a
+    file whose handles are all in use gets a newly opened handle.
+    A maxsize of 0 disables the pooling, i.e. released handles are closed.
+    """
+
+    maxsize: int = 32
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    _idle: "OrderedDict[int, Tuple[PoolKey, Any]]" = attr.ib(
+        factory=OrderedDict, init=False, repr=False
+    )
+    _lock: threading.Lock = attr.ib(factory=threading.Lock, init=False, repr=False)
+
+    def acquire(self, pathname: Union[Path, str]) -> Any:
+        """Acquire an open handle to a file."""
+
+        key = _key(pathname)
+
+        with self._lock:
+            # most recently used first
+            for handle_id, (idle_key, dataset) in reversed(list(self._idle.items())):
+                if idle_key == key:
+                    del self._idle[handle_id]
+                    if dataset.closed:
+                        continue
+                    self.hits += 1
+                    return dataset
+
+            self.misses += 1
+
+        # remote files are read through the storage layer's range requests
+        return rasterio.open(pathname, opener=storage_for(pathname).opener())
+
+    def release(self, pathname: Union[Path, str], dataset: Any) -> None:
+        """Return a handle to the pool, evicting the least recently used."""
+
+        if dataset.closed:
+            return
+
+        try:
+            key = _key(pathname)
+        except OSError:
+            dataset.close()
+            return
+
+        evicted = []
+        with self._lock:
+            self._idle[id(dataset)] = (key, dataset)
+
+            while len(self._idle) > self.maxsize:
+                _, (_, lru_dataset) = self._idle.popitem(last=False)
+                evicted.append(lru_dataset)
+                self.evictions += 1
+
+        for lru_dataset in evicted:
+            lru_dataset.close()
+
+    def evict(self, pathname: Optional[Union[Path, str]] = None) -> None:
+        """Close the idle handles of a file, or all idle handles."""
+
+        evicted = []
+        with self._lock:
+            for handle_id, (key, dataset) in list(self._idle.items()):
+                if pathname is None or key[0] == str(pathname):
+                    del self._idle[handle_id]
+                    evicted.append(dataset)
+
+            self.evictions += len(evicted)
+
+        for dataset in evicted:
+            dataset.close()
+
+    def resize(self, maxsize: int) -> None:
+        """Change the number of idle handles retained."""
+
+        self.maxsize = maxsize
+
+        evicted: List[Any] = []
+        with self._lock:
+            while len(self._idle) > self.maxsize:
+                _, (_, dataset) = self._idle.popitem(last=False)
+                evicted.append(dataset)
+                self.evictions += 1
+
+        for dataset in evicted:
+            dataset.close()
+
+    def counters(self) -> Dict[str, int]:
+        """The hit, miss and eviction counters, and the number of idle handles."""
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "idle": len(self._idle),
+            }
+
+    def _after_fork(self) -> None:
+        """
+        A child process mustn't share the parent's GDAL handles, and the
+        lock may have been held by another thread at the time of the fork.
+        The inherited handles are discarded, and the child opens its own.
+        """
+
+        self._lock = threading.Lock()
+        self._idle = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+DATASET_POOL = DatasetPool()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=DATASET_POOL._after_fork)
@@ -0,0 +1,168 @@
+"""
+Named GDAL I/O profiles, applied through rasterio.Env around the reads
+of the comparison, and a benchmark for selecting the fastest profile
+for a given set of files.
+The GDAL configuration options are process-wide, so a profile entered
+by the main thread applies to the threads evaluating the measurements.
+"""
+
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Union
+import attr
+import pandas  # type: ignore
+import rasterio  # type: ignore
+import structlog  # type: ignore
+
+from gost.data_model import Measurement
+from gost.handles import DATASET_POOL
+
+_LOG = structlog.get_logger()
+
+
+@attr.s(auto_attribs=True)
+class IOProfile:
+    """
+    A named set of GDAL configuration options.
+
+    :name:
+        Name of the profile.
+    :options:
+        The GDAL configuration options, e.g. {"GDAL_CACHEMAX": 512}.
+    """
+
+    name: str
+    options: Dict[str, Any] = attr.ib(factory=dict)
+
+    def env(self) -> rasterio.Env:
+        """The rasterio environment applying the options."""
+
+        return rasterio.Env(**self.options)
+
+    def write(self, pathname: Union[Path, str]) -> None:
+        """Write the profile as a JSON document."""
+
+        with open(pathname, "w") as dst:
+            json.dump(attr.asdict(self), dst, indent=4)
+
+
+PROFILES: Dict[str, IOProfile] = {
+    # GDAL defaults
+    "default": IOProfile("default"),
+    # fast, low latency storage; decompress with all the cores
+    "local-ssd": IOProfile(
+        "local-ssd",
+        {"GDAL_CACHEMAX": 512, "GDAL_NUM_THREADS": "ALL_CPUS"},
+    ),
+    # parallel filesystems; directory listings and small reads are costly
+    "lustre": IOProfile(
+        "lustre",
+        {
+            "GDAL_CACHEMAX": 1024,
+            "GDAL_NUM_THREADS": "ALL_CPUS",
+            "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+            "VSI_CACHE": True,
+            "VSI_CACHE_SIZE": 64 * 1024 ** 2,
+        },
+    ),
+    # remote files; cache the fetched ranges and merge adjacent requests
+    "http": IOProfile(
+        "http",
+        {
+            "GDAL_CACHEMAX": 512,
+            "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+            "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+            "GDAL_HTTP_MULTIPLEX": "YES",
+            "VSI_CACHE": True,
+            "VSI_CACHE_SIZE": 64 * 1024 ** 2,
+        },
+    ),
+}
+
+
+def load_profile(profile: Union[Path, str, None]) -> IOProfile:
+    """
+    Load a profile by name, or from the JSON document written by io-tune.
+    None returns the default profile.
+    """
+
+    if profile is None:
+        return PROFILES["default"]
+
+    if str(profile) in PROFILES:
+        return PROFILES[str(profile)]
+
+    pathname = Path(profile)
+    if not pathname.exists():
+        msg = f"unknown I/O profile: {profile}"
+        _LOG.info(msg, available=list(PROFILES))
+
+        raise ValueError(msg)
+
+    with open(pathname) as src:
+        doc = json.load(src)
+
+    return IOProfile(doc["name"], doc.get("options", {}))
+
+
+def _read_measurements(measurements: Iterable[Measurement]) -> int:
+    """Open and fully read each measurement; returns the bytes read."""
+
+    nbytes = 0
+    for measurement in measurements:
+        measurement.open()
+        nbytes += measurement.read().nbytes
+        measurement.close()
+
+    return nbytes
+
+
+def benchmark(
+    measurements: List[Measurement],
+    profiles: Iterable[IOProfile],
+    repeats: int = 3,
+) -> pandas.DataFrame:
+    """
+    Time reading the measurements under each profile.
+    A warm-up pass is read first, and the fastest of the repeated passes
+    is retained for each profile, so that the profiles are compared
+    under the same (warm) filesystem cache. The idle dataset handles are
+    closed prior to each pass, so the opening of the files is included.
+
+    :return:
+        A pandas.DataFrame of profile name, seconds and MiB/s, sorted
+        fastest first.
+    """
+
+    DATASET_POOL.evict()
+    _read_measurements(measurements)
+
+    records = []
+    for profile in profiles:
+        timings = []
+        with profile.env():
+            for _ in range(repeats):
+                DATASET_POOL.evict()
+                start = time.perf_counter()
+                nbytes = _read_measurements(measurements)
+                timings.append(time.perf_counter() - start)
+
+            # handles opened under this profile aren't reused by the next
+            DATASET_POOL.evict()
+
+        seconds = min(timings)
+        _LOG.info("benchmarked I/O profile", profile=profile.name, seconds=seconds)
+
+        records.append(
+            {
+                "profile": profile.name,
+                "seconds": seconds,
+                "mib_per_second": nbytes / 1024 ** 2 / seconds if seconds else 0.0,
+            }
+        )
+
+    columns = ["profile", "seconds", "mib_per_second"]
+    dataframe = pandas.DataFrame(records, columns=columns)
+
+    return dataframe.sort_values("seconds", ignore_index=True)
@@ -0,0 +1,105 @@
+"""
+Valid pixel masks, and their bit-packed form.
+Packed masks hold 8 pixels per byte, so the null transitions between
+a reference and test measurement are counted using bitwise operations
+over 1/8th of the data, rather than by fancy indexing the pixels.
+The packed masks of the measurements on the same pixel grid of a granule
+can be shared (see SharedMasks), rather than each measurement evaluating
+its own.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+import attr
+import numpy  # type: ignore
+
+# number of set bits for each byte value; for numpy < 2.0
+_POPCOUNT = numpy.array([bin(value).count("1") for value in range(256)], dtype="uint8")
+
+
+def valid_mask(data: numpy.ndarray, nodata: Any) -> numpy.ndarray:
+    """Mask of the valid data locations within an array."""
+    if numpy.isfinite(nodata):
+        mask = data != nodata
+    else:
+        mask = numpy.isfinite(data)
+
+    return mask
+
+
+def pack(mask: numpy.ndarray) -> numpy.ndarray:
+    """Pack a boolean mask into bits (flattened, zero padded)."""
+
+    return numpy.packbits(mask, axis=None)
+
+
+def unpack(bits: numpy.ndarray, shape: Tuple[int, ...]) -> numpy.ndarray:
+    """Unpack the bits of a mask packed by pack into a boolean array."""
+
+    count = int(numpy.prod(shape))
+
+    return numpy.unpackbits(bits, count=count).view("bool").reshape(shape)
+
+
+def popcount(bits: numpy.ndarray) -> int:
+    """The number of set bits."""
+
+    if hasattr(numpy, "bitwise_count"):
+        return int(numpy.bitwise_count(bits).sum(dtype="int64"))
+
+    return int(_POPCOUNT[bits].sum(dtype="int64"))
+
+
+def null_transitions(
+    ref_bits: numpy.ndarray, test_bits: numpy.ndarray
+) -> Tuple[int, int]:
+    """
+    The number of pixels that are valid in the reference but null in
+    the test, and vice versa, from the packed valid masks of each.
+    The zero padding of the packed masks doesn't contribute.
+    """
+
+    valid_2_null = popcount(ref_bits & ~test_bits)
+    null_2_valid = popcount(~ref_bits & test_bits)
+
+    return valid_2_null, null_2_valid
+
+
+@attr.s(auto_attribs=True)
+class SharedMasks:
+    """
+    The packed valid masks of a granule, shared by the measurements whose
+    pixel grid, read region and nodata value are the same; i.e. the
+    measurements sharing a footprint. Each mask is evaluated by the first
+    measurement requiring it. Safe to use across the threads evaluating
+    a granule.
+
+    :masks:
+        The packed masks keyed by the grid, region and nodata value.
+    :hits:
+        Number of masks reused.
+    :misses:
+        Number of masks evaluated.
+    """
+
+    masks: Dict[Hashable, numpy.ndarray] = attr.ib(factory=dict)
+    hits: int = 0
+    misses: int = 0
+    _lock: threading.Lock = attr.ib(factory=threading.Lock, init=False, repr=False)
+
+    def bits(self, key: Hashable, mask: Callable[[], numpy.ndarray]) -> numpy.ndarray:
+        """
+        The packed mask of a key, evaluating (and retaining) it from the
+        (boolean) mask returned by the callable if it isn't yet known.
+        """
+
+        with self._lock:
+            if key in self.masks:
+                self.hits += 1
+            else:
+                self.misses += 1
+                bits = pack(mask())
+                bits.flags.writeable = False
+                self.masks[key] = bits
+
+            return self.masks[key]
@@ -0,0 +1,174 @@
+"""
+Memory mapped access to the bands of uncompressed rasters.
+The bands of uncompressed GeoTIFFs whose blocks are stored contiguously,
+and those of band-sequential ENVI files, are exposed as numpy.memmap
+views of the file. Reads are then views onto the page cache rather than
+copies decoded through GDAL, and pages are only faulted in as the
+pixels are accessed.
+"""
+
+from pathlib import Path
+from typing import Any, Optional, Tuple, Union
+import attr
+import numpy  # type: ignore
+from rasterio.windows import Window  # type: ignore
+import structlog  # type: ignore
+
+from gost.storage import is_remote
+
+_LOG = structlog.get_logger()
+
+
+@attr.s(auto_attribs=True)
+class MappedBand:
+    """
+    A memory mapped band.
+
+    :array:
+        The (read-only) pixels, either as (height, width) for a row-major
+        layout (strips, or a single column of tiles), or as
+        (tile_rows, tile_cols, block_height, block_width) for tiles.
+    :tiled:
+        Whether the array is laid out as tiles.
+    :shape:
+        Shape in (height, width) of the band.
+    """
+
+    array: numpy.memmap
+    tiled: bool
+    shape: Tuple[int, int]
+
+    def read(self, window: Optional[Window] = None) -> Optional[numpy.ndarray]:
+        """
+        A view of the band, or a window of it; None if the pixels aren't
+        contiguous in the file, i.e. a window spanning several tiles.
+        """
+
+        if window is None:
+            window = Window(0, 0, self.shape[1], self.shape[0])
+
+        if not self.tiled:
+            return self.array[window.toslices()]
+
+        block_height, block_width = self.array.shape[2:]
+        tile_row = window.row_off // block_height
+        tile_col = window.col_off // block_width
+        row_off = window.row_off - tile_row * block_height
+        col_off = window.col_off - tile_col * block_width
+
+        if row_off + window.height > block_height or col_off + window.width > block_width:
+            return None
+
+        return self.array[
+            tile_row,
+            tile_col,
+            row_off : row_off + window.height,
+            col_off : col_off + window.width,
+        ]
+
+
+def _tiff_byteorder(pathname: Union[Path, str]) -> str:
+    """The numpy byte order of a TIFF file."""
+
+    with open(pathname, "rb") as src:
+        marker = src.read(2)
+
+    return "<" if marker == b"II" else ">"
+
+
+def _geotiff_band(
+    dataset: Any, band: int, pathname: Union[Path, str]
+) -> Optional[MappedBand]:
+    """Map an uncompressed GeoTIFF band whose blocks are contiguous."""
+
+    image_structure = dataset.tags(ns="IMAGE_STRUCTURE")
+    if "COMPRESSION" in image_structure or "NBITS" in image_structure:
+        return None
+
+    # pixel interleaved bands aren't contiguous
+    if dataset.count > 1 and image_structure.get("INTERLEAVE") != "BAND":
+        return None
+
+    dtype = numpy.dtype(dataset.dtypes[band - 1]).newbyteorder(_tiff_byteorder(pathname))
+    block_height, block_width = dataset.block_shapes[band - 1]
+    height, width = dataset.height, dataset.width
+    block_bytes = block_height * block_width * dtype.itemsize
+
+    # blocks are stored row-major and back to back
+    first = None
+    for index, ((row, col), _) in enumerate(dataset.block_windows(band)):
+        offset = dataset.get_tag_item(f"BLOCK_OFFSET_{col}_{row}", "TIFF", bidx=band)
+        if offset is None:
+            return None
+
+        if first is None:
+            first = int(offset)
+
+        if int(offset) != first + index * block_bytes:
+            return None
+
+    if first is None:
+        return None
+
+    if block_width == width:
+        array = numpy.memmap(
+            pathname, dtype=dtype, mode="r", offset=first, shape=(height, width)
+        )
+        return MappedBand(array, False, (height, width))
+
+    tile_rows = -(-height // block_height)
+    tile_cols = -(-width // block_width)
+    array = numpy.memmap(
+        pathname,
+        dtype=dtype,
+        mode="r",
+        offset=first,
+        shape=(tile_rows, tile_cols, block_height, block_width),
+    )
+
+    return MappedBand(array, True, (height, width))
+
+
+def _envi_band(dataset: Any, band: int) -> Optional[MappedBand]:
+    """Map a band of a band-sequential ENVI file."""
+
+    header = dataset.tags(ns="ENVI")
+    if dataset.count > 1 and header.get("interleave", "").lower() != "bsq":
+        return None
+
+    dtype = numpy.dtype(dataset.dtypes[band - 1])
+    dtype = dtype.newbyteorder(">" if header.get("byte_order") == "1" else "<")
+    height, width = dataset.height, dataset.width
+    offset = int(header.get("header_offset", 0))
+    offset += (band - 1) * height * width * dtype.itemsize
+
+    array = numpy.memmap(
+        dataset.files[0], dtype=dtype, mode="r", offset=offset, shape=(height, width)
+    )
+
+    return MappedBand(array, False, (height, width))
+
+
+def memory_map(
+    dataset: Any, band: int, pathname: Union[Path, str]
+) -> Optional[MappedBand]:
+    """
+    Map a band of an opened dataset, if it's an uncompressed local file
+    with a contiguous layout; otherwise None (read through GDAL).
+    """
+
+    if is_remote(pathname):
+        return None
+
+    try:
+        if dataset.driver == "GTiff":
+            mapped = _geotiff_band(dataset, band, pathname)
+        elif dataset.driver == "ENVI":
+            mapped = _envi_band(dataset, band)
+        else:
+            mapped = None
+    except (OSError, ValueError) as err:
+        _LOG.info("unable to memory map", pathname=str(pathname), error=str(err))
+        mapped = None
+
+    return mapped
@@ -1,39 +1,54 @@
 """
 Handles the deserialisation of Open Data Cube metadata documents.
 """
+
 from pathlib import Path
-from typing import Dict
+from typing import Any, Dict, Union
 import cattr
 import yaml
 import structlog  # type: ignore
 
-from gost.data_model import Granule, GranuleProcInfo
+from gost.data_model import Granule, GranuleProcInfo, H5Measurement, Measurement
+from gost.storage import parent, storage_for
 
 _LOG = structlog.get_logger()
 
 
-def _load_yaml_doc(path: Path) -> Dict:
-    """Load a yaml document."""
+def _structure_measurement(
+    converter: cattr.Converter, doc: Dict[str, Any], _: Any
+) -> Measurement:
+    """Structure a measurement into the class appropriate for its file format."""
+
+    if doc["file_format"] == "HDF5":
+        measurement = converter.structure_attrs_fromdict(doc, H5Measurement)
+    else:
+        measurement = converter.structure_attrs_fromdict(doc, Measurement)
+
+    return measurement
+
+
+def _load_yaml_doc(path: Union[Path, str]) -> Dict:
+    """Load a yaml document, locally or remotely."""
 
-    with open(path, "r") as src:
-        doc = yaml.load(src, Loader=yaml.FullLoader)
+    doc = yaml.load(storage_for(path).read(path), Loader=yaml.FullLoader)
 
     return doc
 
 
-def load_odc_metadata(path: Path) -> Granule:
+def load_odc_metadata(path: Union[Path, str]) -> Granule:
     """
     Load the ODC odc-metadata document.
     The checks for different old style metadata will be removed soon.
 
     :param path:
-        Pathname to the *.odc-metadata.yaml document.
+        Pathname (or URL) to the *.odc-metadata.yaml document.
 
     :return:
         Granule class instance.
     """
 
     raw_doc = _load_yaml_doc(path)
+    parent_dir = parent(path)
     doc = {}
 
     if "product_type" in raw_doc:
@@ -60,13 +75,16 @@ def load_odc_metadata(path: Path) -> Granule:
             doc["framing"] = "WRS2"
             doc["parent_uuid"] = l1_lineage["id"]
 
+        projection = raw_doc.get("grid_spatial", {}).get("projection", {})
+        doc["crs"] = projection.get("spatial_reference", "")
+
         measurements = raw_doc["image"]["bands"]
         doc["measurements"] = {key: {} for key in measurements}
 
         for meas in measurements:
             doc["measurements"][meas]["path"] = measurements[meas]["path"]
             doc["measurements"][meas]["file_format"] = "GeoTIFF"
-            doc["measurements"][meas]["parent_dir"] = str(path.parent)
+            doc["measurements"][meas]["parent_dir"] = parent_dir
             doc["measurements"][meas]["transform"] = measurements[meas]["info"][
                 "geotransform"
             ]
@@ -81,6 +99,7 @@ def load_odc_metadata(path: Path) -> Granule:
         doc["region_code"] = raw_doc["properties"]["odc:region_code"]
         doc["measurements"] = raw_doc["measurements"]
         doc["framing"] = "WRS2"
+        doc["crs"] = raw_doc["crs"]
 
         # assuming a single level-1 source
         doc["parent_uuid"] = raw_doc["lineage"]["level1"][0]
@@ -94,7 +113,12 @@ def load_odc_metadata(path: Path) -> Granule:
         # file format is global in ODC; still it is better to define it per-measurement
         for measurement in doc["measurements"]:
             doc["measurements"][measurement]["file_format"] = file_format
-            doc["measurements"][measurement]["parent_dir"] = str(path.parent)
+            doc["measurements"][measurement]["parent_dir"] = parent_dir
+
+            # container formats such as HDF5 specify the dataset as a layer
+            layer = doc["measurements"][measurement].pop("layer", None)
+            if layer is not None:
+                doc["measurements"][measurement]["dataset_pathname"] = layer
 
             # shape and transform
             grid = doc["measurements"][measurement].get("grid", "default")
@@ -102,12 +126,15 @@ def load_odc_metadata(path: Path) -> Granule:
                 doc["measurements"][measurement][key] = value
 
     converter = cattr.Converter()
+    converter.register_structure_hook(
+        Measurement, lambda obj, cls: _structure_measurement(converter, obj, cls)
+    )
     granule = converter.structure(doc, Granule)
 
     return granule
 
 
-def load_proc_info(path: Path) -> GranuleProcInfo:
+def load_proc_info(path: Union[Path, str]) -> GranuleProcInfo:
     """
     Load the ODC proc-info metadata document.
 
@@ -0,0 +1,263 @@
+"""
+Read-ahead of the granules to be compared.
+While the statistics of the current granule are being evaluated, a
+background thread loads the ODC documents of the following granules
+and decodes their first measurements, so that the filesystem latency
+is hidden behind the computation.
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+import attr
+import numpy  # type: ignore
+import pandas  # type: ignore
+import structlog  # type: ignore
+
+from gost.data_model import Granule, Measurement
+from gost.odc_documents import load_odc_metadata
+from gost.storage import as_location
+
+_LOG = structlog.get_logger()
+
+
+@attr.s(auto_attribs=True)
+class PrefetchedGranule:
+    """
+    The loaded test and reference documents of a record, and the number
+    of bytes of measurement pixels decoded ahead of time.
+    """
+
+    row: Any
+    doc_test: Optional[Granule] = None
+    doc_reference: Optional[Granule] = None
+    nbytes: int = 0
+    exception: Optional[BaseException] = None
+
+
+def measurement_pairs(
+    doc_test: Granule, doc_reference: Granule
+) -> Iterator[Tuple[str, Measurement, Measurement]]:
+    """
+    The test and reference measurement pairs in the order they're
+    evaluated, skipping pairs that cannot be compared.
+    """
+
+    for measurement_name in doc_test.measurements:
+        test_measurement = doc_test.measurements[measurement_name]
+        reference_measurement = doc_reference.measurements[measurement_name]
+
+        if not (test_measurement.subset_shape() == reference_measurement.subset_shape()):
+            continue
+
+        if 0 in reference_measurement.subset_shape():
+            continue
+
+        if not reference_measurement.exists():
+            continue
+
+        if not test_measurement.exists():
+            continue
+
+        yield measurement_name, test_measurement, reference_measurement
+
+
+def _close(granule: PrefetchedGranule) -> None:
+    """Close any measurements and containers opened ahead of time."""
+
+    for _, test, reference in measurement_pairs(granule.doc_test, granule.doc_reference):
+        for measurement in (test, reference):
+            if not measurement.closed:
+                measurement.close()
+
+    granule.doc_test.close_containers()
+    granule.doc_reference.close_containers()
+
+
+def _load(
+    row: Any, prepare: Optional[Callable[[PrefetchedGranule], None]] = None
+) -> PrefetchedGranule:
+    """
+    Load the test and reference documents of a record, and apply the
+    prepare function (if given) prior to any measurements being read.
+    """
+
+    doc_test = load_odc_metadata(as_location(row.yaml_pathname_test))
+    doc_reference = load_odc_metadata(as_location(row.yaml_pathname_reference))
+
+    granule = PrefetchedGranule(row, doc_test, doc_reference)
+
+    if prepare is not None:
+        prepare(granule)
+
+    return granule
+
+
+@attr.s(auto_attribs=True)
+class GranulePrefetcher:
+    """
+    Iterates over the records of a dataframe, yielding the loaded
+    documents of each record in order, with up to `depth` records
+    loaded ahead of time by a background thread.
+
+    Measurements are decoded ahead of time (in the order they're
+    evaluated) while the decoded pixels of all records not yet yielded
+    are within `memory_limit` bytes. Once a record is yielded, its bytes
+    are no longer counted against the limit, so the resident pixels are
+    bounded by those of the current granule plus `memory_limit`.
+    """
+
+    dataframe: pandas.DataFrame
+    depth: int = 1
+    memory_limit: int = 1024 ** 3
+    prepare: Optional[Callable[[PrefetchedGranule], None]] = None
+    _queue: queue.Queue = attr.ib(init=False, repr=False)
+    _stop: threading.Event = attr.ib(factory=threading.Event, init=False, repr=False)
+    _lock: threading.Lock = attr.ib(factory=threading.Lock, init=False, repr=False)
+    _nbytes: int = attr.ib(default=0, init=False, repr=False)
+    _thread: Optional[threading.Thread] = attr.ib(default=None, init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        self._queue = queue.Queue(maxsize=max(self.depth, 1))
+
+    def _reserve(self, nbytes: int) -> bool:
+        """Reserve bytes against the memory limit if they'll fit."""
+
+        with self._lock:
+            if self._nbytes + nbytes > self.memory_limit:
+                return False
+            self._nbytes += nbytes
+
+        return True
+
+    def _release(self, nbytes: int) -> None:
+        """Release bytes previously reserved."""
+
+        with self._lock:
+            self._nbytes -= nbytes
+
+    def _decode(self, granule: PrefetchedGranule) -> None:
+        """Decode as many of the measurements as will fit within the limit."""
+
+        for name, test, reference in measurement_pairs(
+            granule.doc_test, granule.doc_reference
+        ):
+            if self._stop.is_set():
+                return
+
+            opened: List[Measurement] = []
+            try:
+                for measurement in (test, reference):
+                    measurement.open()
+                    opened.append(measurement)
+
+                nbytes = sum(
+                    int(numpy.prod(m.subset_shape())) * m.dtype().itemsize for m in opened
+                )
+                if not self._reserve(nbytes):
+                    for measurement in opened:
+                        measurement.close()
+                    return
+
+                for measurement in opened:
+                    measurement.read()
+                granule.nbytes += nbytes
+
+            except Exception:  # pylint: disable=broad-except
+                # leave it to the evaluation to handle and report the failure
+                _LOG.info("prefetch failed", measurement=name, exc_info=True)
+                for measurement in opened:
+                    measurement.close()
+                return
+
+    def _put(self, item: Optional[PrefetchedGranule]) -> bool:
+        """Queue an item, giving up if the prefetcher has been stopped."""
+
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def _run(self) -> None:
+        """Background loading of the records."""
+
+        for _, row in self.dataframe.iterrows():
+            # any failure is re-raised by the consumer, rather than silently
+            # ending the thread and leaving the consumer waiting on the queue
+            try:
+                granule = _load(row, self.prepare)
+                self._decode(granule)
+            except Exception as exc:  # pylint: disable=broad-except
+                granule = PrefetchedGranule(row, exception=exc)
+
+            if not self._put(granule):
+                if granule.exception is None:
+                    _close(granule)
+                return
+
+        self._put(None)
+
+    def __iter__(self) -> Iterator[PrefetchedGranule]:
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+        try:
+            while True:
+                granule = self._queue.get()
+                if granule is None:
+                    break
+
+                self._release(granule.nbytes)
+
+                if granule.exception is not None:
+                    raise granule.exception
+
+                yield granule
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Stop the background thread and release any prefetched data."""
+
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        while True:
+            try:
+                granule = self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if granule is None or granule.exception is not None:
+                continue
+
+            _close(granule)
+
+
+def iterate_granules(
+    dataframe: pandas.DataFrame,
+    depth: int = 0,
+    memory_limit: int = 1024 ** 3,
+    prepare: Optional[Callable[[PrefetchedGranule], None]] = None,
+) -> Iterator[PrefetchedGranule]:
+    """
+    Iterate over the records of a dataframe, yielding the loaded test
+    and reference documents. A depth of 0 loads each record in turn
+    without any read-ahead.
+    The prepare function is called with each loaded record, prior to
+    any of its measurements being read, e.g. to configure how the
+    measurements are to be read.
+    """
+
+    if depth > 0:
+        yield from GranulePrefetcher(dataframe, depth, memory_limit, prepare)
+    else:
+        for _, row in dataframe.iterrows():
+            yield _load(row, prepare)
@@ -211,11 +211,22 @@ def _write_metadata_sections(
         write_latex_document(out_string, out_fname)
 
 
-def _write_main_section(outdir: Path, template: str, n_datasets: int) -> None:
+def _write_main_section(
+    outdir: Path, template: str, n_datasets: int, decimation: int = 1
+) -> None:
     """Write the main level LaTeX document."""
 
     out_fname = outdir.joinpath(LatexSectionFnames.MAIN.value)
 
+    if decimation > 1:
+        quick_look = (
+            "The residuals were evaluated from quick-look reads of every "
+            f"{decimation}th pixel (using overviews where available), and the "
+            "reported statistics are \\textbf{approximate}.\\par"
+        )
+    else:
+        quick_look = ""
+
     # TODO VERSION
 
     out_string = template.format(
@@ -228,6 +239,7 @@ def _write_main_section(outdir: Path, template: str, n_datasets: int) -> None:
         oa_section=LatexSectionFnames.OA.value,
         n_datasets=n_datasets,
         version=version,
+        quick_look=quick_look,
     )
 
     write_latex_document(out_string, out_fname)
@@ -238,6 +250,7 @@ def latex_documents(
     dataframe: pandas.DataFrame,
     outdir: Path,
     n_datasets: int,
+    decimation: int = 1,
 ) -> None:
     """
     Utility to create the latex document strings.
@@ -255,6 +268,10 @@ def latex_documents(
 
     :param n_datasets:
         The number of datasets used in the intercomparison.
+
+    :param decimation:
+        The decimation factor of a quick-look intercomparison; a factor
+        greater than 1 labels the report's results as approximate.
     """
 
     def _reader(pathname: Path) -> str:
@@ -310,6 +327,6 @@ def latex_documents(
 
     # main document
     main_template = _reader(Path(SectionTemplates.MAIN.value))
-    _write_main_section(outdir, main_template, n_datasets)
+    _write_main_section(outdir, main_template, n_datasets, decimation)
 
     _LOG.info("finished writing LaTeX documents")
@@ -0,0 +1,157 @@
+"""
+Export of the residual (reference - test) images of selected measurements
+as tiled, compressed cloud optimised GeoTIFFs (with overviews).
+The residuals of each block are written as they're evaluated by the same
+pass that accumulates the statistics (see gost.utils.evaluate_blocks),
+so the measurements aren't read a second time. The blocks are written
+to an intermediate GeoTIFF, which is converted to a COG (or removed if
+the measurement doesn't meet the threshold) once the pass completes.
+"""
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import attr
+import numpy  # type: ignore
+import rasterio  # type: ignore
+import rasterio.shutil  # type: ignore
+from rasterio.windows import Window  # type: ignore
+import structlog  # type: ignore
+
+from gost.data_model import Measurement
+
+_LOG = structlog.get_logger()
+
+# creation options of the exported cloud optimised GeoTIFFs
+COG_OPTIONS: Dict[str, Any] = {
+    "compress": "deflate",
+    "predictor": "yes",
+    "blocksize": 512,
+    "overview_resampling": "nearest",
+    "num_threads": "all_cpus",
+}
+
+
+@attr.s(auto_attribs=True)
+class ResidualExport:
+    """
+    Selects the measurements whose residual image is exported.
+
+    :outdir:
+        The directory the images are written to; as
+        {outdir}/{granule_id}/{measurement}.tif.
+    :measurements:
+        The names of the measurements to export; all (general)
+        measurements if empty.
+    :granules:
+        The granule ids to export; all granules if empty.
+    :threshold:
+        Only retain the images whose maximum absolute residual (in the
+        units of the records) exceeds the threshold.
+    """
+
+    outdir: Path
+    measurements: List[str] = attr.ib(factory=list)
+    granules: List[str] = attr.ib(factory=list)
+    threshold: Optional[float] = None
+
+    def pathname(self, granule_id: str, measurement_name: str) -> Optional[Path]:
+        """The pathname of a measurement's image; None if it isn't selected."""
+
+        if self.measurements and measurement_name not in self.measurements:
+            return None
+
+        if self.granules and granule_id not in self.granules:
+            return None
+
+        return self.outdir.joinpath(granule_id, f"{measurement_name}.tif")
+
+    def retains(self, results: Dict[str, Any]) -> bool:
+        """Does a measurement's results meet the threshold."""
+
+        if self.threshold is None:
+            return True
+
+        return bool(results["max_absolute"] > self.threshold)
+
+
+def _nodata(dtype: numpy.dtype) -> Any:
+    """The nodata value of the residuals; NaN, or the minimum integer."""
+
+    if dtype.kind == "f":
+        return numpy.nan
+
+    return numpy.iinfo(dtype).min
+
+
+@attr.s(auto_attribs=True)
+class ResidualWriter:
+    """
+    Writes the residual image of a measurement a block at a time.
+
+    :pathname:
+        The pathname of the exported COG.
+    :dataset:
+        The intermediate (tiled) GeoTIFF the blocks are written to.
+    """
+
+    pathname: Path
+    dataset: Any
+
+    @classmethod
+    def create(
+        cls, pathname: Path, measurement: Measurement, dtype: numpy.dtype
+    ) -> "ResidualWriter":
+        """Create the intermediate GeoTIFF on the grid of an opened measurement."""
+
+        source = measurement.dataset
+        height, width = measurement.subset_shape()
+        if measurement.subset is None:
+            transform = source.transform
+        else:
+            transform = source.window_transform(measurement.subset)
+
+        pathname.parent.mkdir(parents=True, exist_ok=True)
+        dataset = rasterio.open(
+            pathname.with_suffix(".tmp.tif"),
+            "w",
+            driver="GTiff",
+            height=height,
+            width=width,
+            count=1,
+            dtype=dtype,
+            nodata=_nodata(numpy.dtype(dtype)),
+            crs=source.crs,
+            transform=transform,
+            tiled=True,
+            blockxsize=512,
+            blockysize=512,
+            bigtiff="if_safer",
+        )
+
+        return cls(pathname, dataset)
+
+    def write(self, window: Window, residual: numpy.ndarray, mask: numpy.ndarray) -> None:
+        """
+        Write the residuals of a block; the residuals of the valid pixels
+        (mask) of the window (relative to the subset of the measurement
+        being evaluated), as evaluated for the statistics.
+        """
+
+        image = numpy.full(mask.shape, self.dataset.nodata, dtype=residual.dtype)
+        image[mask] = residual
+        self.dataset.write(image, 1, window=window)
+
+    def close(self, retain: bool = True) -> None:
+        """
+        Close the intermediate GeoTIFF, and convert it to a COG if it's to
+        be retained; the intermediate file is removed.
+        """
+
+        self.dataset.close()
+        intermediate = Path(self.dataset.name)
+
+        if retain:
+            rasterio.shutil.copy(intermediate, self.pathname, driver="COG", **COG_OPTIONS)
+            _LOG.info("exported residuals", pathname=str(self.pathname))
+
+        intermediate.unlink()
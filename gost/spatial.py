@@ -0,0 +1,126 @@
+"""
+Statistics of the residuals over a coarse grid of cells covering a
+measurement (e.g. 32x32 cells), accumulated by the same pass that
+evaluates the residual statistics. The small per-cell arrays are stored
+with the results, so the hotspots of a measurement can be mapped without
+reading its pixels again.
+"""
+
+from typing import Dict, Optional, Tuple
+import attr
+import h5py  # type: ignore
+import numpy  # type: ignore
+from rasterio.windows import Window  # type: ignore
+
+SPATIAL_GRID: Tuple[int, int] = (32, 32)
+
+
+@attr.s(auto_attribs=True)
+class SpatialStatistics:
+    """
+    Accumulates the residuals of each cell of a grid covering an image.
+    Each cell covers an equal share (to within a pixel) of the image's
+    rows and columns.
+
+    :shape:
+        The (height, width) of the image being evaluated.
+    :grid:
+        The (rows, columns) of cells.
+    :count:
+        The number of valid pixels of each cell.
+    :total:
+        The sum of the residuals of each cell.
+    :max_absolute:
+        The maximum absolute residual of each cell.
+    :n_nonzero:
+        The number of non-zero residuals of each cell.
+    """
+
+    shape: Tuple[int, int]
+    grid: Tuple[int, int] = SPATIAL_GRID
+    count: numpy.ndarray = attr.ib(init=False)
+    total: numpy.ndarray = attr.ib(init=False)
+    max_absolute: numpy.ndarray = attr.ib(init=False)
+    n_nonzero: numpy.ndarray = attr.ib(init=False)
+
+    def __attrs_post_init__(self) -> None:
+        self.grid = tuple(self.grid)
+        self.count = numpy.zeros(self.grid, dtype="int64")
+        self.total = numpy.zeros(self.grid, dtype="float64")
+        self.max_absolute = numpy.zeros(self.grid, dtype="float64")
+        self.n_nonzero = numpy.zeros(self.grid, dtype="int64")
+
+    def update(
+        self,
+        residual: numpy.ndarray,
+        mask: numpy.ndarray,
+        window: Optional[Window] = None,
+    ) -> None:
+        """
+        Add the residuals of the valid pixels (mask) of a window of the
+        image; the whole image if the window isn't given. The residuals
+        are those of mask, in (row-major) order, i.e. data[mask].
+        """
+
+        height, width = self.shape
+        rows, columns = self.grid
+
+        if window is None:
+            row_off, col_off = 0, 0
+        else:
+            row_off, col_off = window.row_off, window.col_off
+
+        row_cells = numpy.arange(row_off, row_off + mask.shape[0]) * rows // height
+        col_cells = numpy.arange(col_off, col_off + mask.shape[1]) * columns // width
+
+        # the rows of each row of cells are contiguous, as are their residuals
+        splits = numpy.flatnonzero(numpy.diff(row_cells)) + 1
+        start = 0
+        bands = zip(row_cells[numpy.r_[0, splits]], numpy.split(mask, splits))
+        for row_cell, band in bands:
+            cells = numpy.broadcast_to(col_cells, band.shape)[band]
+            values = residual[start : start + cells.size]
+            start += cells.size
+
+            nonzero = values != 0
+            self.count[row_cell] += numpy.bincount(cells, minlength=columns)
+            self.total[row_cell] += numpy.bincount(cells, values, minlength=columns)
+            self.n_nonzero[row_cell] += numpy.bincount(cells[nonzero], minlength=columns)
+
+            absolute = numpy.abs(values[nonzero], dtype="float64")
+            numpy.maximum.at(self.max_absolute[row_cell], cells[nonzero], absolute)
+
+    def summary(self, scale: float = 1.0) -> Dict[str, numpy.ndarray]:
+        """
+        The statistics of each cell; cells without valid pixels are NaN.
+        The residuals are multiplied by scale, e.g. to percent reflectance.
+        """
+
+        empty = self.count == 0
+        count = numpy.where(empty, 1, self.count)
+
+        def _cells(values: numpy.ndarray) -> numpy.ndarray:
+            return numpy.where(empty, numpy.nan, values)
+
+        return {
+            "count": self.count,
+            "mean_residual": _cells(self.total / count * scale),
+            "max_absolute": _cells(self.max_absolute * scale),
+            "percent_different": _cells(self.n_nonzero / count * 100),
+        }
+
+
+def write_spatial(
+    group: h5py.Group,
+    granule_id: str,
+    measurement_name: str,
+    summary: Dict[str, numpy.ndarray],
+) -> None:
+    """
+    Write the summary of a measurement's cells as datasets of the group
+    {granule_id}/{measurement_name} of a HDF5 file or group.
+    """
+
+    cells = group.require_group(granule_id).create_group(measurement_name)
+    for key, value in summary.items():
+        cells.create_dataset(key, data=value)
@@ -0,0 +1,995 @@
+"""
+Accumulators for evaluating the statistics of the residuals a chunk at
+a time, rather than requiring the full residual array to be held in
+memory.
+Each accumulator can be updated with successive chunks of data, and
+merged with another accumulator of the same type, which allows the
+statistics to be built from the internal blocks of a raster.
+The accumulators serialise to a compact dict (histograms hold only their
+occupied bins), which is used when pickling them between MPI ranks, and
+when storing them in a HDF5 group.
+"""
+
+import math
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import attr
+import h5py  # type: ignore
+import numpy  # type: ignore
+
+PERCENTILES: List[float] = [0.9, 0.99]
+
+# proportion of the residuals cut from each tail for the trimmed mean
+TRIM_PROPORTION: float = 0.1
+
+# number of residuals evaluated at a time by residual_kernel
+KERNEL_CHUNK_SIZE: int = 1024 ** 2
+
+# relative error of the quantiles of floating point residuals, and the
+# bound on the number of bins of their sketches
+SKETCH_RELATIVE_ACCURACY: float = 0.005
+SKETCH_MAX_BINS: int = 4096
+
+# values below this are counted as zeros by the sketches
+_SKETCH_MIN_VALUE: float = 1e-30
+
+
+def residual_dtype(ref_dtype: numpy.dtype, test_dtype: numpy.dtype) -> numpy.dtype:
+    """
+    The datatype of the residuals (reference - test); the narrowest signed
+    integer able to hold the difference of any two integer values (e.g.
+    uint8 -> int16, int16 -> int32), rather than numpy's promotion which
+    wraps around. Floating point data retains numpy's promotion (float32
+    residuals remain float32), and the statistics are accumulated in
+    float64 a chunk at a time.
+    """
+
+    ref_dtype = numpy.dtype(ref_dtype)
+    test_dtype = numpy.dtype(test_dtype)
+
+    if ref_dtype.kind not in "iu" or test_dtype.kind not in "iu":
+        return numpy.result_type(ref_dtype, test_dtype)
+
+    lower = int(numpy.iinfo(ref_dtype).min) - int(numpy.iinfo(test_dtype).max)
+    upper = int(numpy.iinfo(ref_dtype).max) - int(numpy.iinfo(test_dtype).min)
+
+    for dtype in ("int8", "int16", "int32"):
+        info = numpy.iinfo(dtype)
+        if info.min <= lower and upper <= info.max:
+            return numpy.dtype(dtype)
+
+    return numpy.dtype("int64")
+
+
+def residual(ref_data: numpy.ndarray, test_data: numpy.ndarray) -> numpy.ndarray:
+    """The residuals (reference - test), using the datatype of residual_dtype."""
+
+    dtype = residual_dtype(ref_data.dtype, test_data.dtype)
+
+    return numpy.subtract(ref_data, test_data, dtype=dtype, casting="unsafe")
+
+
+@attr.s(auto_attribs=True)
+class Moments:
+    """
+    Running count, mean, and sums of the 2nd, 3rd and 4th powers of the
+    deviations from the mean.
+    Chunks are combined using the pairwise formulae of Pébay (2008),
+    which are numerically stable, unlike raw power sums.
+    """
+
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    m3: float = 0.0
+    m4: float = 0.0
+
+    def update(self, data: numpy.ndarray) -> None:
+        """Update the moments with a chunk of data."""
+
+        if data.size == 0:
+            return
+
+        values = data.astype("float64")
+        mean = values.mean()
+        dev = values - mean
+        dev2 = dev * dev
+
+        chunk = Moments(
+            count=int(values.size),
+            mean=float(mean),
+            m2=float(dev2.sum()),
+            m3=float((dev2 * dev).sum()),
+            m4=float((dev2 * dev2).sum()),
+        )
+
+        self.merge(chunk)
+
+    def update_histogram(self, values: numpy.ndarray, counts: numpy.ndarray) -> None:
+        """
+        Update the moments with a chunk of data given as a histogram of
+        its distinct values, e.g. the bins of an integer histogram. Only
+        the occupied bins are evaluated, rather than every value.
+        """
+
+        occupied = counts != 0
+        values = values[occupied].astype("float64")
+        counts = counts[occupied].astype("float64")
+
+        count = counts.sum()
+        if count == 0:
+            return
+
+        mean = (values * counts).sum() / count
+        dev = values - mean
+        dev2 = dev * dev
+
+        chunk = Moments(
+            count=int(count),
+            mean=float(mean),
+            m2=float((dev2 * counts).sum()),
+            m3=float((dev2 * dev * counts).sum()),
+            m4=float((dev2 * dev2 * counts).sum()),
+        )
+
+        self.merge(chunk)
+
+    def merge(self, other: "Moments") -> None:
+        """Merge the moments of another accumulator into this one."""
+
+        if other.count == 0:
+            return
+
+        if self.count == 0:
+            self.count = other.count
+            self.mean = other.mean
+            self.m2 = other.m2
+            self.m3 = other.m3
+            self.m4 = other.m4
+            return
+
+        n_a = self.count
+        n_b = other.count
+        n = n_a + n_b
+        delta = other.mean - self.mean
+        delta_n = delta / n
+
+        m2 = self.m2 + other.m2 + delta * delta_n * n_a * n_b
+
+        m3 = self.m3 + other.m3
+        m3 += delta * delta_n ** 2 * n_a * n_b * (n_a - n_b)
+        m3 += 3 * delta_n * (n_a * other.m2 - n_b * self.m2)
+
+        m4 = self.m4 + other.m4
+        m4 += delta * delta_n ** 3 * n_a * n_b * (n_a * n_a - n_a * n_b + n_b * n_b)
+        m4 += 6 * delta_n ** 2 * (n_a * n_a * other.m2 + n_b * n_b * self.m2)
+        m4 += 4 * delta_n * (n_a * other.m3 - n_b * self.m3)
+
+        self.mean = self.mean + delta_n * n_b
+        self.count = n
+        self.m2 = m2
+        self.m3 = m3
+        self.m4 = m4
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialise the moments."""
+
+        return attr.asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Moments":
+        """Restore the moments serialised by to_dict."""
+
+        return cls(
+            count=int(data["count"]),
+            mean=float(data["mean"]),
+            m2=float(data["m2"]),
+            m3=float(data["m3"]),
+            m4=float(data["m4"]),
+        )
+
+    def standard_deviation(self, ddof: int = 1) -> float:
+        """Standard deviation; ddof as per numpy.std."""
+
+        if self.count - ddof <= 0:
+            return math.nan
+
+        return math.sqrt(self.m2 / (self.count - ddof))
+
+    def skewness(self) -> float:
+        """Biased sample skewness; as per scipy.stats.skew."""
+
+        if self.count == 0 or self.m2 == 0:
+            return math.nan
+
+        return (self.m3 / self.count) / (self.m2 / self.count) ** 1.5
+
+    def kurtosis(self) -> float:
+        """Biased Fisher kurtosis; as per scipy.stats.kurtosis."""
+
+        if self.count == 0 or self.m2 == 0:
+            return math.nan
+
+        return (self.m4 / self.count) / (self.m2 / self.count) ** 2 - 3
+
+
+def bincount(data: numpy.ndarray) -> Tuple[int, numpy.ndarray]:
+    """
+    Counts of each integer value from the minimum to the maximum value.
+    Returns the minimum value, and the counts.
+    """
+
+    minv = int(data.min())
+    maxv = int(data.max())
+
+    # promote prior to the subtraction, which can otherwise overflow
+    values = data.astype("int64").ravel() - minv
+    counts = numpy.bincount(values, minlength=maxv - minv + 1)
+
+    return minv, counts
+
+
+def _scalar(value: Any) -> Any:
+    """A python scalar from a numpy scalar, e.g. as read from a HDF5 attribute."""
+
+    return value.item() if hasattr(value, "item") else value
+
+
+def _sparse(counts: numpy.ndarray) -> Dict[str, numpy.ndarray]:
+    """
+    The index and count of the occupied bins of a histogram, each using
+    the smallest unsigned type able to hold them.
+    """
+
+    index = numpy.flatnonzero(counts)
+    occupied = counts[index]
+
+    return {
+        "index": index.astype(numpy.min_scalar_type(max(counts.size - 1, 0))),
+        "counts": occupied.astype(numpy.min_scalar_type(occupied.max(initial=0))),
+    }
+
+
+def _dense(size: int, index: numpy.ndarray, counts: numpy.ndarray) -> numpy.ndarray:
+    """The full histogram counts from the occupied bins returned by _sparse."""
+
+    dense = numpy.zeros(size, dtype="int64")
+    dense[numpy.asarray(index, dtype="int64")] = counts
+
+    return dense
+
+
+@attr.s(auto_attribs=True)
+class IntegerHistogram:
+    """
+    Histogram of integer data using a binsize of 1.
+    The range of the histogram grows as required by each chunk, and
+    `offset` is the value of the first bin.
+    """
+
+    offset: int = 0
+    counts: numpy.ndarray = attr.ib(factory=lambda: numpy.zeros(0, dtype="int64"))
+
+    def _extend(self, minv: int, maxv: int) -> None:
+        """Extend the range of the histogram to include [minv, maxv]."""
+
+        if self.counts.size == 0:
+            self.offset = minv
+            self.counts = numpy.zeros(maxv - minv + 1, dtype="int64")
+            return
+
+        upper = self.offset + self.counts.size - 1
+        new_offset = min(self.offset, minv)
+        new_upper = max(upper, maxv)
+
+        if new_offset == self.offset and new_upper == upper:
+            return
+
+        counts = numpy.zeros(new_upper - new_offset + 1, dtype="int64")
+        start = self.offset - new_offset
+        counts[start : start + self.counts.size] = self.counts
+
+        self.offset = new_offset
+        self.counts = counts
+
+    def update(self, data: numpy.ndarray) -> None:
+        """Update the histogram with a chunk of integer data."""
+
+        if data.size == 0:
+            return
+
+        self.add_counts(*bincount(data))
+
+    def add_counts(self, offset: int, counts: numpy.ndarray) -> None:
+        """Add the counts of another binning, whose first bin is offset."""
+
+        if counts.size == 0:
+            return
+
+        self._extend(offset, offset + counts.size - 1)
+
+        start = offset - self.offset
+        self.counts[start : start + counts.size] += counts
+
+    def add(self, value: int, count: int) -> None:
+        """Add a count of a single value."""
+
+        self._extend(value, value)
+        self.counts[value - self.offset] += count
+
+    def merge(self, other: "IntegerHistogram") -> None:
+        """Merge the counts of another histogram into this one."""
+
+        self.add_counts(other.offset, other.counts)
+
+    def locations(self) -> numpy.ndarray:
+        """The value of each bin."""
+
+        return self.offset + numpy.arange(self.counts.size)
+
+    def fold(self) -> "IntegerHistogram":
+        """
+        The histogram of the absolute values, by folding the negative bins
+        onto the positive bins. The bins below the minimum absolute value
+        are trimmed.
+        """
+
+        folded = IntegerHistogram()
+        if self.counts.size == 0:
+            return folded
+
+        upper = self.offset + self.counts.size - 1
+        max_absolute = max(abs(self.offset), abs(upper))
+        counts = numpy.zeros(max_absolute + 1, dtype="int64")
+
+        # each absolute value occurs at most once on either side of zero
+        values = self.locations()
+        positive = values >= 0
+        counts[values[positive]] += self.counts[positive]
+        counts[-values[~positive]] += self.counts[~positive]
+
+        occupied = numpy.flatnonzero(counts)
+        start = int(occupied[0]) if occupied.size else 0
+
+        folded.offset = start
+        folded.counts = counts[start:]
+
+        return folded
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialise the histogram; only the occupied bins are retained."""
+
+        result: Dict[str, Any] = {"offset": self.offset, "size": self.counts.size}
+        result.update(_sparse(self.counts))
+
+        return result
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "IntegerHistogram":
+        """Restore the histogram serialised by to_dict."""
+
+        counts = _dense(int(data["size"]), data["index"], data["counts"])
+
+        return cls(offset=int(data["offset"]), counts=counts)
+
+    def __reduce__(self):
+        return (self.from_dict, (self.to_dict(),))
+
+
+@attr.s(auto_attribs=True)
+class QuantileSketch:
+    """
+    Relative error quantile sketch of non-negative values (DDSketch;
+    Masson et al. 2019). Values are binned by their logarithmic index,
+    ceil(log(value) / log(gamma)) where gamma = (1 + a) / (1 - a), so that
+    each quantile is estimated within a relative error, a, of its value.
+    The bins are held by an IntegerHistogram, so an update is a bincount
+    of a chunk, and a merge is exact (independent of the order of the
+    chunks, granules or ranks merged). The number of bins is bounded by
+    max_bins, by collapsing the lowest bins (the accuracy of the upper
+    quantiles is retained).
+
+    :relative_accuracy:
+        The relative error guaranteed for the quantiles.
+    :max_bins:
+        The maximum number of bins retained.
+    :zero_count:
+        Number of values too small to be indexed, i.e. zeros.
+    :bins:
+        Counts of the values by their logarithmic index.
+    :non_finite:
+        Number of NaN or infinite values given, which are excluded from
+        the quantiles (and the count).
+    """
+
+    relative_accuracy: float = SKETCH_RELATIVE_ACCURACY
+    max_bins: int = SKETCH_MAX_BINS
+    zero_count: int = 0
+    bins: IntegerHistogram = attr.ib(factory=IntegerHistogram)
+    non_finite: int = 0
+
+    @property
+    def gamma(self) -> float:
+        """The ratio of the upper to lower value of each bin."""
+
+        return (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+
+    @property
+    def count(self) -> int:
+        """Number of (finite) values sketched."""
+
+        return self.zero_count + int(self.bins.counts.sum())
+
+    def update(self, data: numpy.ndarray) -> None:
+        """Update the sketch with a chunk of non-negative values."""
+
+        if data.size == 0:
+            return
+
+        values = data.astype("float64", copy=False)
+
+        # NaN would be taken as zero, and inf can't be indexed
+        finite = numpy.isfinite(values)
+        if not finite.all():
+            self.non_finite += int(values.size - numpy.count_nonzero(finite))
+            values = values[finite]
+
+        indexable = values > _SKETCH_MIN_VALUE
+        self.zero_count += int(values.size - numpy.count_nonzero(indexable))
+
+        if indexable.any():
+            index = numpy.ceil(numpy.log(values[indexable]) / math.log(self.gamma))
+            self.bins.update(index.astype("int64"))
+            self._collapse()
+
+    def add(self, value: float, count: int) -> None:
+        """Add a count of a single non-negative value."""
+
+        if not math.isfinite(value):
+            self.non_finite += count
+            return
+
+        if value <= _SKETCH_MIN_VALUE:
+            self.zero_count += count
+            return
+
+        self.bins.add(math.ceil(math.log(value) / math.log(self.gamma)), count)
+        self._collapse()
+
+    def _collapse(self) -> None:
+        """Collapse the lowest bins into one, to retain at most max_bins."""
+
+        excess = self.bins.counts.size - self.max_bins
+        if excess <= 0:
+            return
+
+        counts = self.bins.counts[excess:].copy()
+        counts[0] += self.bins.counts[:excess].sum()
+        self.bins = IntegerHistogram(self.bins.offset + excess, counts)
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """Merge the counts of another sketch of the same relative accuracy."""
+
+        if self.relative_accuracy != other.relative_accuracy:
+            raise ValueError("sketches have different relative accuracy")
+
+        self.zero_count += other.zero_count
+        self.non_finite += other.non_finite
+        self.bins.merge(other.bins)
+        self._collapse()
+
+    def quantiles(self, percentiles: List[float]) -> List[float]:
+        """
+        The values at the percentiles (as fractions), using the same rank
+        as histogram_percentiles, i.e. the first value whose cumulative
+        count reaches the percentile.
+        """
+
+        total = self.count
+        if total == 0:
+            return [math.nan for _ in percentiles]
+
+        counts = numpy.concatenate([[self.zero_count], self.bins.counts])
+        cumulative = numpy.cumsum(counts)
+        idx = numpy.searchsorted(cumulative, numpy.multiply(percentiles, total))
+
+        # the value of a bin is the value with the least relative error
+        gamma = self.gamma
+        values = 2 * gamma ** self.bins.locations().astype("float64") / (gamma + 1)
+        values = numpy.concatenate([[0.0], values])
+
+        return [values[i].item() for i in idx]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialise the sketch; only the occupied bins are retained."""
+
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "max_bins": self.max_bins,
+            "zero_count": self.zero_count,
+            "bins": self.bins.to_dict(),
+            "non_finite": self.non_finite,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QuantileSketch":
+        """Restore the sketch serialised by to_dict."""
+
+        return cls(
+            relative_accuracy=float(data["relative_accuracy"]),
+            max_bins=int(data["max_bins"]),
+            zero_count=int(data["zero_count"]),
+            bins=IntegerHistogram.from_dict(data["bins"]),
+            non_finite=int(data.get("non_finite", 0)),
+        )
+
+
+def histogram_percentiles(
+    counts: numpy.ndarray, locations: numpy.ndarray, percentiles: List[float]
+) -> List[float]:
+    """
+    Percentiles from the cumulative distribution of a histogram; the
+    location of the first bin whose cumulative count reaches the
+    percentile. For a histogram with a binsize of 1 (integer data) the
+    percentiles are exact.
+    """
+
+    total = counts.sum()
+    if total == 0:
+        return [math.nan for _ in percentiles]
+
+    # integer cumulative counts avoid the rounding of a normalised cdf
+    cumulative = numpy.cumsum(counts)
+    idx = numpy.searchsorted(cumulative, numpy.multiply(percentiles, total))
+
+    return [locations[i].item() for i in idx]
+
+
+def _ranked_values(
+    values: numpy.ndarray, cumulative: numpy.ndarray, ranks: numpy.ndarray
+) -> numpy.ndarray:
+    """The values at the (0 based) ranks of sorted histogram values."""
+
+    return values[numpy.searchsorted(cumulative, ranks, side="right")]
+
+
+def histogram_median(values: numpy.ndarray, counts: numpy.ndarray) -> float:
+    """
+    Exact median of the data described by a histogram of its (sorted)
+    distinct values; the mean of the two middle values for an even count,
+    as per numpy.median.
+    """
+
+    total = int(counts.sum())
+    if total == 0:
+        return math.nan
+
+    middle = numpy.array([(total - 1) // 2, total // 2])
+    ranked = _ranked_values(values, numpy.cumsum(counts), middle)
+
+    return float(ranked.astype("float64").mean())
+
+
+def histogram_mad(values: numpy.ndarray, counts: numpy.ndarray) -> float:
+    """
+    Exact median absolute deviation (from the median), unscaled, of the
+    data described by a histogram of its (sorted) distinct values.
+    Only the occupied bins are evaluated.
+    """
+
+    occupied = counts != 0
+    values = values[occupied].astype("float64")
+    counts = counts[occupied]
+
+    if counts.size == 0:
+        return math.nan
+
+    deviations = numpy.abs(values - histogram_median(values, counts))
+    order = numpy.argsort(deviations, kind="stable")
+
+    return histogram_median(deviations[order], counts[order])
+
+
+def histogram_trimmed_mean(
+    values: numpy.ndarray, counts: numpy.ndarray, proportion: float = TRIM_PROPORTION
+) -> float:
+    """
+    Exact trimmed mean of the data described by a histogram of its
+    (sorted) distinct values; int(proportion * count) values are cut
+    from each tail, as per scipy.stats.trim_mean.
+    """
+
+    total = int(counts.sum())
+    cut = int(proportion * total)
+    if total - 2 * cut <= 0:
+        return math.nan
+
+    # counts of each bin remaining once the tails are cut
+    cumulative = numpy.cumsum(counts)
+    upper = numpy.minimum(cumulative, total - cut)
+    lower = numpy.maximum(cumulative - counts, cut)
+    kept = numpy.clip(upper - lower, 0, None)
+
+    return float((values.astype("float64") * kept).sum() / kept.sum())
+
+
+@attr.s(auto_attribs=True)
+class ResidualAccumulator:
+    """
+    Accumulates the statistics of the residuals used to populate the
+    general measurement records.
+    Integer residuals are evaluated in a single pass of each chunk, by
+    accumulating the signed histogram of the residuals. The moments,
+    range and count of non-zero residuals are evaluated from the
+    histogram of each chunk, and the absolute value histogram (for the
+    percentiles) by folding the signed histogram.
+    Floating point residuals are evaluated in a single pass, with the
+    percentiles of the absolute residuals estimated by a QuantileSketch
+    (within relative_accuracy of their value).
+    """
+
+    moments: Moments = attr.ib(factory=Moments)
+    minv: float = math.inf
+    maxv: float = -math.inf
+    min_absolute: float = math.inf
+    max_absolute: float = -math.inf
+    n_nonzero: int = 0
+    histogram: Optional[IntegerHistogram] = None
+    sketch: Optional[QuantileSketch] = None
+    relative_accuracy: float = SKETCH_RELATIVE_ACCURACY
+
+    @property
+    def count(self) -> int:
+        """Number of residuals accumulated."""
+
+        return self.moments.count
+
+    def update(self, residual: numpy.ndarray) -> None:
+        """Update the statistics with a chunk of residuals."""
+
+        if residual.size == 0:
+            return
+
+        if residual.dtype.kind in "iu":
+            self._update_integer(residual)
+            return
+
+        abs_residual = numpy.abs(residual)
+
+        self.minv = min(self.minv, residual.min().item())
+        self.maxv = max(self.maxv, residual.max().item())
+        self.min_absolute = min(self.min_absolute, abs_residual.min().item())
+        self.max_absolute = max(self.max_absolute, abs_residual.max().item())
+        self.n_nonzero += int(numpy.count_nonzero(residual))
+        self.moments.update(residual)
+
+        if self.sketch is None:
+            self.sketch = QuantileSketch(self.relative_accuracy)
+        self.sketch.update(abs_residual)
+
+    def _update_integer(self, residual: numpy.ndarray) -> None:
+        """
+        Single pass update with a chunk of integer residuals; the only
+        pass over the residuals is the bincount.
+        """
+
+        self.update_counts(*bincount(residual))
+
+    def update_counts(self, offset: int, counts: numpy.ndarray) -> None:
+        """
+        Update the statistics with the counts of each integer residual
+        value of a chunk, whose first bin is offset; e.g. a band of the
+        combined bincount of a stack of bands.
+        """
+
+        occupied = numpy.flatnonzero(counts)
+        if occupied.size == 0:
+            return
+
+        # trim to the range of the residuals
+        offset += int(occupied[0])
+        counts = counts[occupied[0] : occupied[-1] + 1]
+
+        values = offset + numpy.arange(counts.size)
+        abs_values = numpy.abs(values[counts != 0])
+
+        self.minv = min(self.minv, offset)
+        self.maxv = max(self.maxv, offset + counts.size - 1)
+        self.min_absolute = min(self.min_absolute, int(abs_values.min()))
+        self.max_absolute = max(self.max_absolute, int(abs_values.max()))
+        zeros = counts[-offset] if offset <= 0 < offset + counts.size else 0
+        self.n_nonzero += int(counts.sum() - zeros)
+        self.moments.update_histogram(values, counts)
+
+        if self.histogram is None:
+            self.histogram = IntegerHistogram()
+        self.histogram.add_counts(offset, counts)
+
+    def update_zeros(self, count: int, dtype: numpy.dtype) -> None:
+        """
+        Update the statistics with a count of zero valued residuals, e.g.
+        from blocks known to be identical, without creating the array.
+        """
+
+        if count == 0:
+            return
+
+        self.minv = min(self.minv, 0)
+        self.maxv = max(self.maxv, 0)
+        self.min_absolute = min(self.min_absolute, 0)
+        self.max_absolute = max(self.max_absolute, 0)
+        self.moments.merge(Moments(count=count))
+
+        if numpy.dtype(dtype).kind in "iu":
+            if self.histogram is None:
+                self.histogram = IntegerHistogram()
+            self.histogram.add(0, count)
+        else:
+            if self.sketch is None:
+                self.sketch = QuantileSketch(self.relative_accuracy)
+            self.sketch.add(0.0, count)
+
+    def merge(self, other: "ResidualAccumulator") -> None:
+        """Merge the statistics of another accumulator into this one."""
+
+        self.minv = min(self.minv, other.minv)
+        self.maxv = max(self.maxv, other.maxv)
+        self.min_absolute = min(self.min_absolute, other.min_absolute)
+        self.max_absolute = max(self.max_absolute, other.max_absolute)
+        self.n_nonzero += other.n_nonzero
+        self.moments.merge(other.moments)
+
+        if other.histogram is not None:
+            if self.histogram is None:
+                self.histogram = IntegerHistogram()
+            self.histogram.merge(other.histogram)
+
+        if other.sketch is not None:
+            if self.sketch is None:
+                self.sketch = QuantileSketch(
+                    other.sketch.relative_accuracy, other.sketch.max_bins
+                )
+            self.sketch.merge(other.sketch)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialise the statistics; histograms that are absent are omitted."""
+
+        result: Dict[str, Any] = {
+            "moments": self.moments.to_dict(),
+            "minv": self.minv,
+            "maxv": self.maxv,
+            "min_absolute": self.min_absolute,
+            "max_absolute": self.max_absolute,
+            "n_nonzero": self.n_nonzero,
+            "relative_accuracy": self.relative_accuracy,
+        }
+
+        if self.histogram is not None:
+            result["histogram"] = self.histogram.to_dict()
+
+        if self.sketch is not None:
+            result["sketch"] = self.sketch.to_dict()
+
+        return result
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ResidualAccumulator":
+        """Restore the statistics serialised by to_dict."""
+
+        accumulator = cls(
+            moments=Moments.from_dict(data["moments"]),
+            minv=_scalar(data["minv"]),
+            maxv=_scalar(data["maxv"]),
+            min_absolute=_scalar(data["min_absolute"]),
+            max_absolute=_scalar(data["max_absolute"]),
+            n_nonzero=int(data["n_nonzero"]),
+            relative_accuracy=float(
+                data.get("relative_accuracy", SKETCH_RELATIVE_ACCURACY)
+            ),
+        )
+
+        if "histogram" in data:
+            accumulator.histogram = IntegerHistogram.from_dict(data["histogram"])
+
+        if "sketch" in data:
+            accumulator.sketch = QuantileSketch.from_dict(data["sketch"])
+
+        return accumulator
+
+    def summary(self) -> Dict[str, float]:
+        """
+        The statistics as named by the general measurement records.
+        """
+
+        if self.count == 0:
+            keys = [
+                "min_residual",
+                "max_residual",
+                "max_absolute",
+                "percent_different",
+                "percentile_90",
+                "percentile_99",
+                "mean_residual",
+                "standard_deviation",
+                "skewness",
+                "kurtosis",
+                "median_residual",
+                "median_absolute_deviation",
+                "trimmed_mean_residual",
+            ]
+            return {key: math.nan for key in keys}
+
+        if self.histogram is not None:
+            hist = self.histogram.fold()
+            pct_90, pct_99 = histogram_percentiles(
+                hist.counts, hist.locations(), PERCENTILES
+            )
+        elif self.sketch is not None:
+            # the estimates are within the observed range
+            pct_90, pct_99 = [
+                min(max(value, self.min_absolute), self.max_absolute)
+                for value in self.sketch.quantiles(PERCENTILES)
+            ]
+        else:
+            pct_90, pct_99 = math.nan, math.nan
+
+        result = {
+            "min_residual": self.minv,
+            "max_residual": self.maxv,
+            "max_absolute": self.max_absolute,
+            "percent_different": self.n_nonzero / self.count * 100,
+            "percentile_90": pct_90,
+            "percentile_99": pct_99,
+            "mean_residual": self.moments.mean,
+            "standard_deviation": self.moments.standard_deviation(ddof=1),
+            "skewness": self.moments.skewness(),
+            "kurtosis": self.moments.kurtosis(),
+        }
+        result.update(self.robust_statistics())
+
+        return result
+
+    def robust_statistics(self) -> Dict[str, float]:
+        """
+        The median, median absolute deviation and trimmed mean of the
+        residuals; exact for integer residuals, evaluated from the signed
+        histogram in O(range) time. Undefined (NaN) for floating point
+        residuals.
+        """
+
+        if self.histogram is None or self.count == 0:
+            return {
+                "median_residual": math.nan,
+                "median_absolute_deviation": math.nan,
+                "trimmed_mean_residual": math.nan,
+            }
+
+        values = self.histogram.locations()
+        counts = self.histogram.counts
+
+        return {
+            "median_residual": histogram_median(values, counts),
+            "median_absolute_deviation": histogram_mad(values, counts),
+            "trimmed_mean_residual": histogram_trimmed_mean(values, counts),
+        }
+
+
+def residual_kernel(
+    residual: numpy.ndarray,
+    chunk_size: int = KERNEL_CHUNK_SIZE,
+    relative_accuracy: float = SKETCH_RELATIVE_ACCURACY,
+) -> ResidualAccumulator:
+    """
+    Evaluate the statistics of an in-memory residual array a chunk at a
+    time, so the temporaries are bounded by the chunk size rather than
+    being full copies of the residuals (see ResidualAccumulator).
+    """
+
+    accumulator = ResidualAccumulator(relative_accuracy=relative_accuracy)
+    residual = residual.ravel()
+
+    for start in range(0, residual.size, chunk_size):
+        accumulator.update(residual[start : start + chunk_size])
+
+    return accumulator
+
+
+def stack_kernel(
+    residual: numpy.ndarray,
+    band_counts: numpy.ndarray,
+    chunk_size: int = KERNEL_CHUNK_SIZE,
+    relative_accuracy: float = SKETCH_RELATIVE_ACCURACY,
+) -> List[ResidualAccumulator]:
+    """
+    Evaluate the statistics of the residuals of a stack of bands, given
+    as the concatenated residuals of each band (in band order) and the
+    number of residuals of each band.
+    Integer residuals of all bands are binned into a single (bands, range)
+    matrix of counts, a chunk of a band at a time so the temporaries are
+    bounded by the chunk size, and each band's statistics are derived
+    from its row of the counts. Floating point residuals are evaluated
+    per band by residual_kernel.
+    """
+
+    n_bands = band_counts.size
+    bounds = numpy.concatenate([[0], numpy.cumsum(band_counts)])
+
+    if residual.dtype.kind not in "iu" or residual.size == 0:
+        return [
+            residual_kernel(
+                residual[bounds[i] : bounds[i + 1]], chunk_size, relative_accuracy
+            )
+            for i in range(n_bands)
+        ]
+
+    minv = int(residual.min())
+    span = int(residual.max()) - minv + 1
+
+    counts = numpy.zeros((n_bands, span), dtype="int64")
+    for i in range(n_bands):
+        for start in range(bounds[i], bounds[i + 1], chunk_size):
+            chunk = residual[start : min(start + chunk_size, bounds[i + 1])]
+            keys = numpy.subtract(chunk, minv, dtype="int64")
+            counts[i] += numpy.bincount(keys, minlength=span)
+
+    accumulators = []
+    for row in counts:
+        accumulator = ResidualAccumulator(relative_accuracy=relative_accuracy)
+        accumulator.update_counts(minv, row)
+        accumulators.append(accumulator)
+
+    return accumulators
+
+
+def merge_accumulators(
+    accumulators: Iterable[Optional[ResidualAccumulator]],
+) -> ResidualAccumulator:
+    """
+    Merge the accumulators of several chunks, granules or MPI ranks
+    (e.g. as returned by COMM.gather) into a single accumulator.
+    """
+
+    merged = ResidualAccumulator()
+    for accumulator in accumulators:
+        if accumulator is not None:
+            merged.merge(accumulator)
+
+    return merged
+
+
+def _write_dict(group: h5py.Group, data: Dict[str, Any]) -> None:
+    """Write a serialised accumulator; arrays as datasets, scalars as attributes."""
+
+    for key, value in data.items():
+        if isinstance(value, dict):
+            _write_dict(group.create_group(key), value)
+        elif isinstance(value, numpy.ndarray):
+            group.create_dataset(key, data=value)
+        else:
+            group.attrs[key] = value
+
+
+def _read_dict(group: h5py.Group) -> Dict[str, Any]:
+    """Read a serialised accumulator written by _write_dict."""
+
+    data: Dict[str, Any] = dict(group.attrs)
+    for key, value in group.items():
+        if isinstance(value, h5py.Group):
+            data[key] = _read_dict(value)
+        else:
+            data[key] = value[()]
+
+    return data
+
+
+def write_accumulator(
+    group: h5py.Group, name: str, accumulator: ResidualAccumulator
+) -> None:
+    """Write an accumulator to a new group, `name`, of a HDF5 file or group."""
+
+    _write_dict(group.create_group(name), accumulator.to_dict())
+
+
+def read_accumulator(group: h5py.Group, name: str) -> ResidualAccumulator:
+    """Read an accumulator written by write_accumulator."""
+
+    return ResidualAccumulator.from_dict(_read_dict(group[name]))
@@ -0,0 +1,271 @@
+"""
+A storage layer for reading the documents and measurements, allowing
+them to be served from the local filesystem or over HTTP.
+Remote files are read using HTTP range requests, a block at a time,
+with the fetched blocks retained in an LRU cache. Cloud optimised
+GeoTIFFs are read through GDAL via a Python file-like object, so only
+the header and the tiles required are fetched.
+"""
+
+import io
+import threading
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Optional, Tuple, Union
+import attr
+import structlog  # type: ignore
+
+REMOTE_SCHEMES: Tuple[str, ...] = ("http://", "https://")
+
+_LOG = structlog.get_logger()
+
+
+def is_remote(location: Union[Path, str]) -> bool:
+    """Is the location a URL rather than a local pathname."""
+
+    return str(location).startswith(REMOTE_SCHEMES)
+
+
+def location(parent_dir: str, name: str) -> Union[Path, str]:
+    """
+    Join a file name onto its parent directory; a Path for the local
+    filesystem, otherwise a URL.
+    """
+
+    if is_remote(parent_dir):
+        return f"{parent_dir.rstrip('/')}/{name}"
+
+    return Path(parent_dir, name)
+
+
+def parent(pathname: Union[Path, str]) -> str:
+    """The parent directory of a pathname or URL."""
+
+    if is_remote(pathname):
+        return str(pathname).rsplit("/", 1)[0]
+
+    return str(Path(pathname).parent)
+
+
+def as_location(pathname: Union[Path, str]) -> Union[Path, str]:
+    """A Path for the local filesystem, otherwise the URL unchanged."""
+
+    if is_remote(pathname):
+        return str(pathname)
+
+    return Path(pathname)
+
+
+@attr.s(auto_attribs=True)
+class Storage:
+    """
+    Base storage interface.
+    """
+
+    def exists(self, pathname: Union[Path, str]) -> bool:
+        """Does the file exist."""
+        raise NotImplementedError
+
+    def size(self, pathname: Union[Path, str]) -> int:
+        """Size of the file in bytes."""
+        raise NotImplementedError
+
+    def read(self, pathname: Union[Path, str]) -> bytes:
+        """Read the entire file."""
+        raise NotImplementedError
+
+    def open(self, pathname: Union[Path, str], mode: str = "rb") -> BinaryIO:
+        """A read-only, seekable, file-like object."""
+        raise NotImplementedError
+
+    def opener(self) -> Optional[Callable]:
+        """
+        The opener given to rasterio.open, or None if GDAL can read the
+        files natively.
+        """
+        return None
+
+
+@attr.s(auto_attribs=True)
+class LocalStorage(Storage):
+    """
+    Files on the local (or a mounted) filesystem.
+    """
+
+    def exists(self, pathname: Union[Path, str]) -> bool:
+        return Path(pathname).exists()
+
+    def size(self, pathname: Union[Path, str]) -> int:
+        return Path(pathname).stat().st_size
+
+    def read(self, pathname: Union[Path, str]) -> bytes:
+        return Path(pathname).read_bytes()
+
+    def open(self, pathname: Union[Path, str], mode: str = "rb") -> BinaryIO:
+        return open(pathname, "rb")
+
+
+class RangeFile(io.RawIOBase):
+    """
+    A read-only file-like object over a remote file, reading the
+    requested ranges through an HTTPStorage.
+    """
+
+    def __init__(self, storage: "HTTPStorage", url: str):
+        super().__init__()
+        self.storage = storage
+        self.url = url
+        self.position = 0
+        self.length = storage.size(url)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.length + offset
+        else:
+            raise ValueError(f"invalid whence: {whence}")
+
+        return self.position
+
+    def readinto(self, buffer: Any) -> int:
+        view = memoryview(buffer).cast("B")
+        data = self.storage.read_range(self.url, self.position, len(view))
+        view[: len(data)] = data
+        self.position += len(data)
+
+        return len(data)
+
+
+@attr.s(auto_attribs=True)
+class HTTPStorage(Storage):
+    """
+    Files served over HTTP(S), read using range requests of block_size
+    bytes. Up to cache_blocks of the fetched blocks are retained, with
+    the least recently used discarded first.
+    Safe to use across threads.
+    """
+
+    block_size: int = 256 * 1024
+    cache_blocks: int = 256
+    timeout: float = 60.0
+    hits: int = 0
+    misses: int = 0
+    _blocks: "OrderedDict[Tuple[str, int], bytes]" = attr.ib(
+        factory=OrderedDict, init=False, repr=False
+    )
+    _sizes: Dict[str, int] = attr.ib(factory=dict, init=False, repr=False)
+    _lock: threading.Lock = attr.ib(factory=threading.Lock, init=False, repr=False)
+
+    def _request(self, url: str, method: str = "GET", headers: Optional[Dict] = None):
+        request = urllib.request.Request(url, method=method, headers=headers or {})
+
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def exists(self, pathname: Union[Path, str]) -> bool:
+        try:
+            self.size(pathname)
+        except urllib.error.HTTPError as err:
+            if err.code == 404:
+                return False
+            raise
+
+        return True
+
+    def size(self, pathname: Union[Path, str]) -> int:
+        url = str(pathname)
+
+        with self._lock:
+            if url in self._sizes:
+                return self._sizes[url]
+
+        with self._request(url, method="HEAD") as response:
+            size = int(response.headers["Content-Length"])
+
+        with self._lock:
+            self._sizes[url] = size
+
+        return size
+
+    def _block(self, url: str, index: int) -> bytes:
+        """Fetch a block of the file, or retrieve it from the cache."""
+
+        key = (url, index)
+        with self._lock:
+            if key in self._blocks:
+                self._blocks.move_to_end(key)
+                self.hits += 1
+                return self._blocks[key]
+
+        start = index * self.block_size
+        end = min(start + self.block_size, self.size(url)) - 1
+        headers = {"Range": f"bytes={start}-{end}"}
+
+        with self._request(url, headers=headers) as response:
+            data = response.read()
+            if response.status != 206:
+                # the server ignored the range request
+                data = data[start : end + 1]
+
+        with self._lock:
+            self.misses += 1
+            self._blocks[key] = data
+            while len(self._blocks) > self.cache_blocks:
+                self._blocks.popitem(last=False)
+
+        return data
+
+    def read_range(self, url: str, offset: int, length: int) -> bytes:
+        """Read length bytes from offset, clipped to the end of the file."""
+
+        end = min(offset + length, self.size(url))
+        if end <= offset:
+            return b""
+
+        first = offset // self.block_size
+        last = (end - 1) // self.block_size
+        data = b"".join(self._block(url, index) for index in range(first, last + 1))
+        start = offset - first * self.block_size
+
+        return data[start : start + end - offset]
+
+    def read(self, pathname: Union[Path, str]) -> bytes:
+        url = str(pathname)
+
+        return self.read_range(url, 0, self.size(url))
+
+    def open(self, pathname: Union[Path, str], mode: str = "rb") -> BinaryIO:
+        # rasterio probes an opener with paths that aren't URLs
+        if not is_remote(pathname):
+            raise FileNotFoundError(str(pathname))
+
+        return RangeFile(self, str(pathname))  # type: ignore
+
+    def opener(self) -> Optional[Callable]:
+        return self.open
+
+
+LOCAL_STORAGE = LocalStorage()
+HTTP_STORAGE = HTTPStorage()
+
+
+def storage_for(pathname: Union[Path, str]) -> Storage:
+    """The storage serving a pathname or URL."""
+
+    if is_remote(pathname):
+        return HTTP_STORAGE
+
+    return LOCAL_STORAGE
@@ -0,0 +1,273 @@
+"""
+Tile-level comparison of GeoTIFFs.
+The compressed bytes of each internal tile of the test and reference
+files are compared, and only the tiles that differ are decoded. Tiles
+whose bytes match contribute zero residuals in bulk, using a cached
+count of their valid pixels, so the cost of a comparison scales with
+the size of the change rather than the size of the scene.
+"""
+
+import hashlib
+import threading
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+import attr
+from rasterio.windows import Window, intersect, intersection  # type: ignore
+import structlog  # type: ignore
+
+from gost.data_model import Measurement
+from gost.masks import valid_mask
+from gost.stats import SKETCH_RELATIVE_ACCURACY, ResidualAccumulator
+from gost.stats import residual, residual_dtype
+from gost.storage import storage_for
+
+_LOG = structlog.get_logger()
+
+
+@attr.s(auto_attribs=True)
+class TileLayout:
+    """
+    The internal tiles of a GeoTIFF band.
+
+    :byteorder:
+        The TIFF byte order marker; b"II" or b"MM".
+    :structure:
+        The attributes that determine how the bytes of a tile are
+        decoded, e.g. dtype, compression and predictor.
+    :locations:
+        The (offset, number of bytes) of each tile, keyed by the
+        (row, col) index of the tile.
+    :windows:
+        The window of each tile, keyed by the (row, col) index.
+    """
+
+    byteorder: bytes
+    structure: Tuple[Tuple[str, str], ...]
+    locations: Dict[Tuple[int, int], Tuple[int, int]]
+    windows: Dict[Tuple[int, int], Window]
+
+
+def tile_layout(measurement: Measurement) -> Optional[TileLayout]:
+    """
+    The tile layout of an opened GeoTIFF measurement, or None if the
+    measurement isn't a GeoTIFF, or the tile locations are unavailable.
+    """
+
+    dataset = measurement.dataset
+    if measurement.file_format != "GeoTIFF" or dataset.driver != "GTiff":
+        return None
+
+    pathname = measurement.pathname()
+    with storage_for(pathname).open(pathname) as src:
+        byteorder = src.read(2)
+
+    image_structure = dataset.tags(ns="IMAGE_STRUCTURE")
+    structure = {
+        "dtype": dataset.dtypes[measurement.band - 1],
+        "block_shape": str(dataset.block_shapes[measurement.band - 1]),
+        "interleave": str(dataset.interleaving),
+        "nodata": str(measurement.nodata),
+        **{key: str(value) for key, value in image_structure.items()},
+    }
+
+    locations = {}
+    windows = {}
+    for (row, col), window in dataset.block_windows(measurement.band):
+        offset = dataset.get_tag_item(
+            f"BLOCK_OFFSET_{col}_{row}", "TIFF", bidx=measurement.band
+        )
+        nbytes = dataset.get_tag_item(
+            f"BLOCK_SIZE_{col}_{row}", "TIFF", bidx=measurement.band
+        )
+
+        # sparse files can omit tiles
+        if offset is None or nbytes is None:
+            return None
+
+        locations[(row, col)] = (int(offset), int(nbytes))
+        windows[(row, col)] = window
+
+    return TileLayout(byteorder, tuple(sorted(structure.items())), locations, windows)
+
+
+def _read_bytes(src: BinaryIO, location: Tuple[int, int]) -> bytes:
+    """Read the compressed bytes of a tile."""
+
+    offset, nbytes = location
+    src.seek(offset)
+
+    return src.read(nbytes)
+
+
+@attr.s(auto_attribs=True)
+class TileCache:
+    """
+    Counts of the valid pixels of tiles, keyed by the digest of a tile's
+    compressed bytes, the layout structure (which includes the nodata
+    value) and the shape of the tile's window; the edge tiles of a band
+    are clipped, so their bytes can match an interior tile of another
+    shape. Tiles recurring across granules, such as those entirely
+    outside of the acquisition, are only decoded once.
+    Safe to use across the threads evaluating a granule.
+    """
+
+    valid_counts: Dict[Tuple[bytes, Any, Tuple[int, int]], int] = attr.ib(factory=dict)
+    hits: int = 0
+    misses: int = 0
+    _lock: threading.Lock = attr.ib(factory=threading.Lock, init=False, repr=False)
+
+    def valid_count(
+        self,
+        tile_bytes: bytes,
+        layout: TileLayout,
+        measurement: Measurement,
+        window: Window,
+    ) -> int:
+        """
+        The number of valid pixels within a tile, decoding the tile from
+        the measurement if the count isn't cached.
+        """
+
+        key = (
+            hashlib.blake2b(tile_bytes).digest(),
+            layout.structure,
+            (window.height, window.width),
+        )
+
+        with self._lock:
+            count = self.valid_counts.get(key)
+            if count is not None:
+                self.hits += 1
+                return count
+
+        data = measurement.read(window)
+        nodata = 0 if measurement.nodata is None else measurement.nodata
+        count = int(valid_mask(data, nodata).sum())
+
+        with self._lock:
+            self.misses += 1
+            self.valid_counts[key] = count
+
+        return count
+
+
+def evaluate_tiles(
+    ref_measurement: Measurement,
+    test_measurement: Measurement,
+    cache: Optional[TileCache] = None,
+    relative_accuracy: float = SKETCH_RELATIVE_ACCURACY,
+) -> Optional[Tuple[Tuple[float, float], ResidualAccumulator]]:
+    """
+    Tile-level equivalent of evaluate_blocks.
+    Tiles with identical compressed bytes contribute zero residuals and
+    no null transitions without being decoded (other than to count the
+    valid pixels of a tile not already cached). The remaining tiles are
+    decoded and evaluated as per evaluate_blocks.
+
+    :return:
+        None if the tiles of the measurements can't be compared, e.g. a
+        different tiling, compression, or nodata value, or either has a
+        mask band.
+    """
+
+    if ref_measurement.decimation > 1 or test_measurement.warp is not None:
+        return None
+
+    # the valid pixels of a mask band aren't defined by the tile's bytes
+    if ref_measurement.has_mask_band() or test_measurement.has_mask_band():
+        return None
+
+    # offset grids don't share the tile windows
+    if ref_measurement.subset != test_measurement.subset:
+        return None
+
+    layout = tile_layout(ref_measurement)
+    layout2 = tile_layout(test_measurement)
+
+    if layout is None or layout2 is None:
+        return None
+
+    if (layout.byteorder, layout.structure, layout.windows) != (
+        layout2.byteorder,
+        layout2.structure,
+        layout2.windows,
+    ):
+        _LOG.info("tile layouts differ", measurement=str(ref_measurement.pathname()))
+        return None
+
+    if cache is None:
+        cache = TileCache()
+
+    ref_nodata = 0 if ref_measurement.nodata is None else ref_measurement.nodata
+    test_nodata = 0 if test_measurement.nodata is None else test_measurement.nodata
+    dtype = residual_dtype(ref_measurement.dtype(), test_measurement.dtype())
+
+    residuals = ResidualAccumulator(relative_accuracy=relative_accuracy)
+    valid_2_null = 0
+    null_2_valid = 0
+    size = 0
+
+    # windows of the tiles that differ, and the valid counts of those that don't
+    changed = []
+    identical_counts = []
+
+    subset = ref_measurement.subset
+
+    ref_pathname = ref_measurement.pathname()
+    test_pathname = test_measurement.pathname()
+
+    # remote tiles are fetched through the storage layer's range requests
+    with storage_for(ref_pathname).open(ref_pathname) as ref_src, storage_for(
+        test_pathname
+    ).open(test_pathname) as test_src:
+        for index, tile_window in layout.windows.items():
+            window = tile_window
+            if subset is not None:
+                if not intersect(tile_window, subset):
+                    continue
+                window = intersection(tile_window, subset)
+
+            size += window.width * window.height
+
+            location = layout.locations[index]
+            location2 = layout2.locations[index]
+            tile_bytes = _read_bytes(ref_src, location)
+            if location[1] != location2[1] or tile_bytes != _read_bytes(
+                test_src, location2
+            ):
+                changed.append(window)
+                continue
+
+            if window == tile_window:
+                count = cache.valid_count(tile_bytes, layout, ref_measurement, window)
+            else:
+                # partial tiles aren't cached
+                count = int(valid_mask(ref_measurement.read(window), ref_nodata).sum())
+
+            identical_counts.append(count)
+            residuals.update_zeros(count, dtype)
+
+    _LOG.info(
+        "tile comparison",
+        measurement=str(ref_measurement.pathname()),
+        tiles_changed=len(changed),
+        tiles_identical=len(identical_counts),
+    )
+
+    for window in changed:
+        ref_data = ref_measurement.read(window)
+        test_data = test_measurement.read(window)
+
+        ref_mask = valid_mask(ref_data, ref_nodata)
+        test_mask = valid_mask(test_data, test_nodata)
+
+        # null transitions are evaluated using the reference nodata value
+        test_null_mask = valid_mask(test_data, ref_nodata)
+        valid_2_null += int((ref_mask & ~test_null_mask).sum())
+        null_2_valid += int((~ref_mask & test_null_mask).sum())
+
+        mask = ref_mask & test_mask
+        residuals.update(residual(ref_data[mask], test_data[mask]))
+
+    null_info = (valid_2_null / size, null_2_valid / size)
+
+    return null_info, residuals
@@ -1,6 +1,6 @@
 import click
 
-from .commands import collate, comparison, pbs, plotting, query, reporting
+from .commands import collate, comparison, io_tune, pbs, plotting, query, reporting
 
 
 @click.group()
@@ -18,3 +18,4 @@ entry_point.add_command(comparison.comparison)
 entry_point.add_command(collate.collate)
 entry_point.add_command(plotting.plotting)
 entry_point.add_command(reporting.reporting)
+entry_point.add_command(io_tune.io_tune)
@@ -19,7 +19,7 @@ from gost.constants import (
     MergeLookup,
     SummaryLookup,
 )
-from gost.collate import merge_framing, summarise
+from gost.collate import merge_framing, summarise, summarise_accumulators
 from ._shared_commands import io_dir_options
 
 
@@ -66,6 +66,17 @@ def collate(outdir: Union[str, Path]) -> None:
                 thematic = grp[dataset_name].attrs["thematic"]
                 proc_info = grp[dataset_name].attrs["proc-info"]
 
+                # quick-look results are derived from decimated reads
+                approximate = bool(grp[dataset_name].attrs.get("approximate", False))
+                decimation = int(grp[dataset_name].attrs.get("decimation", 1))
+
+                if approximate:
+                    _LOG.info(
+                        "results are approximate",
+                        dataset_name=dataset_name,
+                        decimation=decimation,
+                    )
+
                 _LOG.info(
                     "merging results with framing",
                     framing=framing,
@@ -94,4 +105,28 @@ def collate(outdir: Union[str, Path]) -> None:
                 )
 
                 _LOG.info("saving summary table", out_dataset_name=str(out_dname))
-                write_dataframe(summary_dataframe, str(out_dname), fid)
+                summary_attrs = {"approximate": approximate, "decimation": decimation}
+                write_dataframe(
+                    summary_dataframe, str(out_dname), fid, attrs=summary_attrs
+                )
+
+            if DatasetGroups.ACCUMULATORS.value in fid:
+                group = fid[DatasetGroups.ACCUMULATORS.value]
+
+                _LOG.info("summarising residual accumulators")
+
+                summary_dataframe = summarise_accumulators(group)
+
+                out_dname = PPath(
+                    DatasetGroups.SUMMARY.value,
+                    DatasetNames.DISTRIBUTION_SUMMARISED.value,
+                )
+
+                _LOG.info("saving summary table", out_dataset_name=str(out_dname))
+                summary_attrs = {
+                    key: group.attrs[key]
+                    for key in ("approximate", "decimation", "relative_accuracy")
+                }
+                write_dataframe(
+                    summary_dataframe, str(out_dname), fid, attrs=summary_attrs
+                )
@@ -2,6 +2,7 @@
 Command line interface for running the measurement and proc-info
 intercomparison.
 """
+
 from pathlib import Path, PurePosixPath as PPath
 from typing import Any, Dict, List, Optional, Tuple, Union
 import click
@@ -27,7 +28,15 @@ from gost.constants import (
 )
 from gost import compare_measurements, compare_proc_info
 from gost.data_model import Granule
+from gost.digests import DigestCache
+from gost.handles import DATASET_POOL
+from gost.io_profiles import load_profile
+from gost.residual_export import ResidualExport
+from gost.spatial import write_spatial
+from gost.stats import SKETCH_RELATIVE_ACCURACY, merge_accumulators, write_accumulator
+from gost.tiles import TileCache
 from gost.odc_documents import load_odc_metadata
+from gost.storage import HTTP_STORAGE, as_location
 from ._shared_commands import io_dir_options
 
 # comm info
@@ -83,8 +92,47 @@ def _process_proc_info(
     return gqa_df, ancillary_df
 
 
-def _process_odc_doc(dataframe: pandas.DataFrame, rank: int) -> Tuple[Any, ...]:
-    results = compare_measurements.process_yamls(dataframe)
+def _process_odc_doc(
+    dataframe: pandas.DataFrame,
+    rank: int,
+    streaming: bool,
+    prefetch_depth: int,
+    prefetch_memory: int,
+    threads: int,
+    decimation: int,
+    bbox: Optional[Tuple[float, float, float, float]],
+    digests: Optional[DigestCache],
+    tiles: Optional[TileCache],
+    align_grids: bool,
+    stack_bands: bool,
+    shared_masks: bool,
+    export: Optional[ResidualExport],
+    spatial_grid: Optional[Tuple[int, int]],
+    relative_accuracy: float,
+) -> Tuple[Any, ...]:
+    results = compare_measurements.process_yamls(
+        dataframe,
+        streaming,
+        prefetch_depth,
+        prefetch_memory * 1024 ** 2,
+        threads,
+        decimation,
+        bbox,
+        digests,
+        tiles,
+        align_grids,
+        stack_bands,
+        shared_masks,
+        export,
+        spatial_grid,
+        relative_accuracy,
+    )
+
+    if tiles is not None:
+        _LOG.info("tile cache", hits=tiles.hits, misses=tiles.misses)
+
+    _LOG.info("dataset handle pool", **DATASET_POOL.counters())
+    _LOG.info("remote block cache", hits=HTTP_STORAGE.hits, misses=HTTP_STORAGE.misses)
 
     # gather records from all workers
     if rank == 0:
@@ -94,6 +142,11 @@ def _process_odc_doc(dataframe: pandas.DataFrame, rank: int) -> Tuple[Any, ...]:
     fmask_records = COMM.gather(results[1], root=0)
     contiguity_records = COMM.gather(results[2], root=0)
     shadow_records = COMM.gather(results[3], root=0)
+    spatial_records = COMM.gather(results[4], root=0)
+    accumulator_records = COMM.gather(results[5], root=0)
+
+    if digests is not None:
+        digest_records = COMM.gather(digests.to_dataframe(), root=0)
 
     # create dataframes for each set of results
     if rank == 0:
@@ -104,13 +157,41 @@ def _process_odc_doc(dataframe: pandas.DataFrame, rank: int) -> Tuple[Any, ...]:
         contiguity_df = _concatenate_records(contiguity_records)
         shadow_df = _concatenate_records(shadow_records)
 
+        if digests is not None:
+            digests_df = pandas.concat(digest_records, ignore_index=True)
+            digests_df = digests_df.drop_duplicates("pathname", keep="last")
+        else:
+            digests_df = None
+
+        spatial = {}
+        for record in spatial_records:
+            spatial.update(record)
+
+        # the residual statistics of each measurement across all workers
+        names = sorted({name for record in accumulator_records for name in record})
+        accumulators = {
+            name: merge_accumulators(record.get(name) for record in accumulator_records)
+            for name in names
+        }
+
     else:
         general_df = pandas.DataFrame()
         fmask_df = pandas.DataFrame()
         contiguity_df = pandas.DataFrame()
         shadow_df = pandas.DataFrame()
-
-    return general_df, fmask_df, contiguity_df, shadow_df
+        digests_df = None
+        spatial = {}
+        accumulators = {}
+
+    return (
+        general_df,
+        fmask_df,
+        contiguity_df,
+        shadow_df,
+        digests_df,
+        spatial,
+        accumulators,
+    )
 
 
 @click.command()
@@ -121,7 +202,195 @@ def _process_odc_doc(dataframe: pandas.DataFrame, rank: int) -> Tuple[Any, ...]:
     is_flag=True,
     help="If set, then comapre the GQA fields and not the product measurements",
 )
-def comparison(outdir: Union[str, Path], proc_info: bool) -> None:
+@click.option(
+    "--streaming",
+    default=False,
+    is_flag=True,
+    help=(
+        "If set, then evaluate the measurements a block at a time, "
+        "which caps the memory used by each worker at a few blocks."
+    ),
+)
+@click.option(
+    "--prefetch-depth",
+    default=0,
+    type=click.IntRange(min=0),
+    help=(
+        "Number of granules to load ahead of time by a background thread "
+        "while the current granule is evaluated. Default is 0 (no prefetch)."
+    ),
+)
+@click.option(
+    "--prefetch-memory",
+    default=1024,
+    type=click.IntRange(min=0),
+    help="Memory ceiling in MiB for the measurements decoded ahead of time.",
+)
+@click.option(
+    "--threads",
+    default=1,
+    type=click.IntRange(min=1),
+    help=(
+        "Number of threads used by each MPI worker to evaluate the "
+        "measurements of a granule concurrently. Default is 1."
+    ),
+)
+@click.option(
+    "--quick-look",
+    default=False,
+    is_flag=True,
+    help=(
+        "If set, then evaluate the measurements from reduced resolution "
+        "reads (using the overviews where available). The results are "
+        "approximate, and are flagged as such."
+    ),
+)
+@click.option(
+    "--decimation",
+    default=8,
+    type=click.IntRange(min=2),
+    help="Decimation factor of the quick-look reads. Default is 8.",
+)
+@click.option(
+    "--bbox",
+    default=None,
+    nargs=4,
+    type=float,
+    metavar="MIN_LON MIN_LAT MAX_LON MAX_LAT",
+    help=(
+        "Restrict the comparison to a lon/lat bounding box; only the pixel "
+        "window of each measurement covering the box is read."
+    ),
+)
+@click.option(
+    "--digests",
+    default=False,
+    is_flag=True,
+    help=(
+        "If set, then measurement files that are byte-identical to the "
+        "reference are recorded as identical without being decoded. The "
+        "file digests are stored in the results file for reuse."
+    ),
+)
+@click.option(
+    "--tile-diff",
+    default=False,
+    is_flag=True,
+    help=(
+        "If set, then compare the compressed bytes of each GeoTIFF tile, "
+        "and only decode the tiles of the general measurements that differ."
+    ),
+)
+@click.option(
+    "--stack-bands",
+    default=False,
+    is_flag=True,
+    help=(
+        "If set, then evaluate the reflectance bands of a granule that share "
+        "a grid, datatype and nodata value together as a single stack."
+    ),
+)
+@click.option(
+    "--shared-masks",
+    default=False,
+    is_flag=True,
+    help=(
+        "If set, then evaluate the valid pixel mask once for the measurements "
+        "of a granule that share a grid and nodata value, and reuse it."
+    ),
+)
+@click.option(
+    "--residuals-measurement",
+    multiple=True,
+    help=(
+        "Export the residual image of the named general measurement (repeat "
+        "the option for several) as a cloud optimised GeoTIFF."
+    ),
+)
+@click.option(
+    "--residuals-granule",
+    multiple=True,
+    help="Export the residual images of the given granule id (repeatable).",
+)
+@click.option(
+    "--residuals-threshold",
+    default=None,
+    type=float,
+    help=(
+        "Export the residual images of the measurements whose maximum absolute "
+        "residual exceeds the threshold (combined with the other selectors)."
+    ),
+)
+@click.option(
+    "--sketch-accuracy",
+    default=SKETCH_RELATIVE_ACCURACY,
+    type=click.FloatRange(min=0, max=1, min_open=True, max_open=True),
+    help=(
+        "Relative error of the percentiles estimated for floating point "
+        f"residuals. Default is {SKETCH_RELATIVE_ACCURACY}."
+    ),
+)
+@click.option(
+    "--spatial-grid",
+    default=None,
+    nargs=2,
+    type=click.IntRange(min=1),
+    help=(
+        "Summarise the residuals of the general measurements over a grid of "
+        "ROWS COLUMNS cells (e.g. 32 32) covering each granule."
+    ),
+)
+@click.option(
+    "--handle-pool-size",
+    default=32,
+    type=click.IntRange(min=0),
+    help=(
+        "Number of idle dataset handles each worker retains for reuse, "
+        "rather than re-opening the files. Default is 32; 0 disables it."
+    ),
+)
+@click.option(
+    "--align/--no-align",
+    "align_grids",
+    default=True,
+    help=(
+        "Align measurements whose pixel grids differ; co-registered grids are "
+        "compared over their intersection, otherwise the test measurement is "
+        "resampled onto the reference grid. Otherwise such pairs are skipped."
+    ),
+)
+@click.option(
+    "--io-profile",
+    default="default",
+    type=click.STRING,
+    help=(
+        "The GDAL I/O profile applied to the reads; one of default, local-ssd, "
+        "lustre or http, or the pathname of a profile written by io-tune."
+    ),
+)
+def comparison(
+    outdir: Union[str, Path],
+    proc_info: bool,
+    streaming: bool,
+    prefetch_depth: int,
+    prefetch_memory: int,
+    threads: int,
+    quick_look: bool,
+    decimation: int,
+    bbox: Optional[Tuple[float, float, float, float]],
+    digests: bool,
+    tile_diff: bool,
+    stack_bands: bool,
+    shared_masks: bool,
+    residuals_measurement: Tuple[str, ...],
+    residuals_granule: Tuple[str, ...],
+    residuals_threshold: Optional[float],
+    sketch_accuracy: float,
+    spatial_grid: Optional[Tuple[int, int]],
+    handle_pool_size: int,
+    align_grids: bool,
+    io_profile: str,
+) -> None:
     """
     Test and Reference product intercomparison evaluation.
     """
@@ -141,6 +410,8 @@ def comparison(outdir: Union[str, Path], proc_info: bool) -> None:
         processors=DEFAULT_PROCESSORS, logger_factory=MPILoggerFactory(out_stream)
     )
 
+    DATASET_POOL.resize(handle_pool_size)
+
     # processor info
     rank = COMM.Get_rank()
     n_processors = COMM.Get_size()
@@ -150,18 +421,26 @@ def comparison(outdir: Union[str, Path], proc_info: bool) -> None:
     with h5py.File(str(results_fname), "r") as fid:
         dataframe = read_h5_table(fid, DatasetNames.QUERY.value)
 
+        # digests recorded by previous runs
+        if digests and DatasetNames.DIGESTS.value in fid:
+            digests_df = read_h5_table(fid, DatasetNames.DIGESTS.value)
+        else:
+            digests_df = None
+
     if rank == 0:
         index = dataframe.index.values.tolist()
         blocks = scatter(index, n_processors)
 
         # some basic attribute information
         doc: Union[Granule, None] = load_odc_metadata(
-            Path(dataframe.iloc[0].yaml_pathname_reference)
+            as_location(dataframe.iloc[0].yaml_pathname_reference)
         )
         attrs: Dict[str, Any] = {
             "framing": doc.framing,
             "thematic": False,
             "proc-info": False,
+            "approximate": False,
+            "decimation": 1,
         }
     else:
         blocks = None
@@ -218,9 +497,49 @@ def comparison(outdir: Union[str, Path], proc_info: bool) -> None:
                 write_dataframe(software_df, str(dataset_name), fid, attrs=software_attrs)
 
     else:
+        if not quick_look:
+            decimation = 1
+        elif rank == 0:
+            attrs["approximate"] = True
+            attrs["decimation"] = decimation
+
+        if bbox and rank == 0:
+            attrs["bbox"] = list(bbox)
+
+        profile = load_profile(io_profile)
+
+        if residuals_measurement or residuals_granule or residuals_threshold is not None:
+            export = ResidualExport(
+                outdir.joinpath(DirectoryNames.RESIDUALS.value),
+                list(residuals_measurement),
+                list(residuals_granule),
+                residuals_threshold,
+            )
+        else:
+            export = None
+
         if rank == 0:
-            _LOG.info("processing odc-metadata documents")
-        results = _process_odc_doc(dataframe.iloc[indices], rank)
+            _LOG.info("processing odc-metadata documents", io_profile=profile.name)
+
+        with profile.env():
+            results = _process_odc_doc(
+                dataframe.iloc[indices],
+                rank,
+                streaming,
+                prefetch_depth,
+                prefetch_memory,
+                threads,
+                decimation,
+                bbox or None,
+                DigestCache.from_dataframe(digests_df) if digests else None,
+                TileCache() if tile_diff else None,
+                align_grids,
+                stack_bands,
+                shared_masks,
+                export,
+                spatial_grid or None,
+                sketch_accuracy,
+            )
 
         if rank == 0:
             # save each table
@@ -277,6 +596,44 @@ def comparison(outdir: Union[str, Path], proc_info: bool) -> None:
                     attrs=attrs,
                 )
 
+                if results[4] is not None:
+                    _LOG.info("saving file digests")
+
+                    # replaces the digests of previous runs
+                    if DatasetNames.DIGESTS.value in fid:
+                        del fid[DatasetNames.DIGESTS.value]
+
+                    digest_attrs = {"description": "Measurement file digests"}
+                    write_dataframe(
+                        results[4], DatasetNames.DIGESTS.value, fid, attrs=digest_attrs
+                    )
+
+                if results[5]:
+                    _LOG.info("saving spatial statistics")
+
+                    # replaces the spatial statistics of previous runs
+                    if DatasetGroups.SPATIAL.value in fid:
+                        del fid[DatasetGroups.SPATIAL.value]
+
+                    group = fid.create_group(DatasetGroups.SPATIAL.value)
+                    group.attrs["grid"] = list(spatial_grid)
+                    for (granule_id, name), cells in results[5].items():
+                        write_spatial(group, granule_id, name, cells)
+
+                if results[6]:
+                    _LOG.info("saving residual accumulators")
+
+                    # replaces the accumulators of previous runs
+                    if DatasetGroups.ACCUMULATORS.value in fid:
+                        del fid[DatasetGroups.ACCUMULATORS.value]
+
+                    group = fid.create_group(DatasetGroups.ACCUMULATORS.value)
+                    group.attrs["approximate"] = attrs["approximate"]
+                    group.attrs["decimation"] = attrs["decimation"]
+                    group.attrs["relative_accuracy"] = sketch_accuracy
+                    for name, accumulator in results[6].items():
+                        write_accumulator(group, name, accumulator)
+
     if rank == 0:
         workflow = "proc-info field" if proc_info else "product measurement"
         msg = f"{workflow} comparison processing finished"
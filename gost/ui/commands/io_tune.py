@@ -0,0 +1,117 @@
+"""
+Command line interface for benchmarking the GDAL I/O profiles on a
+sample of the queried granules.
+"""
+
+from pathlib import Path
+from typing import List, Tuple, Union
+import click
+import h5py  # type: ignore
+import structlog  # type: ignore
+
+from wagl.hdf5 import read_h5_table  # type: ignore
+from gost.constants import (
+    DatasetNames,
+    DirectoryNames,
+    FileNames,
+    LOG_PROCESSORS,
+    LogNames,
+)
+from gost.data_model import Measurement
+from gost.io_profiles import PROFILES, benchmark
+from gost.odc_documents import load_odc_metadata
+from gost.storage import as_location
+from ._shared_commands import io_dir_options
+
+_LOG = structlog.get_logger()
+
+
+@click.command("io-tune")
+@io_dir_options
+@click.option(
+    "--sample",
+    default=2,
+    type=click.IntRange(min=1),
+    help="Number of granules (evenly spaced across the query) to read. Default is 2.",
+)
+@click.option(
+    "--profile",
+    "profile_names",
+    multiple=True,
+    type=click.Choice(list(PROFILES)),
+    help="The candidate profiles to benchmark. Default is all of them.",
+)
+@click.option(
+    "--repeats",
+    default=3,
+    type=click.IntRange(min=1),
+    help="Number of timed reads of the sample for each profile. Default is 3.",
+)
+def io_tune(
+    outdir: Union[str, Path],
+    sample: int,
+    profile_names: Tuple[str, ...],
+    repeats: int,
+) -> None:
+    """
+    Benchmark the GDAL I/O profiles on a sample of the queried granules,
+    and write the fastest profile for use by the comparison
+    (see its --io-profile option).
+    """
+
+    outdir = Path(outdir)
+    log_fname = outdir.joinpath(DirectoryNames.LOGS.value, LogNames.IO_TUNE.value)
+
+    if not log_fname.parent.exists():
+        log_fname.parent.mkdir(parents=True)
+
+    with open(log_fname, "w") as fobj:
+        structlog.configure(
+            logger_factory=structlog.PrintLoggerFactory(fobj), processors=LOG_PROCESSORS
+        )
+
+        results_fname = outdir.joinpath(
+            DirectoryNames.RESULTS.value, FileNames.RESULTS.value
+        )
+
+        with h5py.File(str(results_fname), "r") as fid:
+            dataframe = read_h5_table(fid, DatasetNames.QUERY.value)
+
+        step = max(len(dataframe) // sample, 1)
+        rows = dataframe.iloc[::step].iloc[:sample]
+
+        # the HDF5 measurements aren't read through GDAL
+        measurements: List[Measurement] = []
+        for row in rows.itertuples():
+            for pathname in (row.yaml_pathname_reference, row.yaml_pathname_test):
+                doc = load_odc_metadata(as_location(pathname))
+                measurements.extend(
+                    measurement
+                    for measurement in doc.measurements.values()
+                    if measurement.file_format != "HDF5" and measurement.exists()
+                )
+
+        _LOG.info(
+            "benchmarking I/O profiles",
+            granules=len(rows),
+            measurements=len(measurements),
+        )
+
+        profiles = [PROFILES[name] for name in profile_names or PROFILES]
+        timings = benchmark(measurements, profiles, repeats)
+
+        for record in timings.itertuples():
+            _LOG.info(
+                "I/O profile timing",
+                profile=record.profile,
+                seconds=record.seconds,
+                mib_per_second=record.mib_per_second,
+            )
+
+        fastest = PROFILES[timings.iloc[0].profile]
+        out_fname = outdir.joinpath(
+            DirectoryNames.RESULTS.value, FileNames.IO_PROFILE.value
+        )
+        fastest.write(out_fname)
+
+        _LOG.info("fastest I/O profile", profile=fastest.name, out_fname=str(out_fname))
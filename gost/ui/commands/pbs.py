@@ -34,7 +34,7 @@ QUERY_FS_CMD = """{resources}
 ard-intercomparison query-filesystem --outdir {outdir} --product-pathname-test {product_pathname_test} --product-pathname-reference {product_pathname_reference} --glob-pattern-test "{glob_pattern_test}" --glob-pattern-reference "{glob_pattern_reference}"
 """
 COMPARISON_CMD = """{resources}
-mpiexec -n {ncpus} ard-intercomparison comparison --outdir {outdir}
+mpiexec -n {ncpus} ard-intercomparison comparison --outdir {outdir}{options}
 """
 PROC_INFO_COMPARISON_CMD = """{resources}
 mpiexec -n {ncpus} ard-intercomparison comparison --outdir {outdir} --proc-info
@@ -97,7 +97,12 @@ def _qsub(job_string, out_fname, dependency=None):
 
 
 def _ncpus_memory(length, loading=3, node_cpus=48, node_memory=192):
-    """Determine the number of cpus for the MPI job."""
+    """
+    Determine the number of cpus for the MPI job.
+    Every core of a node is allocated, which requires the per worker
+    memory to fit within node_memory / node_cpus; use the streaming
+    comparison for scenes that would otherwise exceed it.
+    """
 
     n_nodes = length // loading // node_cpus
     if n_nodes == 0:
@@ -255,6 +260,7 @@ def _setup_comparison_pbs_job(
     email_construct,
     env,
     outdir,
+    streaming=False,
 ):
     """
     Setup and submit the PBS jobs for comparing the test and reference data.
@@ -275,8 +281,9 @@ def _setup_comparison_pbs_job(
     )
 
     # product measurement comparison job
+    options = " --streaming" if streaming else ""
     measurement_pbs_job = COMPARISON_CMD.format(
-        resources=comparison_resources, ncpus=n_cpus, outdir=outdir
+        resources=comparison_resources, ncpus=n_cpus, outdir=outdir, options=options
     )
 
     out_fname = Path(outdir).joinpath(
@@ -415,6 +422,12 @@ def _setup_reporting_pbs_job(
         "eg '*/*/2019/05/*/*.odc-metadata.yaml'."
     ),
 )
+@click.option(
+    "--streaming",
+    default=False,
+    is_flag=True,
+    help="If set, then the measurement comparison evaluates a block at a time.",
+)
 def pbs(
     outdir,
     env,
@@ -430,6 +443,7 @@ def pbs(
     lat,
     additional_filters,
     query_filesystem,
+    streaming,
 ):
     """
     Product intercomparison PBS workflow.
@@ -486,7 +500,14 @@ def pbs(
     # intercomparison job
     _LOG.info("submitting comparison pbs jobs")
     comparison_job_ids = _setup_comparison_pbs_job(
-        n_datasets, query_job_id, project, fs_projects, email_construct, env, outdir
+        n_datasets,
+        query_job_id,
+        project,
+        fs_projects,
+        email_construct,
+        env,
+        outdir,
+        streaming,
     )
 
     # collate job
@@ -99,6 +99,7 @@ def reporting(
             )
             _LOG.info("reading dataset", dataset_name=str(dataset_name))
             dataframe = read_h5_table(fid, str(dataset_name))
+            decimation = int(fid[str(dataset_name)].attrs.get("decimation", 1))
 
             n_datasets = fid[DatasetNames.QUERY.value].attrs["nrows"]
 
@@ -120,7 +121,7 @@ def reporting(
         reports_outdir = outdir.joinpath(DirectoryNames.REPORT.value)
 
         _LOG.info("producing LaTeX documents of general results")
-        latex_documents(gdf, dataframe, reports_outdir, n_datasets)
+        latex_documents(gdf, dataframe, reports_outdir, n_datasets, decimation)
 
         # TODO GQA and ancillary
 
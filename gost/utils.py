@@ -6,14 +6,24 @@ scripts will be designed and executed properly.
 """
 
 from enum import Enum
+import math
 from pathlib import Path
-from typing import Dict, List, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 import attr
 import numpy  # type: ignore
+from rasterio.warp import transform_bounds  # type: ignore
+from rasterio.windows import Window, from_bounds, intersect, intersection  # type: ignore
+import structlog  # type: ignore
 
-from idl_functions import histogram  # type: ignore
-
+from gost.confusion import ConfusionMatrix, confusion_matrix
 from gost.data_model import Granule, Measurement
+from gost.masks import null_transitions, pack, valid_mask
+from gost.residual_export import ResidualWriter
+from gost.spatial import SpatialStatistics
+from gost.stats import SKETCH_RELATIVE_ACCURACY, ResidualAccumulator, residual
+from gost.stats import residual_dtype, stack_kernel
+
+_LOG = structlog.get_logger()
 
 
 class FmaskThemes(Enum):
@@ -47,6 +57,10 @@ class TerrainShadowThemes(Enum):
     UNSHADED = 1
 
 
+# agreement metrics of the thematic datasets, in addition to the class f1 scores
+AGREEMENT_FIELDS = ["overall_accuracy", "kappa"]
+
+
 @attr.s()
 class MeasurementRecords:
     """
@@ -102,23 +116,31 @@ class GeneralRecords(MeasurementRecords):
     skewness: List = attr.ib(default=attr.Factory(list))
     kurtosis: List = attr.ib(default=attr.Factory(list))
     max_absolute: List = attr.ib(default=attr.Factory(list))
+    median_residual: List = attr.ib(default=attr.Factory(list))
+    median_absolute_deviation: List = attr.ib(default=attr.Factory(list))
+    trimmed_mean_residual: List = attr.ib(default=attr.Factory(list))
 
 
 def _make_thematic_class(themes, name):
     """Class constructor for thematic datasets."""
 
-    result = attr.make_class(
-        name,
+    fields = {
+        f"{theme.name.lower()}_2_{theme2.name.lower()}": attr.ib(
+            default=attr.Factory(list)
+        )
+        for theme in themes
+        for theme2 in themes
+    }
+    fields.update({key: attr.ib(default=attr.Factory(list)) for key in AGREEMENT_FIELDS})
+    fields.update(
         {
-            f"{theme.name.lower()}_2_{theme2.name.lower()}": attr.ib(
-                default=attr.Factory(list)
-            )
+            f"{theme.name.lower()}_f1": attr.ib(default=attr.Factory(list))
             for theme in themes
-            for theme2 in themes
-        },
-        bases=(MeasurementRecords,),
+        }
     )
 
+    result = attr.make_class(name, fields, bases=(MeasurementRecords,))
+
     return result
 
 
@@ -127,52 +149,122 @@ ContiguityRecords = _make_thematic_class(ContiguityThemes, "ContiguityRecords")
 TerrainShadowRecords = _make_thematic_class(TerrainShadowThemes, "TerrainShadowRecords")
 
 
+def theme_results(
+    matrix: ConfusionMatrix,
+    themes: Union[FmaskThemes, ContiguityThemes, TerrainShadowThemes],
+    agreement: bool = False,
+) -> Dict[str, float]:
+    """
+    Split the confusion matrix of a thematic dataset into the records of
+    the percentage of each theme's pixels that changed to each theme, and
+    optionally the overall accuracy, kappa and per theme F1 scores.
+    """
+
+    percentages = matrix.percentages()
+
+    result = dict()
+    for i, theme in enumerate(themes):
+        for j, theme2 in enumerate(themes):
+            key = f"{theme.name.lower()}_2_{theme2.name.lower()}"
+            result[key] = percentages[i, j].item()
+
+    if agreement:
+        result["overall_accuracy"] = matrix.overall_accuracy()
+        result["kappa"] = matrix.kappa()
+
+        for theme, score in zip(themes, matrix.f1()):
+            result[f"{theme.name.lower()}_f1"] = score.item()
+
+    return result
+
+
+def evaluate_confusion(
+    ref_measurement: Measurement,
+    test_measurement: Measurement,
+    themes: Union[FmaskThemes, ContiguityThemes, TerrainShadowThemes],
+    streaming: bool = False,
+) -> ConfusionMatrix:
+    """
+    The confusion matrix of the themes of a reference and test measurement.
+    If streaming is set, then the internal block windows of the reference
+    are read in turn, rather than the full measurements (other than for
+    quick-looks, which are read whole at 1/decimation).
+    """
+
+    values = [v.value for v in themes]
+
+    if streaming and ref_measurement.decimation == 1:
+        matrix = ConfusionMatrix(values)
+        for window in ref_measurement.block_windows():
+            test_window = corresponding_window(ref_measurement, test_measurement, window)
+            ref_data = ref_measurement.read(window)
+            matrix.update(ref_data, test_measurement.read(test_window))
+    else:
+        matrix = confusion_matrix(ref_measurement.read(), test_measurement.read(), values)
+
+    unexpected = matrix.unexpected()
+    if unexpected:
+        _LOG.warning("pixels not belonging to any theme", count=unexpected)
+
+    return matrix
+
+
 def evaluate_themes(
     ref_measurement: Measurement,
     test_measurement: Measurement,
     themes: Union[FmaskThemes, ContiguityThemes, TerrainShadowThemes],
+    agreement: bool = False,
+    streaming: bool = False,
 ) -> Dict[str, float]:
     """
     A generic tool for evaluating thematic datasets.
+    If streaming is set, then the measurements are read a block at a time.
     """
-    values = [v.value for v in themes]
-    n_values = len(values)
-    minv = min(values)
-    maxv = max(values)
-
-    # read data and reshape to 1D
-    ref_data = ref_measurement.read().ravel()
-    test_data = test_measurement.read().ravel()
-
-    ref_h = histogram(ref_data, minv=minv, maxv=maxv, reverse_indices="ri")
-
-    ref_hist = ref_h["histogram"]
-    ref_ri = ref_h["ri"]
-
-    theme_changes = dict()
-
-    for theme in themes:
-        i = theme.value
-        # check we have data for this category
-        if ref_hist[i] == 0:
-            # no changes as nothing exists in the reference data
-            theme_changes[theme] = numpy.full((n_values,), numpy.nan)
-            continue
-        idx = ref_ri[ref_ri[i] : ref_ri[i + 1]]
-        values = test_data[idx]
-        h = histogram(values, minv=minv, maxv=maxv)
-        hist = h["histogram"]
-        pdf = hist / numpy.sum(hist)
-        theme_changes[theme] = pdf * 100
-
-    # split outputs into separate records
-    result = dict()
-    for theme in themes:
-        for theme2 in themes:
-            key = f"{theme.name.lower()}_2_{theme2.name.lower()}"
-            result[key] = theme_changes[theme][theme2.value]
 
-    return result
+    matrix = evaluate_confusion(ref_measurement, test_measurement, themes, streaming)
+
+    return theme_results(matrix, themes, agreement)
+
+
+def bounds_window(bounds: Tuple[float, float, float, float], transform: Any) -> Window:
+    """
+    The window of a pixel grid covering (left, bottom, right, top)
+    bounds, expanded to the whole pixels covered.
+    """
+
+    window = from_bounds(*bounds, transform=transform)
+
+    col_start = math.floor(window.col_off)
+    row_start = math.floor(window.row_off)
+    col_stop = math.ceil(window.col_off + window.width)
+    row_stop = math.ceil(window.row_off + window.height)
+
+    return Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+
+
+def lonlat_window(
+    bbox: Tuple[float, float, float, float], crs: str, measurement: Measurement
+) -> Optional[Window]:
+    """
+    Convert a (min_lon, min_lat, max_lon, max_lat) bounding box to the
+    pixel window of a measurement, using the measurement's affine
+    transform. The window is expanded to whole pixels and clipped to
+    the measurement's extent.
+
+    :return:
+        None if the bounding box doesn't intersect the measurement.
+    """
+
+    bounds = transform_bounds("EPSG:4326", crs, *bbox, densify_pts=21)
+    window = bounds_window(bounds, measurement.transform)
+
+    height, width = measurement.shape
+    extent = Window(0, 0, width, height)
+
+    if not intersect(window, extent):
+        return None
+
+    return intersection(window, extent)
 
 
 def data_mask(measurement: Measurement) -> numpy.ndarray:
@@ -180,26 +272,63 @@ def data_mask(measurement: Measurement) -> numpy.ndarray:
     nodata = measurement.nodata
     if nodata is None:
         nodata = 0
-    is_finite = numpy.isfinite(nodata)
 
-    if is_finite:
-        mask = measurement.read() != nodata
-    else:
-        mask = numpy.isfinite(measurement.read())
+    mask = measurement.valid_mask()
 
     return mask, nodata
 
 
+def _same_nodata(nodata: Any, nodata2: Any) -> bool:
+    """Are two nodata values equivalent; None is taken as 0, and NaN equals NaN."""
+    nodata = 0 if nodata is None else nodata
+    nodata2 = 0 if nodata2 is None else nodata2
+
+    if not numpy.isfinite(nodata) or not numpy.isfinite(nodata2):
+        return bool(numpy.isnan(nodata) and numpy.isnan(nodata2))
+
+    return bool(nodata == nodata2)
+
+
+def null_mask(
+    ref_measurement: Measurement,
+    test_measurement: Measurement,
+    window: Optional[Window] = None,
+    data: Optional[numpy.ndarray] = None,
+) -> numpy.ndarray:
+    """
+    Mask of the valid test pixels for evaluating null transitions, which
+    are defined by the reference nodata value. The (cached) mask of the
+    test measurement is used whenever the nodata values are the same.
+    The test pixels of a window already read can be given as data.
+    """
+    if _same_nodata(ref_measurement.nodata, test_measurement.nodata):
+        return test_measurement.valid_mask(window, data)
+
+    nodata = 0 if ref_measurement.nodata is None else ref_measurement.nodata
+    if data is None:
+        data = test_measurement.read(window)
+
+    return valid_mask(data, nodata)
+
+
 def evaluate(
-    ref_measurement: Measurement, test_measurement: Measurement
+    ref_measurement: Measurement,
+    test_measurement: Measurement,
+    spatial: Optional[SpatialStatistics] = None,
 ) -> numpy.ndarray:
-    """A basic difference operator where data exists at both index locations"""
+    """
+    A basic difference operator where data exists at both index locations.
+    If given, the spatial statistics are updated by the residuals.
+    """
     ref_mask, _ = data_mask(ref_measurement)
     test_mask, _ = data_mask(test_measurement)
 
     # evaluate only where valid data locations are the same
     mask = ref_mask & test_mask
-    result = ref_measurement.read()[mask] - test_measurement.read()[mask]
+    result = residual(ref_measurement.read()[mask], test_measurement.read()[mask])
+
+    if spatial is not None:
+        spatial.update(result, mask)
 
     return result
 
@@ -210,26 +339,179 @@ def evaluate_nulls(
     """
     A basic eval for checking if null locations have changed.
     eg, data pixel to null pixel and vice versa.
+    The transitions are counted from the bit-packed valid masks.
     """
-    mask, nodata = data_mask(ref_measurement)
-    is_finite = numpy.isfinite(nodata)
-
-    # read data from both the data and nodata masks
-    values = test_measurement.read()[mask]
-    values2 = test_measurement.read()[~mask]
-
-    if is_finite:
-        valid_2_null = values == nodata
-        null_2_valid = values2 != nodata
+    ref_bits = ref_measurement.valid_bits()
+    if _same_nodata(ref_measurement.nodata, test_measurement.nodata):
+        test_bits = test_measurement.valid_bits()
     else:
-        valid_2_null = ~numpy.isfinite(values)
-        null_2_valid = numpy.isfinite(values2)
+        test_bits = pack(null_mask(ref_measurement, test_measurement))
+
+    valid_2_null, null_2_valid = null_transitions(ref_bits, test_bits)
 
     # determine pixels that have changed from valid -> null & vice versa
-    valid_2_null_pct = valid_2_null.sum() / mask.size
-    null_2_valid_pct = null_2_valid.sum() / mask.size
+    size = ref_measurement.valid_mask().size
+    valid_2_null_pct = valid_2_null / size
+    null_2_valid_pct = null_2_valid / size
     # trial count instead of percent
     # valid_2_null_pct = valid_2_null.sum()
     # null_2_valid_pct = null_2_valid.sum()
 
     return valid_2_null_pct, null_2_valid_pct
+
+
+def _read_stack(measurements: List[Measurement]) -> numpy.ndarray:
+    """
+    Read measurements of the same shape and dtype into a (bands, y, x)
+    array; each measurement is closed once read to release its buffer.
+    """
+
+    stack = None
+    for i, measurement in enumerate(measurements):
+        data = measurement.read()
+        if stack is None:
+            stack = numpy.empty((len(measurements), *data.shape), data.dtype)
+
+        stack[i] = data
+        measurement.close()
+
+    return stack
+
+
+def evaluate_stack(
+    ref_measurements: List[Measurement],
+    test_measurements: List[Measurement],
+    relative_accuracy: float = SKETCH_RELATIVE_ACCURACY,
+) -> List[Tuple[Tuple[float, float], ResidualAccumulator]]:
+    """
+    Batched equivalent of evaluate_nulls and evaluate for bands sharing a
+    shape, dtype and nodata value (in each of the reference and test),
+    and whose valid pixels are defined by the nodata value.
+    The bands are read into (bands, y, x) stacks, the valid masks of all
+    bands are evaluated at once, and the null transitions are reduced
+    along the band axis. The residual statistics of all bands are binned
+    together (see gost.stats.stack_kernel).
+    The measurements are closed on return.
+    """
+
+    ref_nodata, test_nodata = (
+        0 if measurements[0].nodata is None else measurements[0].nodata
+        for measurements in (ref_measurements, test_measurements)
+    )
+
+    ref_stack = _read_stack(ref_measurements)
+    test_stack = _read_stack(test_measurements)
+
+    ref_mask = valid_mask(ref_stack, ref_nodata)
+    test_mask = valid_mask(test_stack, test_nodata)
+
+    # null transitions are defined by the reference nodata value
+    if _same_nodata(ref_nodata, test_nodata):
+        null_mask_ = test_mask
+    else:
+        null_mask_ = valid_mask(test_stack, ref_nodata)
+
+    size = ref_stack[0].size
+    valid_2_null = (ref_mask & ~null_mask_).sum(axis=(1, 2)) / size
+    null_2_valid = (~ref_mask & null_mask_).sum(axis=(1, 2)) / size
+
+    # evaluate only where valid data locations are the same
+    mask = ref_mask & test_mask
+    band_counts = mask.sum(axis=(1, 2))
+    bounds = numpy.concatenate([[0], numpy.cumsum(band_counts)])
+
+    # the residuals of each band are evaluated in turn, to bound the copies
+    dtype = residual_dtype(ref_stack.dtype, test_stack.dtype)
+    diff = numpy.empty(bounds[-1], dtype=dtype)
+    for i in range(len(ref_measurements)):
+        diff[bounds[i] : bounds[i + 1]] = residual(
+            ref_stack[i][mask[i]], test_stack[i][mask[i]]
+        )
+
+    residuals = stack_kernel(diff, band_counts, relative_accuracy=relative_accuracy)
+
+    return [
+        ((valid_2_null[i].item(), null_2_valid[i].item()), residuals[i])
+        for i in range(len(ref_measurements))
+    ]
+
+
+def corresponding_window(
+    ref_measurement: Measurement, test_measurement: Measurement, window: Window
+) -> Window:
+    """
+    The window of the test measurement corresponding to a window of the
+    reference measurement; these differ for co-registered grids that are
+    offset from one another (see gost.alignment).
+    """
+
+    if ref_measurement.subset is None or test_measurement.subset is None:
+        return window
+
+    return Window(
+        window.col_off - ref_measurement.subset.col_off + test_measurement.subset.col_off,
+        window.row_off - ref_measurement.subset.row_off + test_measurement.subset.row_off,
+        window.width,
+        window.height,
+    )
+
+
+def evaluate_blocks(
+    ref_measurement: Measurement,
+    test_measurement: Measurement,
+    writer: Optional[ResidualWriter] = None,
+    spatial: Optional[SpatialStatistics] = None,
+    relative_accuracy: float = SKETCH_RELATIVE_ACCURACY,
+) -> Tuple[Tuple[float, float], ResidualAccumulator]:
+    """
+    Block-streaming equivalent of evaluate_nulls and evaluate.
+    The internal block windows of the reference dataset are read in turn
+    from both datasets, and the null transitions and residual statistics
+    are accumulated, such that only a few blocks are held in memory.
+    If a writer is given, then the residuals of each block are also
+    written to the residual image (see gost.residual_export), and if the
+    spatial statistics are given, then they're updated by each block.
+    The percentiles of floating point residuals are estimated within
+    relative_accuracy (see gost.stats.QuantileSketch).
+    """
+    residuals = ResidualAccumulator(relative_accuracy=relative_accuracy)
+    valid_2_null = 0
+    null_2_valid = 0
+    size = 0
+
+    for window in ref_measurement.block_windows():
+        test_window = corresponding_window(ref_measurement, test_measurement, window)
+        ref_data = ref_measurement.read(window)
+        test_data = test_measurement.read(test_window)
+
+        # the masks are evaluated from the pixels read (or the mask bands)
+        ref_mask = ref_measurement.valid_mask(window, ref_data)
+        test_mask = test_measurement.valid_mask(test_window, test_data)
+
+        # null transitions are evaluated using the reference nodata value
+        if _same_nodata(ref_measurement.nodata, test_measurement.nodata):
+            test_null_mask = test_mask
+        else:
+            test_null_mask = null_mask(
+                ref_measurement, test_measurement, test_window, test_data
+            )
+        valid_2_null += int((ref_mask & ~test_null_mask).sum())
+        null_2_valid += int((~ref_mask & test_null_mask).sum())
+        size += ref_mask.size
+
+        mask = ref_mask & test_mask
+        block_residual = residual(ref_data[mask], test_data[mask])
+        residuals.update(block_residual)
+
+        # the window relative to the subset being evaluated
+        subset_window = ref_measurement.subset_window(window)
+
+        if writer is not None:
+            writer.write(subset_window, block_residual, mask)
+
+        if spatial is not None:
+            spatial.update(block_residual, mask, subset_window)
+
+    null_info = (valid_2_null / size, null_2_valid / size)
+
+    return null_info, residuals
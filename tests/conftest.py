@@ -1,5 +1,12 @@
 import pytest
 import numpy
+import rasterio
+import yaml
+from affine import Affine
+
+from gost.data_model import Measurement as GeoTiffMeasurement
+from gost.masks import pack, valid_mask
+from . import LS8_ODC_DOC_PATH
 
 M999 = -999
 REF_DATA1 = numpy.array(
@@ -81,6 +88,126 @@ class Measurement:
     def read(self):
         return self.data
 
+    def valid_mask(self):
+        return valid_mask(self.data, 0 if self.nodata is None else self.nodata)
+
+    def valid_bits(self):
+        return pack(self.valid_mask())
+
+
+@pytest.fixture
+def geotiff_measurement(tmp_path):
+    """
+    Factory for writing an array to a GeoTIFF and returning the
+    gost.data_model.Measurement referring to it.
+    """
+
+    def _write(name, data, nodata, **kwargs):
+        transform = Affine(30.0, 0.0, 500000.0, 0.0, -30.0, 7000000.0)
+        profile = {
+            "driver": "GTiff",
+            "height": data.shape[0],
+            "width": data.shape[1],
+            "count": 1,
+            "dtype": data.dtype.name,
+            "nodata": nodata,
+            "crs": "EPSG:32755",
+            "transform": transform,
+        }
+        profile.update(kwargs)
+
+        with rasterio.open(tmp_path.joinpath(name), "w", **profile) as dst:
+            dst.write(data, 1)
+
+        measurement = GeoTiffMeasurement(
+            path=name,
+            parent_dir=str(tmp_path),
+            file_format="GeoTIFF",
+            transform=list(profile["transform"]),
+            shape=data.shape,
+        )
+
+        return measurement
+
+    return _write
+
+
+@pytest.fixture
+def odc_granule_pair(tmp_path):
+    """
+    Write a reference and test ODC document, each with a small subset of
+    the measurements written as GeoTIFFs.
+    Returns the pathnames to the reference and test documents.
+    """
+
+    with open(LS8_ODC_DOC_PATH) as src:
+        doc = yaml.load(src, Loader=yaml.FullLoader)
+
+    doc["grids"]["default"]["shape"] = [96, 80]
+    doc["grids"]["panchromatic"]["shape"] = [192, 160]
+
+    # name: (dtype, nodata)
+    measurements = {
+        "nbar_blue": ("int16", -999),
+        "nbar_panchromatic": ("int16", -999),
+        "oa_fmask": ("uint8", 0),
+        "oa_nbar_contiguity": ("uint8", 255),
+        "oa_solar_zenith": ("float32", numpy.nan),
+    }
+    doc["measurements"] = {
+        key: value
+        for key, value in doc["measurements"].items()
+        if key in measurements
+    }
+
+    rng = numpy.random.default_rng(0)
+    pathnames = []
+
+    for name in ["reference", "test"]:
+        outdir = tmp_path.joinpath(name)
+        outdir.mkdir()
+
+        for measurement_name, (dtype, nodata) in measurements.items():
+            measurement = doc["measurements"][measurement_name]
+            grid = doc["grids"][measurement.get("grid", "default")]
+            shape = grid["shape"]
+
+            if measurement_name == "oa_fmask":
+                data = rng.integers(0, 6, shape).astype(dtype)
+            elif measurement_name == "oa_nbar_contiguity":
+                data = rng.integers(0, 2, shape).astype(dtype)
+            elif dtype == "float32":
+                data = rng.uniform(20, 60, shape).astype(dtype)
+                data[:4] = nodata
+            else:
+                data = rng.integers(0, 10000, shape).astype(dtype)
+                data[:4] = nodata
+
+            profile = {
+                "driver": "GTiff",
+                "height": shape[0],
+                "width": shape[1],
+                "count": 1,
+                "dtype": dtype,
+                "nodata": nodata,
+                "crs": doc["crs"],
+                "transform": Affine(*grid["transform"][:6]),
+                "tiled": True,
+                "blockxsize": 32,
+                "blockysize": 32,
+            }
+            out_fname = outdir.joinpath(measurement["path"])
+            with rasterio.open(out_fname, "w", **profile) as dst:
+                dst.write(data, 1)
+
+        pathname = outdir.joinpath(LS8_ODC_DOC_PATH.name)
+        with open(pathname, "w") as src:
+            yaml.dump(doc, src)
+
+        pathnames.append(pathname)
+
+    return tuple(pathnames)
+
 
 @pytest.fixture
 def ref_fmask_measurement1():
@@ -0,0 +1,86 @@
+import numpy
+from affine import Affine
+
+from gost.alignment import Alignment, align
+from gost.utils import evaluate, evaluate_blocks, evaluate_nulls
+
+TRANSFORM = Affine(30.0, 0.0, 500000.0, 0.0, -30.0, 7000000.0)
+TILED = {"tiled": True, "blockxsize": 16, "blockysize": 16}
+
+
+def _data():
+    rng = numpy.random.default_rng(2)
+    return rng.integers(0, 1000, (64, 64)).astype("int16")
+
+
+def test_align_offset(geotiff_measurement):
+    """Test that offset co-registered grids compare their intersection."""
+    data = _data()
+    ref = geotiff_measurement("reference.tif", data, -999, **TILED)
+    test = geotiff_measurement(
+        "test.tif",
+        data[8:, 4:].copy(),
+        -999,
+        transform=TRANSFORM * Affine.translation(4, 8),
+        **TILED,
+    )
+
+    assert align(ref, test) == Alignment.OFFSET
+    assert ref.subset_shape() == test.subset_shape() == (56, 60)
+
+    ref.open()
+    test.open()
+
+    null_info, residuals = evaluate_blocks(ref, test)
+    assert null_info == (0.0, 0.0)
+    assert residuals.count == 56 * 60
+    assert residuals.n_nonzero == 0
+
+    assert evaluate_nulls(ref, test) == (0.0, 0.0)
+    assert (evaluate(ref, test) == 0).all()
+
+    ref.close()
+    test.close()
+
+
+def test_align_resampled(geotiff_measurement):
+    """Test that differing grids are resampled onto the reference grid."""
+    data = _data()
+    ref = geotiff_measurement("reference.tif", data, -999, **TILED)
+    test = geotiff_measurement(
+        "test.tif",
+        data[::2, ::2].copy(),
+        -999,
+        transform=TRANSFORM * Affine.scale(2),
+        **TILED,
+    )
+
+    assert align(ref, test) == Alignment.RESAMPLED
+    assert ref.subset_shape() == test.subset_shape() == (64, 64)
+
+    ref.open()
+    test.open()
+
+    # nearest neighbour replicates each coarse pixel
+    expected = numpy.repeat(numpy.repeat(data[::2, ::2], 2, axis=0), 2, axis=1)
+    assert (test.read() == expected).all()
+
+    null_info, residuals = evaluate_blocks(ref, test)
+    assert null_info == (0.0, 0.0)
+    assert residuals.count == 64 * 64
+
+    ref.close()
+    test.close()
+    assert test.dataset is None
+
+
+def test_align_disjoint(geotiff_measurement):
+    """Test that grids without any overlap have nothing to evaluate."""
+    data = _data()
+    ref = geotiff_measurement("reference.tif", data, -999)
+    test = geotiff_measurement(
+        "test.tif", data, -999, transform=TRANSFORM * Affine.translation(100, 0)
+    )
+
+    assert align(ref, test) == Alignment.DISJOINT
+    assert 0 in ref.subset_shape()
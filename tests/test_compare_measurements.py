@@ -0,0 +1,164 @@
+import pandas
+import pytest
+import rasterio
+import yaml
+from affine import Affine
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window, bounds
+
+from gost.compare_measurements import process_yamls
+from gost.digests import DigestCache
+from gost.odc_documents import load_odc_metadata
+
+
+@pytest.fixture
+def query_dataframe(odc_granule_pair):
+    """Query style dataframe repeating the same granule pair."""
+    reference, test = odc_granule_pair
+    records = {
+        "yaml_pathname_reference": [str(reference)] * 3,
+        "yaml_pathname_test": [str(test)] * 3,
+    }
+
+    return pandas.DataFrame(records)
+
+
+def _assert_results_equal(results, results2):
+    """Compare each of the general, fmask, contiguity and shadow results."""
+    for records, records2 in zip(results[:4], results2[:4]):
+        pandas.testing.assert_frame_equal(
+            pandas.DataFrame(records), pandas.DataFrame(records2)
+        )
+
+
+def test_process_yamls_threads(query_dataframe):
+    """Test that a threaded evaluation retains the record order."""
+    results = process_yamls(query_dataframe)
+    results2 = process_yamls(query_dataframe, threads=3)
+
+    assert len(results[0]["measurement"]) == 9
+    _assert_results_equal(results, results2)
+
+
+def test_process_yamls_accumulators(query_dataframe):
+    """Test the residual statistics merged across granules, and their accuracy."""
+    results = process_yamls(query_dataframe.iloc[:1])
+    results2 = process_yamls(query_dataframe, relative_accuracy=0.01)
+
+    accumulators = results[5]
+    accumulators2 = results2[5]
+    assert sorted(accumulators) == sorted(results[0]["measurement"])
+
+    # the same granule three times over
+    for name, accumulator in accumulators.items():
+        merged = accumulators2[name]
+        assert merged.count == 3 * accumulator.count
+        assert merged.histogram is None or merged.robust_statistics() == (
+            accumulator.robust_statistics()
+        )
+
+    sketch = accumulators2["oa_solar_zenith"].sketch
+    assert sketch.relative_accuracy == 0.01
+    assert sketch.count == 3 * accumulators["oa_solar_zenith"].sketch.count
+
+
+def test_process_yamls_prefetch(query_dataframe):
+    """Test that prefetching the records doesn't alter the results."""
+    results = process_yamls(query_dataframe)
+    results2 = process_yamls(query_dataframe, prefetch_depth=2)
+
+    _assert_results_equal(results, results2)
+
+
+def test_process_yamls_bbox(odc_granule_pair, query_dataframe):
+    """Test that a bounding box restricts the evaluation to a window."""
+    reference, _ = odc_granule_pair
+    doc = load_odc_metadata(reference)
+    measurement = doc.measurements["nbar_blue"]
+
+    window = Window(10, 20, 30, 30)
+    bbox = transform_bounds(doc.crs, "EPSG:4326", *bounds(window, measurement.transform))
+
+    results = process_yamls(query_dataframe.iloc[:1])
+    results2 = process_yamls(query_dataframe.iloc[:1], bbox=bbox)
+
+    full_size = results[0]["size"][0]
+    size = results2[0]["size"][0]
+
+    assert results2[0]["measurement"] == results[0]["measurement"]
+    assert window.width * window.height <= size < full_size
+
+
+def test_process_yamls_digests(odc_granule_pair):
+    """Test that identical files short-circuit to the same results."""
+    reference, _ = odc_granule_pair
+    dataframe = pandas.DataFrame(
+        {
+            "yaml_pathname_reference": [str(reference)],
+            "yaml_pathname_test": [str(reference)],
+        }
+    )
+    digests = DigestCache()
+
+    results = process_yamls(dataframe)
+    results2 = process_yamls(dataframe, digests=digests)
+
+    _assert_results_equal(results, results2)
+
+    # the fmask classes are recorded for reuse
+    fmask = [record for record in digests.records.values() if record.class_counts]
+    assert len(fmask) == 2
+
+
+def test_process_yamls_stack_bands(odc_granule_pair, query_dataframe):
+    """Test that evaluating the reflectance bands as a stack gives the same results."""
+    # a second band on the default grid, so the nbar bands form a stack
+    for pathname in odc_granule_pair:
+        with open(pathname) as src:
+            doc = yaml.load(src, Loader=yaml.FullLoader)
+
+        doc["measurements"]["nbar_green"] = dict(doc["measurements"]["nbar_blue"])
+
+        with open(pathname, "w") as src:
+            yaml.dump(doc, src)
+
+    results = process_yamls(query_dataframe)
+    results2 = process_yamls(query_dataframe, stack_bands=True)
+
+    assert "nbar_green" in results[0]["measurement"]
+    _assert_results_equal(results, results2)
+
+
+def test_process_yamls_shared_masks(query_dataframe):
+    """Test that sharing the masks of a grid doesn't alter the results."""
+    results = process_yamls(query_dataframe)
+    results2 = process_yamls(query_dataframe, shared_masks=True, threads=2)
+
+    _assert_results_equal(results, results2)
+
+
+def test_process_yamls_quick_look_resampled(odc_granule_pair, query_dataframe):
+    """Test a quick-look of a resampled pair, with the measurements prefetched."""
+    _, test = odc_granule_pair
+    with open(test) as src:
+        doc = yaml.load(src, Loader=yaml.FullLoader)
+
+    # shift the test nbar_blue grid by half a pixel, so it's resampled
+    grid = dict(doc["grids"]["default"])
+    grid["transform"] = list(grid["transform"])
+    grid["transform"][2] += 15
+    doc["grids"]["shifted"] = grid
+    doc["measurements"]["nbar_blue"]["grid"] = "shifted"
+
+    with open(test, "w") as src:
+        yaml.dump(doc, src)
+
+    pathname = test.parent.joinpath(doc["measurements"]["nbar_blue"]["path"])
+    with rasterio.open(pathname, "r+") as dst:
+        dst.transform = Affine(*grid["transform"][:6])
+
+    results = process_yamls(query_dataframe.iloc[:1], decimation=2)
+    results2 = process_yamls(query_dataframe.iloc[:1], decimation=2, prefetch_depth=1)
+
+    assert "nbar_blue" in results[0]["measurement"]
+    _assert_results_equal(results, results2)
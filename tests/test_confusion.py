@@ -0,0 +1,62 @@
+import numpy
+import pytest
+
+from gost.confusion import ConfusionMatrix, confusion_matrix
+
+VALUES = [0, 1, 2, 3, 4, 5]
+
+
+def test_confusion_matrix():
+    """Test the matrix and agreement metrics against direct evaluation."""
+    rng = numpy.random.default_rng(3)
+    ref = rng.integers(0, 6, 5000).astype("uint8")
+    test = numpy.where(rng.random(5000) > 0.2, ref, rng.integers(0, 6, 5000))
+    test = test.astype("uint8")
+
+    matrix = confusion_matrix(ref, test, VALUES, chunk_size=999)
+
+    expected = numpy.zeros((6, 6), dtype="int64")
+    numpy.add.at(expected, (ref, test), 1)
+    numpy.testing.assert_array_equal(matrix.classes, expected)
+
+    observed = (ref == test).mean()
+    chance = sum((ref == v).mean() * (test == v).mean() for v in VALUES)
+    assert matrix.overall_accuracy() == pytest.approx(observed)
+    assert matrix.kappa() == pytest.approx((observed - chance) / (1 - chance))
+
+    agreed = ((ref == 1) & (test == 1)).sum()
+    f1 = 2 * agreed / ((ref == 1).sum() + (test == 1).sum())
+    assert matrix.f1()[1] == pytest.approx(f1)
+
+
+@pytest.mark.parametrize("dtype", ["uint8", "int16", "int32", "float32"])
+def test_unexpected_values(dtype):
+    """Test that values outside of the classes are counted separately."""
+    ref = numpy.array([0, 1, 7, 1, 2, 255], dtype=dtype)
+    test = numpy.array([0, 9, 1, 1, 2, 2], dtype=dtype)
+
+    matrix = confusion_matrix(ref, test, VALUES)
+
+    assert matrix.unexpected() == 3
+    assert matrix.classes.sum() == 3
+    assert matrix.overall_accuracy() == 1.0
+
+    # the transitions to unexpected values are excluded from the percentages
+    percentages = matrix.percentages()
+    assert percentages[1, 1] == 100.0
+    assert numpy.isnan(percentages[3]).all()
+
+
+def test_merge_identity():
+    """Test merging matrices and the matrix of identical measurements."""
+    counts = numpy.array([4, 0, 2, 0, 0, 1])
+    data = numpy.repeat(VALUES, counts).astype("uint8")
+
+    matrix = ConfusionMatrix(VALUES)
+    for chunk in numpy.array_split(data, 3):
+        matrix.merge(confusion_matrix(chunk, chunk, VALUES))
+
+    identity = ConfusionMatrix.identity(VALUES, counts)
+    numpy.testing.assert_array_equal(matrix.counts, identity.counts)
+    assert identity.kappa() == 1.0
+    assert numpy.isnan(identity.f1()[1])
@@ -0,0 +1,23 @@
+import os
+
+from gost.digests import DigestCache
+
+
+def test_digest_cache_identical(tmp_path):
+    """Test the identical file check, and the reuse of the digests."""
+    pathnames = [tmp_path.joinpath(name) for name in ["a.tif", "b.tif", "c.tif"]]
+    for pathname, content in zip(pathnames, [b"abcd", b"abcd", b"abce"]):
+        pathname.write_bytes(content)
+
+    cache = DigestCache()
+    assert cache.identical(pathnames[0], pathnames[1])
+    assert not cache.identical(pathnames[0], pathnames[2])
+
+    # restored records are reused while the file is unchanged
+    cache2 = DigestCache.from_dataframe(cache.to_dataframe())
+    record = cache2.records[str(pathnames[0])]
+    assert cache2.record(pathnames[0]) is record
+
+    stat = pathnames[0].stat()
+    os.utime(pathnames[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert cache2.record(pathnames[0]) is not record
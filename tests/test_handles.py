@@ -0,0 +1,35 @@
+import numpy
+
+from gost.handles import DatasetPool
+
+
+def test_dataset_pool_reuse(geotiff_measurement):
+    """Test that released handles are reused, and the LRU are evicted."""
+    data = numpy.zeros((8, 8), dtype="int16")
+    measurements = [geotiff_measurement(f"band{i}.tif", data, -999) for i in range(3)]
+    pathnames = [measurement.pathname() for measurement in measurements]
+    pool = DatasetPool(maxsize=2)
+
+    dataset = pool.acquire(pathnames[0])
+    # in use, so a second reader is given a new handle
+    dataset2 = pool.acquire(pathnames[0])
+    assert dataset2 is not dataset
+
+    pool.release(pathnames[0], dataset)
+    pool.release(pathnames[0], dataset2)
+    assert pool.acquire(pathnames[0]) is dataset2
+    assert pool.counters() == {"hits": 1, "misses": 2, "evictions": 0, "idle": 1}
+
+    pool.release(pathnames[0], dataset2)
+    for pathname in pathnames[1:]:
+        pool.release(pathname, pool.acquire(pathname))
+
+    # the least recently used handles were closed
+    assert dataset.closed and dataset2.closed
+    assert pool.counters()["evictions"] == 2
+
+    pool.evict(pathnames[1])
+    assert pool.counters()["idle"] == 1
+
+    pool._after_fork()
+    assert pool.counters() == {"hits": 0, "misses": 0, "evictions": 0, "idle": 0}
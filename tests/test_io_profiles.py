@@ -0,0 +1,39 @@
+import numpy
+import pytest
+from rasterio.env import get_gdal_config
+
+from gost.io_profiles import PROFILES, IOProfile, benchmark, load_profile
+
+
+def test_load_profile(tmp_path):
+    """Test loading the profiles by name, and as written by io-tune."""
+    assert load_profile(None) is PROFILES["default"]
+    assert load_profile("lustre") is PROFILES["lustre"]
+
+    pathname = tmp_path.joinpath("io-profile.json")
+    PROFILES["local-ssd"].write(pathname)
+    assert load_profile(pathname) == PROFILES["local-ssd"]
+
+    with pytest.raises(ValueError):
+        load_profile("no-such-profile")
+
+
+def test_profile_env():
+    """Test that the options of a profile are applied within its environment."""
+    profile = IOProfile("test", {"GDAL_NUM_THREADS": "ALL_CPUS"})
+
+    with profile.env():
+        assert get_gdal_config("GDAL_NUM_THREADS") == "ALL_CPUS"
+
+
+def test_benchmark(geotiff_measurement):
+    """Test that each profile is timed, fastest first."""
+    data = numpy.ones((64, 64), dtype="int16")
+    measurements = [geotiff_measurement(f"band{i}.tif", data, -999) for i in range(2)]
+    profiles = [PROFILES["default"], PROFILES["local-ssd"]]
+
+    timings = benchmark(measurements, profiles, repeats=2)
+
+    assert sorted(timings.profile) == ["default", "local-ssd"]
+    assert timings.seconds.is_monotonic_increasing
+    assert all(measurement.closed for measurement in measurements)
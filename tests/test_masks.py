@@ -0,0 +1,79 @@
+import numpy
+import rasterio
+
+from gost.masks import SharedMasks, null_transitions, pack, popcount
+from gost.utils import evaluate_nulls
+
+
+def test_null_transitions():
+    """Test the packed transition counts against the boolean masks."""
+    rng = numpy.random.default_rng(0)
+    ref_mask = rng.random((13, 11)) > 0.3
+    test_mask = rng.random((13, 11)) > 0.3
+
+    counts = null_transitions(pack(ref_mask), pack(test_mask))
+
+    assert counts == ((ref_mask & ~test_mask).sum(), (~ref_mask & test_mask).sum())
+    assert popcount(pack(ref_mask)) == ref_mask.sum()
+
+
+def test_internal_mask(geotiff_measurement, tmp_path):
+    """Test that a GDAL per-dataset mask defines the valid pixels."""
+    data = numpy.arange(1, 65, dtype="int16").reshape(8, 8)
+    measurement = geotiff_measurement("masked.tif", data, None)
+
+    mask = numpy.ones((8, 8), dtype="bool")
+    mask[:2] = False
+    with rasterio.open(tmp_path.joinpath("masked.tif"), "r+") as dst:
+        dst.write_mask(mask)
+
+    measurement.open()
+    valid = measurement.valid_mask()
+
+    numpy.testing.assert_array_equal(valid, mask)
+    assert measurement.valid_mask() is valid
+    assert not valid.flags.writeable
+
+    measurement.close()
+
+
+def test_evaluate_nulls_nodata_differs(geotiff_measurement):
+    """Test the null transitions are defined by the reference nodata value."""
+    ref_data = numpy.array([[-999, 1, 2], [3, 4, 5]], dtype="int16")
+    test_data = numpy.array([[-999, 0, 2], [3, -999, 5]], dtype="int16")
+    reference = geotiff_measurement("reference.tif", ref_data, -999)
+    test = geotiff_measurement("test.tif", test_data, 0)
+
+    reference.open()
+    test.open()
+
+    assert evaluate_nulls(reference, test) == (1 / 6, 0.0)
+
+    reference.close()
+    test.close()
+
+
+def test_shared_masks(geotiff_measurement):
+    """Test that measurements on the same grid and nodata share a packed mask."""
+    data = numpy.arange(1, 65, dtype="int16").reshape(8, 8)
+    data[:3] = -999
+    masks = SharedMasks()
+
+    measurements = [
+        geotiff_measurement("blue.tif", data, -999),
+        geotiff_measurement("green.tif", data, -999),
+        geotiff_measurement("other-nodata.tif", data, 0),
+    ]
+    for measurement in measurements:
+        measurement.shared_masks = masks
+        measurement.open()
+
+    blue, green, other = measurements
+    numpy.testing.assert_array_equal(blue.valid_mask(), data != -999)
+    numpy.testing.assert_array_equal(green.valid_mask(), data != -999)
+    assert green.valid_bits() is blue.valid_bits()
+    assert other.valid_mask().all()
+    assert (masks.hits, masks.misses) == (3, 2)
+
+    for measurement in measurements:
+        measurement.close()
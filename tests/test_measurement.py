@@ -1,9 +1,14 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
 from typing import Tuple
+import h5py
+import numpy
 import pytest
 from affine import Affine
 
 from gost.odc_documents import load_odc_metadata
-from gost.data_model import Granule
+from gost import data_model
+from gost.data_model import Granule, H5Container, H5Measurement
 from . import LS5_ODC_DOC_PATH, LS7_ODC_DOC_PATH, LS8_ODC_DOC_PATH
 
 LS5_GRN = load_odc_metadata(LS5_ODC_DOC_PATH)
@@ -66,3 +71,95 @@ def test_measurement_closed(
 ):
     """Check that the measurement file handler is closed."""
     assert granule.measurements[measurement_name].closed == expected_result
+
+
+def test_measurement_read_once(geotiff_measurement):
+    """Check that the pixels are decoded once and released on close."""
+    data = numpy.arange(64, dtype="int16").reshape(8, 8)
+    measurement = geotiff_measurement("band.tif", data, -999)
+    measurement.open()
+
+    first = measurement.read()
+    assert measurement.read() is first
+    assert not first.flags.writeable
+    assert (first == data).all()
+
+    measurement.close()
+    assert measurement.closed
+    assert measurement._buffer is None
+
+
+def test_h5_measurement_shared_container(tmp_path):
+    """Check that HDF5 measurements of a granule share the file handle."""
+    data = numpy.arange(64, dtype="int16").reshape(8, 8)
+    with h5py.File(str(tmp_path.joinpath("granule.h5")), "w") as fid:
+        for name in ["RES-GROUP-0/BAND-1", "RES-GROUP-0/BAND-2"]:
+            dset = fid.create_dataset(name, data=data, chunks=(4, 8))
+            dset.attrs["no_data_value"] = -999
+
+    kwargs = {
+        "path": "granule.h5",
+        "parent_dir": str(tmp_path),
+        "file_format": "HDF5",
+        "transform": [30.0, 0.0, 0.0, 0.0, -30.0, 0.0],
+        "shape": (8, 8),
+    }
+    measurements = {
+        "band_1": H5Measurement(dataset_pathname="RES-GROUP-0/BAND-1", **kwargs),
+        "band_2": H5Measurement(dataset_pathname="RES-GROUP-0/BAND-2", **kwargs),
+    }
+    granule = Granule(measurements=measurements)
+
+    container = measurements["band_1"].container
+    assert container is measurements["band_2"].container
+
+    for measurement in measurements.values():
+        measurement.open()
+        assert measurement.nodata == -999
+        assert (measurement.read() == data).all()
+        assert len(list(measurement.block_windows())) == 2
+        measurement.close()
+
+    assert container.fid is not None
+    granule.close_containers()
+    assert container.fid is None
+
+
+def test_h5_container_threads(tmp_path, monkeypatch):
+    """Check that threads opening a container concurrently share one handle."""
+    pathname = tmp_path.joinpath("granule.h5")
+    with h5py.File(str(pathname), "w") as fid:
+        fid.create_dataset("BAND-1", data=numpy.zeros((2, 2)))
+
+    opened = []
+    h5_file = h5py.File
+
+    def _open(*args, **kwargs):
+        time.sleep(0.05)
+        opened.append(args[0])
+        return h5_file(*args, **kwargs)
+
+    container = H5Container(pathname)
+    monkeypatch.setattr(data_model.h5py, "File", _open)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        fids = list(executor.map(lambda _: container.open(), range(4)))
+
+    assert len(opened) == 1
+    assert all(fid is fids[0] for fid in fids)
+
+    container.close()
+
+
+def test_measurement_decimated_read(geotiff_measurement):
+    """Check that a quick-look read samples the full resolution pixels."""
+    data = numpy.arange(90, dtype="int16").reshape(9, 10)
+    measurement = geotiff_measurement("band.tif", data, -999)
+    measurement.decimation = 4
+    measurement.open()
+
+    quick_look = measurement.read()
+    assert quick_look.shape == (3, 3)
+    assert numpy.isin(quick_look, data).all()
+
+    measurement.close()
@@ -0,0 +1,78 @@
+import numpy
+import pytest
+from rasterio.windows import Window
+
+DATA = numpy.arange(50 * 70, dtype="int16").reshape(50, 70)
+
+
+@pytest.mark.parametrize(
+    "name, kwargs",
+    [
+        ("strips.tif", {}),
+        ("single-strip.tif", {"blockysize": 50}),
+        ("envi.img", {"driver": "ENVI"}),
+    ],
+)
+def test_mapped_rows(geotiff_measurement, name, kwargs):
+    """Test that row-major uncompressed bands are read as views of the file."""
+    measurement = geotiff_measurement(name, DATA, -999, **kwargs)
+    measurement.open()
+
+    assert measurement._mapped is not None
+    data = measurement.read()
+    assert isinstance(data.base, numpy.memmap)
+    numpy.testing.assert_array_equal(data, DATA)
+
+    window = Window(5, 10, 20, 30)
+    numpy.testing.assert_array_equal(measurement.read(window), DATA[10:40, 5:25])
+
+    measurement.close()
+    assert measurement._mapped is None
+
+
+def test_mapped_subset(geotiff_measurement):
+    """Test that the subset of a mapped band is a view of the file."""
+    measurement = geotiff_measurement("strips.tif", DATA, -999)
+    measurement.subset = Window(10, 5, 30, 20)
+    measurement.open()
+
+    data = measurement.read()
+    assert isinstance(data.base, numpy.memmap)
+    numpy.testing.assert_array_equal(data, DATA[5:25, 10:40])
+
+    measurement.close()
+
+
+def test_mapped_tiles(geotiff_measurement):
+    """Test that windows within a tile are views, otherwise read via GDAL."""
+    measurement = geotiff_measurement(
+        "tiles.tif", DATA, -999, tiled=True, blockxsize=32, blockysize=32
+    )
+    measurement.open()
+
+    assert measurement._mapped.tiled
+    within = measurement.read(Window(34, 33, 20, 10))
+    assert isinstance(within.base, numpy.memmap)
+    numpy.testing.assert_array_equal(within, DATA[33:43, 34:54])
+
+    for window in measurement.block_windows():
+        numpy.testing.assert_array_equal(
+            measurement.read(window), DATA[window.toslices()]
+        )
+
+    spanning = measurement.read(Window(20, 20, 30, 30))
+    numpy.testing.assert_array_equal(spanning, DATA[20:50, 20:50])
+    numpy.testing.assert_array_equal(measurement.read(), DATA)
+
+    measurement.close()
+
+
+def test_compressed_not_mapped(geotiff_measurement):
+    """Test that compressed bands are decoded through GDAL."""
+    measurement = geotiff_measurement("deflate.tif", DATA, -999, compress="deflate")
+    measurement.open()
+
+    assert measurement._mapped is None
+    numpy.testing.assert_array_equal(measurement.read(), DATA)
+
+    measurement.close()
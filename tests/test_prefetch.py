@@ -0,0 +1,84 @@
+import pandas
+import pytest
+import yaml
+
+from gost.compare_measurements import process_yamls
+from gost.prefetch import iterate_granules, measurement_pairs
+
+
+def _dataframe(odc_granule_pair, n_records=3):
+    """Query style dataframe repeating the same granule pair."""
+    reference, test = odc_granule_pair
+    records = {
+        "yaml_pathname_reference": [str(reference)] * n_records,
+        "yaml_pathname_test": [str(test)] * n_records,
+        "record": list(range(n_records)),
+    }
+
+    return pandas.DataFrame(records)
+
+
+def test_prefetch_order(odc_granule_pair):
+    """Test that the prefetched records are yielded in order."""
+    dataframe = _dataframe(odc_granule_pair)
+    records = [g.row.record for g in iterate_granules(dataframe, depth=2)]
+
+    assert records == [0, 1, 2]
+
+
+def test_prefetch_decoded(odc_granule_pair):
+    """Test that measurements are decoded ahead of time."""
+    dataframe = _dataframe(odc_granule_pair)
+
+    for granule in iterate_granules(dataframe, depth=1):
+        pairs = list(measurement_pairs(granule.doc_test, granule.doc_reference))
+        assert len(pairs) == 5
+        assert granule.nbytes > 0
+
+        for _, test, reference in pairs:
+            assert not test.closed
+            assert test._buffer is not None
+            test.close()
+            reference.close()
+
+
+def test_prefetch_memory_limit(odc_granule_pair):
+    """Test that nothing is decoded ahead of time beyond the memory limit."""
+    dataframe = _dataframe(odc_granule_pair)
+
+    for granule in iterate_granules(dataframe, depth=2, memory_limit=0):
+        assert granule.nbytes == 0
+        for _, test, reference in measurement_pairs(
+            granule.doc_test, granule.doc_reference
+        ):
+            assert test.closed
+            assert reference.closed
+
+
+def test_prefetch_early_exit(odc_granule_pair):
+    """Test that the background thread is stopped when iteration ends early."""
+    dataframe = _dataframe(odc_granule_pair, n_records=10)
+
+    for granule in iterate_granules(dataframe, depth=2):
+        break
+
+    assert granule.row.record == 0
+
+
+def test_prefetch_failure(odc_granule_pair):
+    """Test that a record failing in the background thread is raised in order."""
+    reference, _ = odc_granule_pair
+
+    with open(reference) as src:
+        doc = yaml.load(src, Loader=yaml.FullLoader)
+    del doc["measurements"]["nbar_blue"]
+    with open(reference, "w") as src:
+        yaml.dump(doc, src)
+
+    dataframe = _dataframe(odc_granule_pair)
+
+    with pytest.raises(KeyError):
+        process_yamls(dataframe, prefetch_depth=1)
+
+    with pytest.raises(KeyError):
+        process_yamls(dataframe, prefetch_depth=0)
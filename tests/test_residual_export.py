@@ -0,0 +1,56 @@
+import numpy
+import pandas
+import rasterio
+
+from gost.compare_measurements import process_yamls
+from gost.odc_documents import load_odc_metadata
+from gost.residual_export import ResidualExport
+
+
+def _dataframe(odc_granule_pair):
+    reference, test = odc_granule_pair
+    return pandas.DataFrame(
+        {"yaml_pathname_reference": [str(reference)], "yaml_pathname_test": [str(test)]}
+    )
+
+
+def test_export_residuals(odc_granule_pair, tmp_path):
+    """Test the residual COG of a selected measurement, and unchanged results."""
+    reference, test = odc_granule_pair
+    doc = load_odc_metadata(reference)
+    export = ResidualExport(tmp_path.joinpath("residuals"), ["nbar_blue"])
+
+    results = process_yamls(_dataframe(odc_granule_pair))
+    results2 = process_yamls(_dataframe(odc_granule_pair), export=export)
+
+    pandas.testing.assert_frame_equal(
+        pandas.DataFrame(results[0]), pandas.DataFrame(results2[0])
+    )
+
+    pathname = export.pathname(doc.granule_id, "nbar_blue")
+    assert sorted(p.name for p in pathname.parent.iterdir()) == ["nbar_blue.tif"]
+
+    name = doc.measurements["nbar_blue"].path
+    with rasterio.open(reference.parent.joinpath(name)) as src:
+        ref_data = src.read(1).astype("int32")
+    with rasterio.open(test.parent.joinpath(name)) as src:
+        test_data = src.read(1).astype("int32")
+
+    with rasterio.open(pathname) as src:
+        assert src.tags(ns="IMAGE_STRUCTURE")["LAYOUT"] == "COG"
+        assert src.dtypes[0] == "int32"
+        data = src.read(1)
+        nodata = src.nodata
+
+    valid = (ref_data != -999) & (test_data != -999)
+    numpy.testing.assert_array_equal(data[valid], (ref_data - test_data)[valid])
+    assert (data[~valid] == nodata).all()
+
+
+def test_export_threshold(odc_granule_pair, tmp_path):
+    """Test that images not exceeding the threshold aren't retained."""
+    export = ResidualExport(tmp_path.joinpath("residuals"), threshold=1e6)
+
+    process_yamls(_dataframe(odc_granule_pair), export=export)
+
+    assert not list(export.outdir.rglob("*.tif"))
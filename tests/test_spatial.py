@@ -0,0 +1,93 @@
+import h5py
+import numpy
+import pandas
+import rasterio
+from rasterio.windows import Window
+
+from gost.compare_measurements import process_yamls
+from gost.odc_documents import load_odc_metadata
+from gost.spatial import SpatialStatistics, write_spatial
+
+
+def test_spatial_blocks():
+    """Test that updates by window match a brute force evaluation of each cell."""
+    rng = numpy.random.default_rng(0)
+    data = rng.integers(-3, 4, size=(50, 70))
+    mask = rng.random((50, 70)) > 0.2
+    mask[:10, :10] = False
+
+    spatial = SpatialStatistics((50, 70), (4, 3))
+    for row_off in range(0, 50, 16):
+        for col_off in range(0, 70, 32):
+            width, height = min(32, 70 - col_off), min(16, 50 - row_off)
+            window = Window(col_off, row_off, width, height)
+            block_mask = mask[window.toslices()]
+            spatial.update(data[window.toslices()][block_mask], block_mask, window)
+
+    spatial2 = SpatialStatistics((50, 70), (4, 3))
+    spatial2.update(data[mask], mask)
+
+    summary = spatial.summary()
+    for key, value in spatial2.summary().items():
+        numpy.testing.assert_array_equal(summary[key], value)
+
+    rows = numpy.arange(50) * 4 // 50
+    columns = numpy.arange(70) * 3 // 70
+    for row in range(4):
+        for column in range(3):
+            cell = mask & (rows == row)[:, None] & (columns == column)[None, :]
+            values = data[cell]
+            assert summary["count"][row, column] == values.size
+            assert summary["mean_residual"][row, column] == values.mean()
+            assert summary["max_absolute"][row, column] == abs(values).max()
+            assert summary["percent_different"][row, column] == (
+                (values != 0).mean() * 100
+            )
+
+    # cells without valid pixels
+    spatial3 = SpatialStatistics((50, 70), (10, 7))
+    spatial3.update(data[mask], mask)
+    assert numpy.isnan(spatial3.summary()["mean_residual"][0, 0])
+
+
+def test_process_yamls_spatial_grid(odc_granule_pair, tmp_path):
+    """Test the spatial grid of the general measurements, and unchanged records."""
+    reference, test = odc_granule_pair
+    doc = load_odc_metadata(reference)
+    dataframe = pandas.DataFrame(
+        {"yaml_pathname_reference": [str(reference)], "yaml_pathname_test": [str(test)]}
+    )
+
+    results = process_yamls(dataframe)
+    results2 = process_yamls(dataframe, spatial_grid=(4, 4))
+    results3 = process_yamls(dataframe, streaming=True, spatial_grid=(4, 4))
+
+    for idx in range(4):
+        pandas.testing.assert_frame_equal(
+            pandas.DataFrame(results[idx]), pandas.DataFrame(results2[idx])
+        )
+
+    assert not results[4]
+    assert set(results2[4]) == {
+        (doc.granule_id, name) for name in results[0]["measurement"]
+    }
+
+    cells = results2[4][(doc.granule_id, "nbar_blue")]
+    cells2 = results3[4][(doc.granule_id, "nbar_blue")]
+    for key, value in cells.items():
+        numpy.testing.assert_allclose(value, cells2[key])
+
+    # the maximum over the cells is that of the measurement (percent reflectance)
+    idx = results2[0]["measurement"].index("nbar_blue")
+    assert numpy.nanmax(cells["max_absolute"]) == results2[0]["max_absolute"][idx]
+
+    name = doc.measurements["nbar_blue"].path
+    with rasterio.open(reference.parent.joinpath(name)) as src:
+        valid = src.read(1) != src.nodata
+    assert cells["count"].sum() <= valid.sum()
+
+    with h5py.File(tmp_path.joinpath("results.h5"), "w") as fid:
+        write_spatial(fid, doc.granule_id, "nbar_blue", cells)
+        group = fid[doc.granule_id]["nbar_blue"]
+        data = group["mean_residual"][()]
+        numpy.testing.assert_array_equal(data, cells["mean_residual"])
@@ -0,0 +1,296 @@
+import pickle
+
+import h5py
+import numpy
+import pytest
+from scipy import stats
+
+from gost.stats import (
+    IntegerHistogram,
+    Moments,
+    QuantileSketch,
+    ResidualAccumulator,
+    merge_accumulators,
+    read_accumulator,
+    residual,
+    residual_dtype,
+    residual_kernel,
+    stack_kernel,
+    write_accumulator,
+)
+
+DATA = numpy.random.default_rng(42).normal(10, 3, 10000)
+
+
+def test_moments_chunked():
+    """Test that the moments of chunks agree with the full array."""
+    moments = Moments()
+    for chunk in numpy.array_split(DATA, 7):
+        moments.update(chunk)
+
+    assert moments.count == DATA.size
+    assert moments.mean == pytest.approx(DATA.mean())
+    assert moments.standard_deviation() == pytest.approx(numpy.std(DATA, ddof=1))
+    assert moments.skewness() == pytest.approx(stats.skew(DATA))
+    assert moments.kurtosis() == pytest.approx(stats.kurtosis(DATA))
+
+
+def test_moments_merge():
+    """Test that merging accumulators is equivalent to a single update."""
+    first = Moments()
+    first.update(DATA[:1234])
+    second = Moments()
+    second.update(DATA[1234:])
+    first.merge(second)
+
+    full = Moments()
+    full.update(DATA)
+
+    assert first.count == full.count
+    assert first.m2 == pytest.approx(full.m2)
+    assert first.m3 == pytest.approx(full.m3)
+    assert first.m4 == pytest.approx(full.m4)
+
+
+def test_integer_histogram_extend():
+    """Test that the histogram grows to fit the range of each chunk."""
+    hist = IntegerHistogram()
+    hist.update(numpy.array([3, 4, 4]))
+    hist.update(numpy.array([-2, 6]))
+
+    assert hist.offset == -2
+    assert hist.counts.tolist() == [1, 0, 0, 0, 0, 1, 2, 0, 1]
+
+
+def test_residual_summary():
+    """Test the residual summary for integer residuals."""
+    residual = numpy.array([0, 0, 1, -1, 2, 5, 0, -3, 0, 0, 0], dtype="int16")
+    accumulator = ResidualAccumulator()
+    accumulator.update(residual[:4])
+    accumulator.update(residual[4:])
+    result = accumulator.summary()
+
+    assert result["min_residual"] == -3
+    assert result["max_residual"] == 5
+    assert result["max_absolute"] == 5
+    assert result["percent_different"] == pytest.approx(5 / 11 * 100)
+    assert result["percentile_90"] == 3
+    assert result["percentile_99"] == 5
+    assert result["mean_residual"] == pytest.approx(4 / 11)
+
+
+def test_integer_histogram_fold():
+    """Test the absolute value histogram folded from a signed histogram."""
+    hist = IntegerHistogram()
+    hist.update(numpy.array([-5, -3, -3, 2, 3, 4, -2]))
+    folded = hist.fold()
+
+    assert folded.offset == 2
+    assert folded.counts.tolist() == [2, 3, 1, 1]
+
+
+def _percentiles(counts, locations):
+    # first bin whose cumulative count reaches the percentile
+    cumulative = numpy.cumsum(counts)
+    total = counts.sum()
+    return [locations[numpy.argmax(cumulative >= pct * total)] for pct in (0.9, 0.99)]
+
+
+def test_residual_kernel_integer():
+    """Test the single pass integer kernel against full array evaluation."""
+    rng = numpy.random.default_rng(0)
+    residual = rng.integers(-30000, 30000, 10001).astype("int16")
+    residual[::3] = 0
+    result = residual_kernel(residual, chunk_size=1000).summary()
+
+    abs_residual = numpy.abs(residual.astype("int64"))
+    minv = abs_residual.min()
+    counts = numpy.bincount(abs_residual - minv)
+    locations = minv + numpy.arange(counts.size)
+
+    assert result["min_residual"] == residual.min()
+    assert result["max_residual"] == residual.max()
+    assert result["max_absolute"] == abs_residual.max()
+    assert result["percent_different"] == pytest.approx(
+        numpy.count_nonzero(residual) / residual.size * 100
+    )
+    percentiles = [result["percentile_90"], result["percentile_99"]]
+    assert percentiles == _percentiles(counts, locations)
+    assert result["mean_residual"] == pytest.approx(residual.mean())
+    assert result["standard_deviation"] == pytest.approx(numpy.std(residual, ddof=1))
+    assert result["skewness"] == pytest.approx(stats.skew(residual))
+    assert result["kurtosis"] == pytest.approx(stats.kurtosis(residual))
+
+
+def test_residual_kernel_float():
+    """Test the float kernel against full array evaluation."""
+    residual = (DATA - 10).astype("float32")
+    result = residual_kernel(residual, chunk_size=999).summary()
+
+    abs_residual = numpy.sort(numpy.abs(residual))
+    counts = numpy.ones(abs_residual.size)
+
+    assert result["max_absolute"] == abs_residual.max()
+    percentiles = [result["percentile_90"], result["percentile_99"]]
+    assert percentiles == pytest.approx(_percentiles(counts, abs_residual), rel=0.005)
+    assert result["standard_deviation"] == pytest.approx(numpy.std(residual, ddof=1))
+    assert result["kurtosis"] == pytest.approx(stats.kurtosis(residual), rel=1e-5)
+
+
+@pytest.mark.parametrize("size", [1, 2, 1000, 1001])
+def test_robust_statistics(size):
+    """Test the histogram median, MAD and trimmed mean against numpy and scipy."""
+    residual = numpy.random.default_rng(size).integers(-50, 80, size).astype("int16")
+    result = residual_kernel(residual, chunk_size=100).robust_statistics()
+
+    assert result["median_residual"] == numpy.median(residual)
+    assert result["median_absolute_deviation"] == stats.median_abs_deviation(residual)
+    assert result["trimmed_mean_residual"] == pytest.approx(
+        stats.trim_mean(residual, 0.1)
+    )
+
+
+@pytest.mark.parametrize("dtype", ["int16", "float32"])
+def test_accumulator_serialise(dtype, tmp_path):
+    """Test accumulators round trip via pickle (MPI) and HDF5, then merge exactly."""
+    residual = numpy.random.default_rng(7).integers(-300, 300, 5000).astype(dtype)
+    parts = [residual_kernel(chunk) for chunk in numpy.array_split(residual, 3)]
+
+    pickled = [pickle.loads(pickle.dumps(part)) for part in parts]
+
+    with h5py.File(tmp_path.joinpath("results.h5"), "w") as fid:
+        for i, part in enumerate(parts):
+            write_accumulator(fid, f"part-{i}", part)
+        stored = [read_accumulator(fid, f"part-{i}") for i in range(3)]
+
+    full = residual_kernel(residual).summary()
+    for accumulators in [parts, pickled, stored]:
+        merged = merge_accumulators(accumulators)
+        result = merged.summary()
+
+        assert merged.count == residual.size
+        assert result["min_residual"] == full["min_residual"]
+        assert result["max_residual"] == full["max_residual"]
+        assert result["mean_residual"] == pytest.approx(full["mean_residual"])
+        assert result["kurtosis"] == pytest.approx(full["kurtosis"])
+
+    assert merge_accumulators(stored).to_dict().keys() == parts[0].to_dict().keys()
+
+
+def test_sparse_histogram():
+    """Test that only the occupied bins are serialised, in the smallest type."""
+    hist = IntegerHistogram()
+    hist.update(numpy.array([-30000, 0, 0, 30000], dtype="int16"))
+    data = hist.to_dict()
+
+    assert data["index"].tolist() == [0, 30000, 60000]
+    assert data["index"].dtype == numpy.uint16
+    assert data["counts"].dtype == numpy.uint8
+
+    restored = pickle.loads(pickle.dumps(hist))
+    assert restored.offset == hist.offset
+    numpy.testing.assert_array_equal(restored.counts, hist.counts)
+
+
+@pytest.mark.parametrize(
+    "ref_dtype, test_dtype, expected",
+    [
+        ("uint8", "uint8", "int16"),
+        ("int8", "int8", "int16"),
+        ("int16", "int16", "int32"),
+        ("uint16", "int16", "int32"),
+        ("int32", "int32", "int64"),
+        ("float32", "float32", "float32"),
+        ("int16", "float32", "float32"),
+    ],
+)
+def test_residual_dtype(ref_dtype, test_dtype, expected):
+    """Test the narrowest residual datatype that can't overflow."""
+    assert residual_dtype(ref_dtype, test_dtype) == numpy.dtype(expected)
+
+
+def test_residual_wraparound():
+    """Test that unsigned residuals don't wrap around."""
+    ref = numpy.array([0, 10, 255], dtype="uint8")
+    test = numpy.array([255, 5, 0], dtype="uint8")
+
+    result = residual(ref, test)
+
+    assert result.dtype == numpy.int16
+    assert result.tolist() == [-255, 5, 255]
+
+
+def test_quantile_sketch():
+    """Test the sketch quantiles are within the relative accuracy, and merge exactly."""
+    values = numpy.abs(numpy.random.default_rng(5).standard_cauchy(20000))
+    values[:500] = 0
+    sorted_values = numpy.sort(values)
+    percentiles = [0.01, 0.5, 0.9, 0.99]
+    ranks = numpy.ceil(numpy.multiply(percentiles, values.size)).astype(int) - 1
+
+    sketches = []
+    for chunk in numpy.array_split(values, 4):
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        sketch.update(chunk)
+        sketches.append(sketch)
+
+    merged = QuantileSketch(relative_accuracy=0.01)
+    for sketch in sketches[::-1]:
+        merged.merge(sketch)
+
+    full = QuantileSketch(relative_accuracy=0.01)
+    full.update(values)
+
+    assert merged.count == values.size
+    assert merged.zero_count == 500
+    numpy.testing.assert_array_equal(merged.bins.counts, full.bins.counts)
+    assert merged.quantiles(percentiles) == pytest.approx(
+        sorted_values[ranks], rel=0.01
+    )
+
+    with pytest.raises(ValueError):
+        merged.merge(QuantileSketch(relative_accuracy=0.05))
+
+
+def test_quantile_sketch_bounded():
+    """Test the bins are bounded, retaining the accuracy of the upper quantiles."""
+    values = numpy.geomspace(1e-20, 1e20, 10000)
+    sketch = QuantileSketch(max_bins=100)
+    sketch.update(values)
+
+    assert sketch.bins.counts.size == 100
+    assert sketch.count == values.size
+    assert sketch.quantiles([0.99])[0] == pytest.approx(values[9899], rel=0.005)
+
+
+def test_quantile_sketch_non_finite():
+    """Test that NaN and inf values are counted separately from the quantiles."""
+    values = numpy.array([1.0, numpy.nan, 2.0, numpy.inf, 0.0], dtype="float32")
+    sketch = QuantileSketch()
+    sketch.update(values)
+    sketch.add(numpy.inf, 2)
+
+    assert sketch.count == 3
+    assert sketch.zero_count == 1
+    assert sketch.non_finite == 4
+    assert sketch.quantiles([0.99])[0] == pytest.approx(2.0, rel=0.005)
+
+    restored = QuantileSketch.from_dict(sketch.to_dict())
+    restored.merge(sketch)
+    assert restored.non_finite == 8
+
+
+def test_stack_kernel_chunks():
+    """Test that the chunked stack kernel matches the per band kernel."""
+    rng = numpy.random.default_rng(5)
+    bands = [rng.integers(-50, 50, size) for size in (1000, 0, 2500)]
+    band_counts = numpy.array([band.size for band in bands])
+
+    accumulators = stack_kernel(numpy.concatenate(bands), band_counts, chunk_size=300)
+
+    for band, accumulator in zip(bands, accumulators):
+        expected = residual_kernel(band).summary()
+        summary = accumulator.summary()
+        assert accumulator.count == band.size
+        for key, value in expected.items():
+            assert summary[key] == pytest.approx(value, nan_ok=True)
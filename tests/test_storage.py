@@ -0,0 +1,127 @@
+import functools
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy
+import pytest
+from rasterio.windows import Window
+
+from gost.data_model import Measurement
+from gost.odc_documents import load_odc_metadata
+from gost.storage import HTTP_STORAGE, HTTPStorage, location, parent
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Serves files from a directory, honouring single byte range requests."""
+
+    def do_GET(self):
+        header = self.headers.get("Range")
+        if header is None:
+            return super().do_GET()
+
+        with open(self.translate_path(self.path), "rb") as src:
+            data = src.read()
+
+        start, end = header.replace("bytes=", "").split("-")
+        start, end = int(start), min(int(end), len(data) - 1)
+        body = data[start : end + 1]
+
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server(tmp_path):
+    """Serve tmp_path over HTTP; returns the base URL."""
+    handler = functools.partial(RangeRequestHandler, directory=str(tmp_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_location():
+    """Test joining and splitting local pathnames and URLs."""
+    url = location("http://example.com/data/", "band.tif")
+    assert url == "http://example.com/data/band.tif"
+    assert parent(url) == "http://example.com/data"
+    assert str(location("/data", "band.tif")) == "/data/band.tif"
+
+
+def test_http_range_reads(tmp_path, http_server):
+    """Test that only the blocks spanning a range are fetched, and then cached."""
+    data = numpy.arange(10000, dtype="uint8").tobytes()
+    tmp_path.joinpath("blob.bin").write_bytes(data)
+    url = f"{http_server}/blob.bin"
+    storage = HTTPStorage(block_size=1024, cache_blocks=4)
+
+    assert storage.exists(url)
+    assert not storage.exists(f"{http_server}/missing.bin")
+    assert storage.size(url) == len(data)
+
+    assert storage.read_range(url, 1000, 100) == data[1000:1100]
+    assert (storage.hits, storage.misses) == (0, 2)
+
+    with storage.open(url) as src:
+        src.seek(1010)
+        assert src.read(50) == data[1010:1060]
+        src.seek(-10, 2)
+        assert src.read() == data[-10:]
+
+    assert (storage.hits, storage.misses) == (2, 3)
+    assert storage.read(url) == data
+
+
+def test_remote_measurement_read(tmp_path, http_server, geotiff_measurement):
+    """Test reading a tile of a remote tiled GeoTIFF without fetching the file."""
+    data = numpy.random.default_rng(0).integers(0, 10000, (1024, 1024), dtype="int16")
+    local = geotiff_measurement(
+        "band.tif", data, -999, tiled=True, blockxsize=256, blockysize=256
+    )
+    remote = Measurement(
+        path="band.tif",
+        parent_dir=http_server,
+        file_format="GeoTIFF",
+        transform=local.transform,
+        shape=local.shape,
+    )
+    assert remote.pathname() == f"{http_server}/band.tif"
+    assert remote.exists()
+
+    misses = HTTP_STORAGE.misses
+    remote.open()
+    window = Window(256, 512, 256, 256)
+    numpy.testing.assert_array_equal(remote.read(window), data[512:768, 256:512])
+    remote.close()
+
+    # the header and a single tile, rather than the whole 2MiB file
+    fetched = (HTTP_STORAGE.misses - misses) * HTTP_STORAGE.block_size
+    assert fetched < tmp_path.joinpath("band.tif").stat().st_size
+
+
+def test_remote_document(odc_granule_pair, http_server):
+    """Test loading an ODC document, and its measurements, over HTTP."""
+    reference_pathname, _ = odc_granule_pair
+    url = f"{http_server}/reference/{reference_pathname.name}"
+
+    granule = load_odc_metadata(url)
+    measurement = granule.measurements["nbar_blue"]
+    assert str(measurement.pathname()).startswith(f"{http_server}/reference/")
+    assert measurement.exists()
+
+    local = load_odc_metadata(reference_pathname).measurements["nbar_blue"]
+    measurement.open()
+    local.open()
+    numpy.testing.assert_array_equal(measurement.read(), local.read())
+    measurement.close()
+    local.close()
@@ -0,0 +1,94 @@
+import numpy
+import pytest
+import rasterio
+
+from gost.tiles import TileCache, evaluate_tiles
+from gost.utils import evaluate_blocks
+
+TILED = {"tiled": True, "blockxsize": 32, "blockysize": 32, "compress": "deflate"}
+
+
+@pytest.mark.parametrize("dtype, nodata", [("int16", -999), ("float32", numpy.nan)])
+def test_evaluate_tiles(geotiff_measurement, dtype, nodata):
+    """Test that only changed tiles are decoded, with the same results."""
+    rng = numpy.random.default_rng(1)
+    data = rng.integers(0, 1000, (96, 64)).astype(dtype)
+    data[:40] = nodata
+    data2 = data.copy()
+    data2[70:75, 40:50] += 3
+    data2[80, 0] = nodata
+
+    ref = geotiff_measurement("reference.tif", data, nodata, **TILED)
+    test = geotiff_measurement("test.tif", data2, nodata, **TILED)
+    ref.open()
+    test.open()
+
+    cache = TileCache()
+    null_info, residuals = evaluate_tiles(ref, test, cache)
+    null_info2, residuals2 = evaluate_blocks(ref, test)
+
+    assert null_info == null_info2
+    assert residuals.count == residuals2.count
+    summary = residuals.summary()
+    for key, value in residuals2.summary().items():
+        assert summary[key] == pytest.approx(value, nan_ok=True)
+
+    # 4 of the 6 tiles are identical, and the 2 entirely null tiles share a count
+    assert cache.misses == 3
+    assert cache.hits == 1
+
+    ref.close()
+    test.close()
+
+
+def test_evaluate_tiles_incompatible(geotiff_measurement):
+    """Test that a different tiling can't be compared by tile."""
+    data = numpy.zeros((64, 64), dtype="int16")
+    ref = geotiff_measurement("reference.tif", data, -999, **TILED)
+    test = geotiff_measurement("test.tif", data, -999, compress="deflate")
+    ref.open()
+    test.open()
+
+    assert evaluate_tiles(ref, test) is None
+
+    ref.close()
+    test.close()
+
+
+def test_evaluate_tiles_edge(geotiff_measurement):
+    """Test that clipped edge tiles don't share the counts of interior tiles."""
+    data = numpy.zeros((40, 40), dtype="int16")
+    ref = geotiff_measurement("reference.tif", data, -999, **TILED)
+    test = geotiff_measurement("test.tif", data, -999, **TILED)
+    ref.open()
+    test.open()
+
+    cache = TileCache()
+    _, residuals = evaluate_tiles(ref, test, cache)
+    _, residuals2 = evaluate_blocks(ref, test)
+
+    assert residuals.count == residuals2.count == 40 * 40
+    assert cache.misses == 4
+
+    ref.close()
+    test.close()
+
+
+def test_evaluate_tiles_mask_band(geotiff_measurement, tmp_path):
+    """Test that measurements with a mask band aren't compared by tile."""
+    data = numpy.ones((64, 64), dtype="int16")
+    mask = numpy.ones((64, 64), dtype="bool")
+    mask[:8] = False
+
+    ref = geotiff_measurement("reference.tif", data, None, **TILED)
+    test = geotiff_measurement("test.tif", data, None, **TILED)
+    with rasterio.open(tmp_path.joinpath("test.tif"), "r+") as dst:
+        dst.write_mask(mask)
+
+    ref.open()
+    test.open()
+
+    assert evaluate_tiles(ref, test) is None
+
+    ref.close()
+    test.close()
@@ -1,7 +1,11 @@
 import numpy
+import pytest
 import structlog
 
-from gost.utils import evaluate, evaluate_themes, evaluate_nulls, FmaskThemes
+from gost.stats import residual_kernel
+from gost.utils import evaluate, evaluate_blocks, evaluate_themes, evaluate_nulls
+from gost.utils import evaluate_stack
+from gost.utils import FmaskThemes, lonlat_window
 from gost.data_model import Measurement
 
 _LOG = structlog.get_logger("fmask")
@@ -135,3 +139,117 @@ def test_evaluate_reflectance_change(
     """Test that the two measurements have all different values."""
     result = evaluate(ref_reflectance_measurement, test_reflectance_measurement3)
     assert numpy.count_nonzero(result) == 8
+
+
+def test_evaluate_blocks(geotiff_measurement):
+    """Test that the block-streaming evaluation agrees with the in-memory one."""
+    data = numpy.arange(128 * 96, dtype="int16").reshape(128, 96)
+    data2 = data.copy()
+    data2[::3] += 2
+    data2[:16, :16] = -999
+    data[-16:] = -999
+
+    kwargs = {"tiled": True, "blockxsize": 32, "blockysize": 32}
+    ref_measurement = geotiff_measurement("ref.tif", data, -999, **kwargs)
+    test_measurement = geotiff_measurement("test.tif", data2, -999, **kwargs)
+    ref_measurement.open()
+    test_measurement.open()
+
+    null_info, residuals = evaluate_blocks(ref_measurement, test_measurement)
+    diff = evaluate(ref_measurement, test_measurement)
+
+    assert null_info == evaluate_nulls(ref_measurement, test_measurement)
+    assert residuals.count == diff.size
+    assert residuals.n_nonzero == numpy.count_nonzero(diff)
+    assert residuals.minv == diff.min()
+    assert residuals.maxv == diff.max()
+
+
+def test_evaluate_blocks_single_read(geotiff_measurement, monkeypatch):
+    """Test that each block is only read once from each measurement."""
+    data = numpy.arange(64 * 64, dtype="int16").reshape(64, 64)
+    kwargs = {"tiled": True, "blockxsize": 32, "blockysize": 32}
+    ref_measurement = geotiff_measurement("ref.tif", data, -999, **kwargs)
+    test_measurement = geotiff_measurement("test.tif", data, 0, **kwargs)
+
+    reads = []
+    read = Measurement.read
+
+    def _read(measurement, window=None):
+        reads.append(measurement.path)
+        return read(measurement, window)
+
+    monkeypatch.setattr(Measurement, "read", _read)
+
+    ref_measurement.open()
+    test_measurement.open()
+
+    null_info, residuals = evaluate_blocks(ref_measurement, test_measurement)
+
+    assert residuals.count == 64 * 64 - 1
+    assert reads.count("ref.tif") == reads.count("test.tif") == 4
+
+
+def test_evaluate_themes_streaming(geotiff_measurement):
+    """Test that a block-streaming thematic evaluation gives the same results."""
+    rng = numpy.random.default_rng(3)
+    data = rng.integers(0, 6, (80, 72)).astype("uint8")
+    data2 = data.copy()
+    data2[::5] = 4
+
+    kwargs = {"tiled": True, "blockxsize": 32, "blockysize": 32}
+    ref_measurement = geotiff_measurement("ref.tif", data, 0, **kwargs)
+    test_measurement = geotiff_measurement("test.tif", data2, 0, **kwargs)
+    ref_measurement.open()
+    test_measurement.open()
+
+    # streamed first, so the blocks are read rather than sliced from the buffer
+    result2 = evaluate_themes(
+        ref_measurement, test_measurement, FmaskThemes, True, streaming=True
+    )
+    result = evaluate_themes(ref_measurement, test_measurement, FmaskThemes, True)
+
+    assert result2 == pytest.approx(result)
+
+    ref_measurement.close()
+    test_measurement.close()
+
+
+def test_lonlat_window_outside(geotiff_measurement):
+    """Test that a bounding box away from the measurement has no window."""
+    data = numpy.zeros((8, 8), dtype="int16")
+    measurement = geotiff_measurement("band.tif", data, -999)
+
+    assert lonlat_window((0.0, 0.0, 1.0, 1.0), "EPSG:32755", measurement) is None
+
+
+def test_evaluate_stack(geotiff_measurement):
+    """Test that a stack of bands evaluates as each band would individually."""
+    rng = numpy.random.default_rng(1)
+    ref_data = rng.integers(-999, 10000, (3, 40, 30)).astype("int16")
+    test_data = ref_data + rng.integers(-5, 6, (3, 40, 30)).astype("int16")
+    ref_data[:, :3] = -999
+    test_data[:, -2:] = 0
+
+    references = [geotiff_measurement(f"ref{i}.tif", ref_data[i], -999) for i in range(3)]
+    tests = [geotiff_measurement(f"test{i}.tif", test_data[i], 0) for i in range(3)]
+
+    individual = []
+    for reference, test in zip(references, tests):
+        reference.open()
+        test.open()
+        null_info = evaluate_nulls(reference, test)
+        summary = residual_kernel(evaluate(reference, test)).summary()
+        individual.append((null_info, summary))
+        reference.close()
+        test.close()
+
+    for measurement in references + tests:
+        measurement.open()
+
+    stacked = evaluate_stack(references, tests)
+
+    for (null_info, summary), (null_info2, residuals) in zip(individual, stacked):
+        assert null_info == null_info2
+        assert residuals.summary() == pytest.approx(summary, nan_ok=True)
+    assert all(measurement.closed for measurement in references + tests)